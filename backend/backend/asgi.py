@@ -3,6 +3,17 @@ ASGI config for backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serving through this module turns on settings.ASYNC_VIEWS (unless
+DJANGO_ASYNC_VIEWS is set otherwise): historical_data and fetch_data are then
+answered by async views that await the market data provider, so one worker
+keeps serving other requests while upstream calls are slow. Other endpoints
+are unchanged and run on the worker's thread for sync code. Run it with, e.g.
+
+    gunicorn backend.asgi:application -k uvicorn.workers.UvicornWorker -w 4
+
+``python manage.py load_test`` compares both modes against a slow offline
+provider.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
@@ -12,5 +23,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+os.environ.setdefault('DJANGO_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
@@ -0,0 +1,11 @@
+# backend/backend/async_urls.py
+from django.urls import path, include
+
+from stock_app.urls import async_urlpatterns
+
+# ROOT_URLCONF of ASGI deployments (settings.ASYNC_VIEWS): the async stock
+# actions take over their paths, everything else is routed as in backend.urls
+urlpatterns = [
+    path('api/', include(async_urlpatterns)),
+    path('', include('backend.urls')),
+]
\ No newline at end of file
@@ -47,6 +47,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'stock_app.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -56,7 +57,11 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'backend.urls'
+# Set by backend/asgi.py: under ASGI, historical_data and fetch_data are
+# served by async views that await the market data provider
+ASYNC_VIEWS = os.environ.get('DJANGO_ASYNC_VIEWS') == '1'
+
+ROOT_URLCONF = 'backend.async_urls' if ASYNC_VIEWS else 'backend.urls'
 
 TEMPLATES = [
     {
@@ -134,7 +139,7 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
-EST_FRAMEWORK = {
+REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
@@ -152,6 +157,91 @@ CORS_ALLOWED_ORIGINS = [
     "http://127.0.0.1:3000",
 ]
 
+# Cache used for market data (history cache, hit/miss counters). Point this at a
+# shared backend such as Redis or Memcached to share it between workers.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Shared by every worker; see MARKET_DATA_LEASE_CACHE
+    'market_data': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'market_data_cache',
+    },
+}
+
+# Market data settings
+MARKET_DATA_PROVIDER = 'stock_app.providers.YahooFinanceProvider'
+MARKET_DATA_MAX_WORKERS = 8      # Concurrent upstream fetches per batch
+MARKET_DATA_TIMEOUT = 20         # Seconds allowed per symbol
+MARKET_DATA_RATE_LIMIT = 5       # Upstream calls per second, 0 to disable
+FETCH_BATCH_MAX_SYMBOLS = 200
+MARKET_DATA_REFRESH_INTERVAL = 300   # Seconds between refresh_market_data cycles
+MARKET_DATA_UNTRACKED_EVERY = 6      # Cycles between refreshes of stocks nobody tracks
+MARKET_DATA_REFRESH_BATCH = 500      # Most symbols fetched per cycle
+MARKET_DATA_BACKOFF_BASE = 60        # Seconds a symbol is skipped after its first failure, doubling
+MARKET_DATA_BACKOFF_MAX = 3600
+# Concurrent identical provider calls share one fetch, coordinated across
+# workers through leases in this cache; the default 'market_data' database
+# cache needs manage.py createcachetable. 'default' (LocMem) only
+# coordinates the threads of one process
+MARKET_DATA_LEASE_CACHE = os.environ.get('MARKET_DATA_LEASE_CACHE', 'market_data')
+MARKET_DATA_LEASE_SECONDS = 30       # Longest wait on another worker's fetch
+# Provider results, DataFrames included, stay out of the lease cache: they
+# are kept here and served while the circuit breaker is open
+MARKET_DATA_RESULT_CACHE = os.environ.get('MARKET_DATA_RESULT_CACHE', 'default')
+MARKET_DATA_STALE_SECONDS = 86400
+# Where the history cache remembers how far back each stock's provider
+# history goes and when its tail was last fetched. Like the lease cache it
+# should be shared by every worker: the default 'market_data' database cache
+# needs manage.py createcachetable, while 'default' (LocMem) keeps one copy
+# per process, each of which fetches the tail again once a day
+MARKET_DATA_COVERAGE_CACHE = os.environ.get('MARKET_DATA_COVERAGE_CACHE', 'market_data')
+MARKET_DATA_BREAKER_WINDOW = 60      # Seconds over which the upstream error rate is measured
+MARKET_DATA_BREAKER_MIN_CALLS = 20   # Calls in a window before the breaker may open
+MARKET_DATA_BREAKER_ERROR_RATE = 0.5
+MARKET_DATA_BREAKER_COOLDOWN = 30    # Seconds the breaker stays open before a probe call
+# Options of stock_app.providers.ReplayProvider, the offline provider for
+# benchmarks and load tests (fixture directory, latency, error injection)
+MARKET_DATA_REPLAY = {
+    'path': os.path.join(BASE_DIR, 'replay'),
+    'latency': 0.0,
+    'error_rate': 0.0,
+}
+
+# Date x symbol matrices of closes and volumes for cross-sectional reads
+# (see stock_app.price_matrix); built by manage.py build_price_matrix
+PRICE_MATRIX_DIR = os.environ.get('PRICE_MATRIX_DIR', os.path.join(BASE_DIR, 'price_matrix'))
+PRICE_MATRIX_MAX_SYMBOLS = 500       # Most symbols per /api/stocks/matrix/ request
+INDICATORS_MAX_LIMIT = 2520          # Most bars per /api/stocks/<id>/indicators/?limit= request
+
+# Cache alias keeping rendered responses of the ETag-versioned read endpoints
+# (stocks, stock prices, historical_data) by ETag; unset to only answer 304s
+RESPONSE_CACHE = os.environ.get('RESPONSE_CACHE') or None
+RESPONSE_CACHE_SECONDS = 3600        # Entries of superseded versions expire unused
+
+# Request metrics served at /api/metrics/ (see stock_app.middleware), to
+# staff users and to scrapers sending METRICS_TOKEN as a bearer token
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+# Directory where every worker process writes its totals, so a scrape of any
+# one of them reports all (see stock_app.metrics). Set it when running
+# several workers, and empty it when they are restarted; unset, each worker
+# reports its own, which Prometheus rate() can't combine
+METRICS_DIR = os.environ.get('METRICS_DIR') or None
+METRICS_WRITE_SECONDS = 1            # Longest a worker's totals go unwritten while it serves requests
+SLOW_REQUEST_MS = 1000               # Log slower requests with their repeated SQL, None to disable
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'stock_app.slow_requests': {'handlers': ['console'], 'level': 'WARNING'},
+    },
+}
+
 # Add additional settings for production environment
 if not DEBUG:
     # Security settings for production
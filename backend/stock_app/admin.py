@@ -1,6 +1,6 @@
 # backend/stock_app/admin.py
 from django.contrib import admin
-from .models import Stock, StockPrice, UserPortfolio, PortfolioStock, WatchList, StockAnalysis, Alert
+from .models import Stock, StockPrice, StockStats, PriceArchive, UserPortfolio, PortfolioStock, WatchList, StockAnalysis, Alert
 
 @admin.register(Stock)
 class StockAdmin(admin.ModelAdmin):
@@ -16,6 +16,20 @@ class StockPriceAdmin(admin.ModelAdmin):
     date_hierarchy = 'date'
     ordering = ('-date',)
 
+@admin.register(StockStats)
+class StockStatsAdmin(admin.ModelAdmin):
+    list_display = ('stock', 'latest_date', 'latest_close', 'return_1d', 'return_1m', 'high_52w', 'low_52w')
+    search_fields = ('stock__symbol',)
+    ordering = ('stock__symbol',)
+
+@admin.register(PriceArchive)
+class PriceArchiveAdmin(admin.ModelAdmin):
+    list_display = ('stock', 'year', 'rows', 'updated_at')
+    search_fields = ('stock__symbol',)
+    # The packed data is maintained by archive.refresh_archive()
+    exclude = ('data',)
+    readonly_fields = ('stock', 'year', 'rows', 'checksum', 'updated_at')
+
 class PortfolioStockInline(admin.TabularInline):
     model = PortfolioStock
     extra = 1
@@ -0,0 +1,230 @@
+# backend/stock_app/alert_index.py
+from bisect import bisect_left, bisect_right, insort
+import math
+import threading
+import uuid
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Alert, ResourceVersion
+
+THRESHOLD_TYPES = ('price_above', 'price_below')
+
+# ResourceVersion rows replaced by alert writes, in the writing transaction:
+# 'alerts' by every write, so an unchanged index costs one lookup, and
+# 'alerts:<stock id>' for the stocks written, so other processes reload
+# just those stocks
+VERSION_KEY = 'alerts'
+STOCK_KEY_PREFIX = 'alerts:'
+
+def _stored_version():
+    return ResourceVersion.objects.filter(pk=VERSION_KEY).values_list('version', flat=True).first() or '0'
+
+def _stored_stock_versions():
+    rows = ResourceVersion.objects.filter(key__startswith=STOCK_KEY_PREFIX).values_list('key', 'version')
+    return {int(key[len(STOCK_KEY_PREFIX):]): version for key, version in rows}
+
+def _advance(key, known):
+    """
+    Give `key` a new version. Returns it if the stored one was still `known`,
+    so nobody else wrote in between, else None.
+    """
+    version = uuid.uuid4().hex
+    if known is not None and ResourceVersion.objects.filter(pk=key, version=known).update(
+            version=version, updated_at=timezone.now()):
+        return version
+    _replace([key])
+    return None
+
+def _replace(keys):
+    now = timezone.now()
+    ResourceVersion.objects.bulk_create(
+        [ResourceVersion(key=key, version=uuid.uuid4().hex, updated_at=now) for key in keys],
+        update_conflicts=True,
+        unique_fields=['key'],
+        update_fields=['version', 'updated_at'],
+    )
+
+def index_entry(alert):
+    """
+    The (stock_id, alert_type, threshold) an alert is indexed under, or None
+    if it isn't an active, untriggered threshold alert.
+    """
+    if not alert.is_active or alert.triggered or alert.alert_type not in THRESHOLD_TYPES:
+        return None
+    return (alert.stock_id, alert.alert_type, float(alert.value))
+
+class AlertThresholdIndex:
+    """
+    In-memory index of active, untriggered price_above/price_below alerts.
+    
+    Each stock keeps two sorted lists of (threshold, alert id) pairs, so the
+    alerts crossed by a price are found with one binary search per list, in
+    O(log n + k). The index loads itself from the database on first use.
+    
+    Writes go through invalidate(): the Alert signals pass the saved or
+    deleted alert, which the writing process applies in place once the
+    transaction commits, and AlertQuerySet's update(), bulk_create() and
+    bulk_update() pass the stocks they touched. refresh() reloads the stocks
+    written by other processes (or in bulk) since. Raw SQL writers must call
+    invalidate() themselves.
+    """
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._above = {}
+        self._below = {}
+        self._entries = {}
+        self._version = None
+        self._stock_versions = {}
+    
+    def _lists(self, alert_type):
+        return self._above if alert_type == 'price_above' else self._below
+    
+    def _add(self, alert_id, stock_id, alert_type, value):
+        self._remove(alert_id)
+        insort(self._lists(alert_type).setdefault(stock_id, []), (value, alert_id))
+        self._entries[alert_id] = (stock_id, alert_type, value)
+    
+    def _remove(self, alert_id):
+        entry = self._entries.pop(alert_id, None)
+        if entry is None:
+            return
+        stock_id, alert_type, value = entry
+        thresholds = self._lists(alert_type)[stock_id]
+        del thresholds[bisect_left(thresholds, (value, alert_id))]
+        if not thresholds:
+            del self._lists(alert_type)[stock_id]
+    
+    def _load(self, stock_ids=None):
+        # Replace the alerts of the given stocks (all if None) with the stored ones
+        rows = Alert.objects.filter(is_active=True, triggered=False, alert_type__in=THRESHOLD_TYPES)
+        if stock_ids is None:
+            self._above, self._below, self._entries = {}, {}, {}
+        else:
+            rows = rows.filter(stock_id__in=stock_ids)
+            for lists in (self._above, self._below):
+                for stock_id in stock_ids:
+                    for _, alert_id in lists.pop(stock_id, []):
+                        del self._entries[alert_id]
+        for alert_id, stock_id, alert_type, value in rows.values_list('pk', 'stock_id', 'alert_type', 'value'):
+            self._add(alert_id, stock_id, alert_type, float(value))
+    
+    def _ensure_loaded(self):
+        if self._version is None:
+            self.rebuild()
+    
+    def invalidate(self, stock_ids, changes=None):
+        """
+        Record a write of the given stocks' alerts. Call it in the transaction
+        that writes them; other processes reload those stocks on their next
+        refresh(). `changes` lists the written alerts as (alert id, index_entry())
+        pairs; this process applies them once the transaction commits, and
+        without them reloads the stocks on its next refresh() too.
+        """
+        stock_ids = set(stock_ids)
+        with self._lock:
+            # The stock an alert was indexed under before the write
+            stock_ids.update(self._entries[alert_id][0] for alert_id, _ in changes or () if alert_id in self._entries)
+            version = self._version
+            known = {stock_id: self._stock_versions.get(stock_id) for stock_id in stock_ids}
+        
+        if changes is None:
+            _replace([f'{STOCK_KEY_PREFIX}{stock_id}' for stock_id in stock_ids])
+            written = dict.fromkeys(stock_ids)
+        else:
+            written = {stock_id: _advance(f'{STOCK_KEY_PREFIX}{stock_id}', known[stock_id]) for stock_id in stock_ids}
+        advanced = _advance(VERSION_KEY, version)
+        transaction.on_commit(lambda: self._written(version, advanced, written, changes))
+    
+    def _written(self, version, advanced, written, changes):
+        with self._lock:
+            if self._version is None:
+                return
+            for alert_id, entry in changes or ():
+                if entry is None:
+                    self._remove(alert_id)
+                else:
+                    self._add(alert_id, *entry)
+            for stock_id, stock_version in written.items():
+                # Unknown versions make refresh() reload the stock
+                self._stock_versions[stock_id] = stock_version
+            if advanced is not None and self._version == version and None not in written.values():
+                self._version = advanced
+    
+    def refresh(self):
+        """
+        Reload the stocks whose alerts other processes have written since
+        the index was loaded. One primary key lookup when there are none.
+        """
+        with self._lock:
+            if self._version is None:
+                self.rebuild()
+                return
+            # Read the versions first: a write in between makes the next refresh look again
+            version = _stored_version()
+            if version == self._version:
+                return
+            stored = _stored_stock_versions()
+            changed = [stock_id for stock_id in set(stored) | set(self._stock_versions)
+                       if stored.get(stock_id) != self._stock_versions.get(stock_id)]
+            if changed:
+                self._load(changed)
+            self._version, self._stock_versions = version, stored
+    
+    def rebuild(self):
+        """
+        Reload the index from the database.
+        """
+        with self._lock:
+            version, stored = _stored_version(), _stored_stock_versions()
+            self._load()
+            self._version, self._stock_versions = version, stored
+    
+    def discard(self, alert_ids):
+        """
+        Remove alerts that evaluate_alerts() has just triggered, and record
+        the write for other processes.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            changes = [(alert_id, None) for alert_id in alert_ids]
+            stock_ids = {self._entries[alert_id][0] for alert_id in alert_ids if alert_id in self._entries}
+            self.invalidate(stock_ids, changes)
+            for alert_id in alert_ids:
+                self._remove(alert_id)
+    
+    def crossed(self, stock_id, price):
+        """
+        Ids of the stock's price_above alerts below `price` and price_below
+        alerts above it.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            above = self._above.get(stock_id, [])
+            below = self._below.get(stock_id, [])
+            return ([alert_id for _, alert_id in above[:bisect_left(above, (price,))]]
+                    + [alert_id for _, alert_id in below[bisect_right(below, (price, math.inf)):]])
+    
+    def stock_ids(self):
+        """
+        Stocks with at least one indexed alert.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            return set(self._above) | set(self._below)
+    
+    def count(self, stock_ids=None):
+        """
+        Number of indexed alerts, optionally only for the given stocks.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            if stock_ids is None:
+                return len(self._entries)
+            stock_ids = set(stock_ids)
+            return sum(len(thresholds)
+                       for lists in (self._above, self._below)
+                       for stock_id, thresholds in lists.items() if stock_id in stock_ids)
+
+alert_index = AlertThresholdIndex()
\ No newline at end of file
@@ -0,0 +1,133 @@
+# backend/stock_app/alerts.py
+from collections import defaultdict, namedtuple
+
+from django.db.models import QuerySet
+from django.utils import timezone
+
+from .alert_index import alert_index, THRESHOLD_TYPES
+from .models import Stock, Alert
+from .stats import refresh_stats
+
+# Keeps IN (...) lists well under the bound parameter limits of every backend
+CHUNK_SIZE = 500
+
+MarketState = namedtuple('MarketState', ['price', 'volume', 'previous_close', 'average_volume'])
+
+AlertEvaluation = namedtuple('AlertEvaluation', ['checked', 'triggered'])
+
+def _chunks(items, size=CHUNK_SIZE):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def load_market_state(stock_ids):
+    """
+    Load what alert evaluation needs for many stocks from the precomputed
+    StockStats, in one query per chunk of stocks: the current price, the
+    latest bar's volume, the previous close and the average volume of the
+    bars before the latest one. Stats missing for a stock are built on the
+    spot. Returns {stock_id: MarketState}.
+    """
+    states = {}
+    for chunk in _chunks(stock_ids):
+        rows = list(Stock.objects.filter(pk__in=chunk).values_list(
+            'pk', 'stats__pk', 'current_price', 'stats__latest_close', 'stats__latest_volume',
+            'stats__previous_close', 'stats__average_volume',
+        ))
+        missing = [row[0] for row in rows if row[1] is None]
+        if missing:
+            refresh_stats(missing)
+            rows = list(Stock.objects.filter(pk__in=chunk).values_list(
+                'pk', 'stats__pk', 'current_price', 'stats__latest_close', 'stats__latest_volume',
+                'stats__previous_close', 'stats__average_volume',
+            ))
+        
+        for stock_id, _, current_price, latest_close, volume, previous_close, average_volume in rows:
+            price = current_price if current_price is not None else latest_close
+            states[stock_id] = MarketState(
+                price=float(price) if price is not None else None,
+                volume=volume,
+                previous_close=float(previous_close) if previous_close is not None else None,
+                average_volume=average_volume,
+            )
+    
+    # Stocks that no longer exist
+    for stock_id in stock_ids:
+        states.setdefault(stock_id, MarketState(None, None, None, None))
+    return states
+
+def is_triggered(alert_type, value, state):
+    """
+    Whether an alert of the given type and threshold fires for a MarketState.
+    """
+    if state.price is None:
+        return False
+    
+    if alert_type == 'price_above':
+        return state.price > value
+    if alert_type == 'price_below':
+        return state.price < value
+    if alert_type == 'percent_change':
+        if not state.previous_close:
+            return False
+        percent_change = ((state.price - state.previous_close) / state.previous_close) * 100
+        return abs(percent_change) > value
+    if alert_type == 'volume_spike':
+        if not state.average_volume or state.volume is None:
+            return False
+        volume_increase = (state.volume / state.average_volume) * 100
+        return volume_increase > value
+    return False
+
+def evaluate_alerts(stock_ids=None, now=None):
+    """
+    Evaluate every active, untriggered alert (optionally only for the given
+    stocks) against the latest market state and mark the triggered ones with
+    bulk updates. Returns an AlertEvaluation with the number of alerts checked
+    and the ids of the alerts that were triggered.
+    
+    price_above/price_below alerts come from the in-memory threshold index,
+    refreshed first if any process has written alerts since it was loaded;
+    only percent_change and volume_spike alerts are read from the database.
+    """
+    alert_index.refresh()
+    alerts = Alert.objects.filter(is_active=True, triggered=False).exclude(alert_type__in=THRESHOLD_TYPES)
+    threshold_stocks = alert_index.stock_ids()
+    if stock_ids is not None:
+        stock_ids = set(stock_ids)
+        if not stock_ids:
+            return AlertEvaluation(0, [])
+        alerts = alerts.filter(stock_id__in=stock_ids)
+        threshold_stocks &= stock_ids
+    
+    by_stock = defaultdict(list)
+    for pk, stock_id, alert_type, value in alerts.values_list('pk', 'stock_id', 'alert_type', 'value'):
+        by_stock[stock_id].append((pk, alert_type, float(value)))
+    
+    checked = sum(len(stock_alerts) for stock_alerts in by_stock.values()) + alert_index.count(threshold_stocks)
+    if not checked:
+        return AlertEvaluation(0, [])
+    
+    states = load_market_state(set(by_stock) | threshold_stocks)
+    triggered = [
+        pk
+        for stock_id in threshold_stocks if states[stock_id].price is not None
+        for pk in alert_index.crossed(stock_id, states[stock_id].price)
+    ]
+    triggered += [
+        pk
+        for stock_id, stock_alerts in by_stock.items()
+        for pk, alert_type, value in stock_alerts
+        if is_triggered(alert_type, value, states[stock_id])
+    ]
+    
+    now = now or timezone.now()
+    for chunk in _chunks(triggered):
+        # Re-check the flags in case alerts changed since the refresh. The
+        # plain QuerySet.update() keeps the version; discard() advances it
+        QuerySet.update(Alert.objects.filter(pk__in=chunk, is_active=True, triggered=False),
+                        triggered=True, triggered_at=now, updated_at=now)
+    if triggered:
+        alert_index.discard(triggered)
+    
+    return AlertEvaluation(checked, triggered)
\ No newline at end of file
@@ -7,5 +7,14 @@ class StockAppConfig(AppConfig):
     verbose_name = 'Stock Market Analysis'
     
     def ready(self):
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_migrate
+        from .metrics import install_query_collector
+        from .search import create_search_index
+        
         # Import signal handlers
-        import stock_app.signals
\ No newline at end of file
+        import stock_app.signals
+        # Queries are charged to the request being served, see MetricsMiddleware
+        connection_created.connect(install_query_collector)
+        # The full-text index of analyses lives outside the ORM's tables
+        post_migrate.connect(create_search_index, sender=self)
\ No newline at end of file
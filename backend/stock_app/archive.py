@@ -0,0 +1,200 @@
+# backend/stock_app/archive.py
+from collections import defaultdict
+from datetime import date
+
+import numpy as np
+import pandas as pd
+from django.db import connection
+from django.db.models import CharField, Count, ExpressionWrapper, F, FloatField, Q, Sum
+from django.db.models.functions import Cast, ExtractYear, Round
+
+from .models import StockPrice, PriceArchive
+
+# Prices are packed as int64 cents; StockPrice stores two decimal places
+PRICE_SCALE = 100
+
+PRICE_FIELDS = ['open_price', 'high_price', 'low_price', 'close_price', 'adjusted_close']
+
+# Weights of the packed columns in the checksum, so values swapped between
+# columns still change it
+WEIGHTS = (3, 5, 7, 11, 13)
+
+# Stocks synced per batch of queries
+CHUNK_SIZE = 200
+
+# Layout of a packed year: int32 days since 1970-01-01, then one int64 array
+# per price column and one for volume, each `rows` long
+def pack(days, prices, volumes):
+    """
+    Pack n days, a 5 x n array of prices in cents and n volumes into bytes.
+    """
+    return b''.join([
+        np.ascontiguousarray(days, dtype='<i4').tobytes(),
+        np.ascontiguousarray(prices, dtype='<i8').tobytes(),
+        np.ascontiguousarray(volumes, dtype='<i8').tobytes(),
+    ])
+
+def unpack(data, rows):
+    """
+    Inverse of pack(): (days int32, 5 x n prices int64, volumes int64), as
+    read-only views over `data` without copying.
+    """
+    data = bytes(data)
+    days = np.frombuffer(data, dtype='<i4', count=rows)
+    prices = np.frombuffer(data, dtype='<i8', count=5 * rows, offset=4 * rows).reshape(5, rows)
+    volumes = np.frombuffer(data, dtype='<i8', count=rows, offset=44 * rows)
+    return days, prices, volumes
+
+def checksum(prices, volumes):
+    return int(np.dot(WEIGHTS, prices.sum(axis=1)) + volumes.sum())
+
+def _cents(field):
+    return Round(Cast(field, FloatField()) * PRICE_SCALE)
+
+def _source_checksums(stock_ids):
+    # {(stock_id, year): (rows, checksum)} computed by the database
+    weighted = ExpressionWrapper(
+        sum((_cents(field) * weight for field, weight in zip(PRICE_FIELDS, WEIGHTS)), F('volume')),
+        output_field=FloatField(),
+    )
+    rows = StockPrice.objects.filter(stock_id__in=stock_ids).order_by().annotate(
+        year=ExtractYear('date'),
+    ).values('stock_id', 'year').annotate(
+        rows=Count('pk'), checksum=Sum(weighted),
+    ).values_list('stock_id', 'year', 'rows', 'checksum')
+    return {(stock_id, year): (count, int(total)) for stock_id, year, count, total in rows}
+
+def _read_years(years_by_stock):
+    """
+    Bars of the given {stock_id: years} as {(stock_id, year): (days, prices, volumes)}.
+    """
+    condition = Q()
+    for stock_id, years in years_by_stock.items():
+        condition |= Q(stock_id=stock_id, date__gte=date(min(years), 1, 1), date__lte=date(max(years), 12, 31))
+    prices = StockPrice.objects.filter(condition).order_by('stock_id', 'date').annotate(
+        day=Cast('date', CharField()),
+        **{f'{field}_cents': _cents(field) for field in PRICE_FIELDS},
+    ).values_list('stock_id', 'day', *[f'{field}_cents' for field in PRICE_FIELDS], 'volume')
+    
+    # Plain cursor: no per-row converters for what can be hundreds of thousands of rows
+    sql, params = prices.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        names = [column[0] for column in cursor.description]
+        frame = pd.DataFrame(cursor.fetchall(), columns=names)
+    if frame.empty:
+        return {}
+    
+    days = frame['day'].to_numpy(dtype='datetime64[D]')
+    frame['days'] = days.astype('int64')
+    frame['year'] = days.astype('datetime64[Y]').astype(int) + 1970
+    
+    years = {}
+    price_columns = [f'{field}_cents' for field in PRICE_FIELDS]
+    for (stock_id, year), group in frame.groupby(['stock_id', 'year'], sort=False):
+        if year in years_by_stock[stock_id]:
+            years[stock_id, year] = (
+                group['days'].to_numpy(dtype='int32'),
+                np.rint(group[price_columns].to_numpy(dtype=float).T).astype('int64'),
+                group['volume'].to_numpy(dtype='int64'),
+            )
+    return years
+
+def refresh_archive(stock_ids):
+    """
+    Bring the PriceArchive years of the given stocks in line with StockPrice.
+    Years whose row count and checksum still match are left alone, so a
+    typical ingest repacks only the current year. Three queries per
+    CHUNK_SIZE stocks, plus the writes.
+    """
+    stock_ids = list(stock_ids)
+    for i in range(0, len(stock_ids), CHUNK_SIZE):
+        chunk = stock_ids[i:i + CHUNK_SIZE]
+        source = _source_checksums(chunk)
+        archived = {
+            (stock_id, year): (rows, total)
+            for stock_id, year, rows, total in PriceArchive.objects.filter(stock_id__in=chunk).values_list(
+                'stock_id', 'year', 'rows', 'checksum')
+        }
+        
+        stale = defaultdict(set)
+        for key, state in source.items():
+            if archived.get(key) != state:
+                stale[key[0]].add(key[1])
+        gone = [key for key in archived if key not in source]
+        
+        if stale:
+            archives = [
+                PriceArchive(stock_id=stock_id, year=year, rows=len(days),
+                             checksum=checksum(prices, volumes), data=pack(days, prices, volumes))
+                for (stock_id, year), (days, prices, volumes) in _read_years(stale).items()
+            ]
+            PriceArchive.objects.bulk_create(
+                archives,
+                update_conflicts=True,
+                unique_fields=['stock', 'year'],
+                update_fields=['rows', 'checksum', 'data', 'updated_at'],
+            )
+        if gone:
+            condition = Q()
+            for stock_id, year in gone:
+                condition |= Q(stock_id=stock_id, year=year)
+            PriceArchive.objects.filter(condition).delete()
+
+def archive_arrays(stock_ids, start=None, end=None, _archived=False):
+    """
+    Archived bars of the given stocks from `start` to `end` (inclusive) as
+    {stock_id: (dates datetime64[D], 5 x n prices in cents, volumes)}, in one
+    query. Stocks that have prices but no archive yet are archived first.
+    """
+    stock_ids = list(stock_ids)
+    archives = PriceArchive.objects.filter(stock_id__in=stock_ids)
+    if start is not None:
+        archives = archives.filter(year__gte=start.year)
+    if end is not None:
+        archives = archives.filter(year__lte=end.year)
+    rows = list(archives.order_by('stock_id', 'year').values_list('stock_id', 'rows', 'data'))
+    
+    missing = set(stock_ids) - {stock_id for stock_id, _, _ in rows}
+    if missing and not _archived:
+        # Stocks with prices from before the archive existed are archived on the spot
+        missing -= set(PriceArchive.objects.filter(stock_id__in=missing).values_list('stock_id', flat=True))
+        if missing and StockPrice.objects.filter(stock_id__in=missing).exists():
+            refresh_archive(missing)
+            return archive_arrays(stock_ids, start, end, _archived=True)
+    
+    parts = defaultdict(list)
+    for stock_id, count, data in rows:
+        parts[stock_id].append(unpack(data, count))
+    
+    result = {}
+    for stock_id, years in parts.items():
+        days = np.concatenate([year[0] for year in years]).astype('datetime64[D]')
+        prices = np.concatenate([year[1] for year in years], axis=1)
+        volumes = np.concatenate([year[2] for year in years])
+        # Years are sorted, so the range is two binary searches
+        first = np.searchsorted(days, np.datetime64(start, 'D')) if start is not None else 0
+        last = np.searchsorted(days, np.datetime64(end, 'D'), side='right') if end is not None else len(days)
+        result[stock_id] = (days[first:last], prices[:, first:last], volumes[first:last])
+    return result
+
+def stock_archive(stock_id, start=None, end=None):
+    """
+    archive_arrays() for a single stock; empty arrays if it has no bars in range.
+    """
+    empty = (np.array([], dtype='datetime64[D]'), np.empty((5, 0), dtype='int64'), np.array([], dtype='int64'))
+    return archive_arrays([stock_id], start, end).get(stock_id, empty)
+
+def archive_history(stock_id, start=None, end=None):
+    """
+    Archived daily bars of one stock shaped like history_cache.stored_history():
+    a DataFrame indexed by Date with float Open/High/Low/Close and Volume.
+    """
+    days, prices, volumes = stock_archive(stock_id, start, end)
+    return pd.DataFrame({
+        'Open': prices[0] / PRICE_SCALE,
+        'High': prices[1] / PRICE_SCALE,
+        'Low': prices[2] / PRICE_SCALE,
+        'Close': prices[3] / PRICE_SCALE,
+        'Volume': volumes,
+    }, index=pd.DatetimeIndex(days.astype('datetime64[ns]'), name='Date'))
\ No newline at end of file
@@ -0,0 +1,205 @@
+# backend/stock_app/benchmarks.py
+from contextlib import contextmanager
+import time
+
+import numpy as np
+import pandas as pd
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Stock, StockPrice, UserPortfolio, PortfolioStock, Alert
+from .signals import PRICE_CONSUMERS, defer_price_processing
+
+@contextmanager
+def isolated_database(verbosity=0):
+    """
+    Run the enclosed block against a throwaway test database so benchmarks
+    never touch the configured one.
+    """
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+
+def legacy_ingest(stock, hist):
+    """
+    The original per-row fetch_data loop, kept as a baseline for benchmarks.
+    """
+    for date, row in hist.iterrows():
+        StockPrice.objects.update_or_create(
+            stock=stock,
+            date=date.date(),
+            defaults={
+                'open_price': round(row['Open'], 2),
+                'high_price': round(row['High'], 2),
+                'low_price': round(row['Low'], 2),
+                'close_price': round(row['Close'], 2),
+                'adjusted_close': round(row['Close'], 2),
+                'volume': int(row['Volume'])
+            }
+        )
+    return len(hist)
+
+@contextmanager
+def price_consumers_disabled():
+    """
+    Run the enclosed block with an empty PRICE_CONSUMERS list, so saved
+    prices trigger no processing at all.
+    """
+    saved = list(PRICE_CONSUMERS)
+    PRICE_CONSUMERS.clear()
+    try:
+        yield
+    finally:
+        PRICE_CONSUMERS[:] = saved
+
+def baseline_ingest(stock, hist):
+    """
+    legacy_ingest() with the post-commit consumers disabled. In autocommit
+    every saved row would run the whole pipeline, whose cost grows with each
+    consumer added; the baseline measures the row writes alone and so stays
+    comparable between runs.
+    """
+    with price_consumers_disabled():
+        return legacy_ingest(stock, hist)
+
+def deferred_ingest(stock, hist):
+    """
+    legacy_ingest() inside defer_price_processing(), the way per-row loaders
+    should save: the pipeline runs once after the last row.
+    """
+    with defer_price_processing():
+        return legacy_ingest(stock, hist)
+
+class QueryCounter:
+    """
+    Database execute wrapper that counts queries without keeping their SQL.
+    """
+    def __init__(self):
+        self.count = 0
+    
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+def measure(func, *args, **kwargs):
+    """
+    Call func and return (result, elapsed seconds, number of queries run).
+    """
+    counter = QueryCounter()
+    with connection.execute_wrapper(counter):
+        started = time.perf_counter()
+        result = func(*args, **kwargs)
+        elapsed = time.perf_counter() - started
+    return result, elapsed, counter.count
+
+# Dataset sizes for generate_dataset(); 'full' is the production-like target
+SCALES = {
+    'small': {'stocks': 200, 'years': 2, 'portfolios': 500, 'alerts': 2_000},
+    'medium': {'stocks': 1_000, 'years': 5, 'portfolios': 5_000, 'alerts': 20_000},
+    'full': {'stocks': 5_000, 'years': 10, 'portfolios': 50_000, 'alerts': 200_000},
+}
+
+SECTORS = ['Technology', 'Healthcare', 'Financials', 'Energy', 'Industrials', 'Utilities']
+
+HOLDINGS_PER_PORTFOLIO = 10
+
+PORTFOLIOS_PER_USER = 5
+
+def _insert_prices(stock_ids, dates, rng):
+    # Straight executemany: millions of model instances would dominate the run
+    table = StockPrice._meta.db_table
+    sql = (f'INSERT INTO {table} (stock_id, date, open_price, high_price, low_price, '
+           f'close_price, adjusted_close, volume) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)')
+    days = [day.isoformat() for day in dates]
+    closes = {}
+    with connection.cursor() as cursor:
+        for stock_id in stock_ids:
+            close = np.round(rng.uniform(10, 500) * np.exp(np.cumsum(rng.normal(0, 0.015, len(days)))), 2)
+            open_ = np.round(close * (1 + rng.normal(0, 0.003, len(days))), 2)
+            high = np.round(np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.005, len(days)))), 2)
+            low = np.round(np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.005, len(days)))), 2)
+            volume = rng.integers(100_000, 10_000_000, len(days))
+            cursor.executemany(sql, zip(
+                [stock_id] * len(days), days, open_.tolist(), high.tolist(), low.tolist(),
+                close.tolist(), close.tolist(), volume.tolist(),
+            ))
+            closes[stock_id] = close[-1]
+    return closes
+
+def generate_dataset(stocks, years, portfolios, alerts, seed=0, today=None):
+    """
+    Fill the (throwaway) database with a synthetic market: `stocks` stocks
+    with `years` of daily bars up to today, `portfolios` portfolios of
+    HOLDINGS_PER_PORTFOLIO holdings spread over users, and `alerts` active
+    alerts with thresholds around the latest prices, most of them quiet.
+    Returns {'users': [user ids], 'stocks': [stock ids]}.
+    """
+    rng = np.random.default_rng(seed)
+    today = today or timezone.localdate()
+    dates = pd.bdate_range(end=today, periods=years * 252).date
+    
+    with transaction.atomic():
+        Stock.objects.bulk_create([
+            Stock(symbol=f'S{i:05d}', company_name=f'Synthetic {i} Corp', sector=SECTORS[i % len(SECTORS)],
+                  industry='Synthetic', market_cap=int(rng.integers(10**8, 10**12)))
+            for i in range(stocks)
+        ], batch_size=1000)
+        stock_ids = list(Stock.objects.order_by('pk').values_list('pk', flat=True))
+        closes = _insert_prices(stock_ids, dates, rng)
+        
+        users = max(portfolios // PORTFOLIOS_PER_USER, 1)
+        User.objects.bulk_create([User(username=f'bench{i}') for i in range(users)], batch_size=1000)
+        user_ids = list(User.objects.filter(username__startswith='bench').order_by('pk').values_list('pk', flat=True))
+        
+        UserPortfolio.objects.bulk_create([
+            UserPortfolio(user_id=user_ids[i % users], name=f'Portfolio {i}') for i in range(portfolios)
+        ], batch_size=1000)
+        portfolio_ids = list(UserPortfolio.objects.order_by('pk').values_list('pk', flat=True))
+        held = rng.integers(0, len(stock_ids), (len(portfolio_ids), HOLDINGS_PER_PORTFOLIO))
+        bought = rng.integers(0, len(dates), held.shape)
+        PortfolioStock.objects.bulk_create([
+            PortfolioStock(portfolio_id=portfolio_id, stock_id=stock_ids[stock], shares=int(rng.integers(1, 500)),
+                           purchase_price=round(float(closes[stock_ids[stock]]), 2), purchase_date=dates[day])
+            for portfolio_id, stocks_held, days in zip(portfolio_ids, held, bought)
+            for stock, day in zip(stocks_held, days)
+        ], batch_size=5000)
+        
+        types = [alert_type for alert_type, _ in Alert.ALERT_TYPES]
+        alert_stocks = rng.integers(0, len(stock_ids), alerts)
+        factors = rng.uniform(0.5, 1.5, alerts)
+        Alert.objects.bulk_create([
+            Alert(user_id=user_ids[i % users], stock_id=stock_ids[stock], alert_type=types[i % len(types)],
+                  value=_alert_value(types[i % len(types)], closes[stock_ids[stock]], factor))
+            for i, (stock, factor) in enumerate(zip(alert_stocks, factors))
+        ], batch_size=5000)
+    
+    return {'users': user_ids, 'stocks': stock_ids}
+
+def _alert_value(alert_type, close, factor):
+    if alert_type == 'price_above':
+        return round(float(close) * (1 + factor), 2)
+    if alert_type == 'price_below':
+        return round(float(close) * (1 - factor / 2), 2)
+    if alert_type == 'percent_change':
+        return round(factor * 10, 2)
+    return round(factor * 400, 2)
+
+def summarize(samples, queries):
+    """
+    Latency percentiles in milliseconds and query counts of repeated runs.
+    """
+    ms = np.array(samples) * 1000
+    return {
+        'runs': len(samples),
+        'p50_ms': round(float(np.percentile(ms, 50)), 3),
+        'p90_ms': round(float(np.percentile(ms, 90)), 3),
+        'p99_ms': round(float(np.percentile(ms, 99)), 3),
+        'mean_ms': round(float(ms.mean()), 3),
+        'max_ms': round(float(ms.max()), 3),
+        'queries': int(np.median(queries)),
+        'max_queries': int(max(queries)),
+    }
\ No newline at end of file
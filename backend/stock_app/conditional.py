@@ -0,0 +1,173 @@
+# backend/stock_app/conditional.py
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from .metrics import CONDITIONAL_RESPONSES
+from .models import ResourceVersion
+
+KEY_PREFIX = 'response_cache'
+
+# Resource key of the stock collection; one stock and its prices are stock_resource(id)
+STOCKS = 'stocks'
+
+def stock_resource(stock_id):
+    return f'stock:{stock_id}'
+
+def bump_versions(stock_ids):
+    """
+    Give the given stocks, and the stock collection, a new version with one
+    upsert. Ingestion and the Stock signals call this; writers that bypass
+    them (raw SQL loaders) must call it themselves, or clients keep getting
+    304s for data that has changed.
+    """
+    version = uuid.uuid4().hex
+    now = timezone.now()
+    keys = [STOCKS] + [stock_resource(stock_id) for stock_id in stock_ids]
+    ResourceVersion.objects.bulk_create(
+        [ResourceVersion(key=key, version=version, updated_at=now) for key in keys],
+        update_conflicts=True,
+        unique_fields=['key'],
+        update_fields=['version', 'updated_at'],
+    )
+
+def resource_version(key):
+    """
+    (version, updated_at) of a resource, or ('0', None) if it has never
+    changed since versioning began.
+    """
+    row = ResourceVersion.objects.filter(pk=key).values_list('version', 'updated_at').first()
+    return row or ('0', None)
+
+def validators(request, key, format):
+    """
+    (strong ETag, Last-Modified datetime or None) of the response to
+    `request` in `format`. The ETag covers the resource version, the full
+    path and today's date, since periods such as ?days=30 count back from it.
+    """
+    version, updated_at = resource_version(key)
+    source = f'{key}:{version}:{format}:{timezone.localdate()}:{request.get_full_path()}'
+    return quote_etag(hashlib.sha1(source.encode()).hexdigest()[:32]), updated_at
+
+def set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    # Clients and proxies may keep the response but must revalidate it
+    patch_cache_control(response, no_cache=True)
+
+def response_cache():
+    alias = getattr(settings, 'RESPONSE_CACHE', None)
+    return caches[alias] if alias else None
+
+def cached_response(request, etag, last_modified):
+    """
+    304 (or 412) if the client's copy matches the validators, else the
+    rendered response kept under `etag` by store_response(), else None.
+    """
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(last_modified.timestamp()) if last_modified else None,
+    )
+    if response is not None:
+        CONDITIONAL_RESPONSES.inc(1, 'not_modified')
+    else:
+        cache = response_cache()
+        entry = cache.get(f'{KEY_PREFIX}:{etag}') if cache is not None else None
+        if entry is None:
+            return None
+        response = HttpResponse(entry[0], content_type=entry[1])
+        CONDITIONAL_RESPONSES.inc(1, 'cached')
+    set_validators(response, etag, last_modified)
+    return response
+
+def conditional_response(request, key, format):
+    """
+    (validators, response) for a request for resource `key`, where the
+    response is a 304 or cached copy from cached_response(), or None if the
+    view has to render it.
+    """
+    conditional = validators(request, key, format)
+    return conditional, cached_response(request, *conditional)
+
+def store_response(response, etag, last_modified):
+    """
+    Add the validators to a 200 response and, with settings.RESPONSE_CACHE
+    set, keep its rendered content under `etag`. The ETag changes with the
+    version, so entries are never invalidated; they expire unused.
+    """
+    set_validators(response, etag, last_modified)
+    CONDITIONAL_RESPONSES.inc(1, 'rendered')
+    cache = response_cache()
+    if cache is None:
+        return
+    
+    def store(rendered):
+        cache.set(f'{KEY_PREFIX}:{etag}', (rendered.content, rendered['Content-Type']),
+                  getattr(settings, 'RESPONSE_CACHE_SECONDS', 3600))
+    
+    if hasattr(response, 'add_post_render_callback'):
+        response.add_post_render_callback(store)
+    else:
+        store(response)
+
+class Precomputed(Exception):
+    """
+    Raised by ConditionalGetMixin.initial() to answer without running the handler.
+    """
+    def __init__(self, response):
+        self.response = response
+
+class ConditionalGetMixin:
+    """
+    Strong ETag and Last-Modified on the viewset actions in
+    `conditional_actions`, derived from the version of the resource named by
+    conditional_resource(), which is `conditional_key` unless overridden. A
+    conditional GET whose copy is current gets a 304 after one primary key
+    lookup, before the queryset or serializer runs; with
+    settings.RESPONSE_CACHE set, other requests for an unchanged version
+    replay the rendered response.
+    """
+    conditional_actions = ()
+    # Resource key of every conditional action, like `queryset` for get_queryset()
+    conditional_key = None
+    # (etag, last_modified) of the current request, when it has validators
+    conditional = None
+    
+    def conditional_resource(self):
+        """
+        Resource key the current request's response depends on, or None to
+        serve it without validators. Views whose key depends on the request
+        override this.
+        """
+        return self.conditional_key
+    
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method not in ('GET', 'HEAD') or self.action not in self.conditional_actions:
+            return
+        # Browsable API pages render the user and forms into the page
+        if request.accepted_renderer.format == 'api':
+            return
+        key = self.conditional_resource()
+        if key is None:
+            return
+        self.conditional, response = conditional_response(request, key, request.accepted_renderer.format)
+        if response is not None:
+            raise Precomputed(response)
+    
+    def handle_exception(self, exc):
+        if isinstance(exc, Precomputed):
+            return exc.response
+        return super().handle_exception(exc)
+    
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if self.conditional and response.status_code == 200 and not response.has_header('ETag'):
+            store_response(response, *self.conditional)
+        return response
\ No newline at end of file
@@ -0,0 +1,154 @@
+# backend/stock_app/export.py
+import csv
+import io
+import json
+from itertools import islice
+
+import numpy as np
+from django.db.models import CharField, FloatField
+from django.db.models.functions import Cast
+
+from .models import Stock, StockPrice
+
+try:
+    import pyarrow as pa
+except ImportError:  # Arrow output is optional
+    pa = None
+
+COLUMNS = ['symbol', 'date', 'open', 'high', 'low', 'close', 'adjusted_close', 'volume']
+
+# Rows fetched from the database cursor at a time
+CHUNK_SIZE = 2000
+
+# Rows per written CSV/NDJSON block or Arrow record batch
+BATCH_ROWS = 5000
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'arrow': 'application/vnd.apache.arrow.stream',
+}
+
+def available_formats():
+    return [name for name in CONTENT_TYPES if name != 'arrow' or pa is not None]
+
+def export_rows(symbols=None, start=None, end=None, chunk_size=CHUNK_SIZE):
+    """
+    Stream (symbol, date, open, high, low, close, adjusted_close, volume)
+    tuples for the given symbols (all stocks if None) between `start` and
+    `end`, ordered by stock and date.
+    
+    Rows are read through a database cursor `chunk_size` at a time. Dates
+    come back as ISO strings and prices as floats, both cast in SQL, so no
+    model instances or Decimals are built along the way.
+    """
+    stocks = Stock.objects.all()
+    if symbols is not None:
+        stocks = stocks.filter(symbol__in=symbols)
+    symbol_by_id = dict(stocks.values_list('pk', 'symbol'))
+    if not symbol_by_id:
+        return
+    
+    prices = StockPrice.objects.filter(stock_id__in=list(symbol_by_id))
+    if start:
+        prices = prices.filter(date__gte=start)
+    if end:
+        prices = prices.filter(date__lte=end)
+    rows = prices.order_by('stock_id', 'date').annotate(
+        day=Cast('date', CharField()),
+        open=Cast('open_price', FloatField()),
+        high=Cast('high_price', FloatField()),
+        low=Cast('low_price', FloatField()),
+        close=Cast('close_price', FloatField()),
+        adjusted=Cast('adjusted_close', FloatField()),
+    ).values_list('stock_id', 'day', 'open', 'high', 'low', 'close', 'adjusted', 'volume')
+    
+    for stock_id, *values in rows.iterator(chunk_size=chunk_size):
+        yield (symbol_by_id[stock_id], *values)
+
+def _batches(rows, size=BATCH_ROWS):
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+def csv_chunks(rows):
+    """
+    Encode rows as CSV with a header line, one bytes chunk per batch.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    for batch in _batches(rows):
+        writer.writerows(batch)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+def ndjson_chunks(rows):
+    """
+    Encode rows as newline-delimited JSON objects, one bytes chunk per batch.
+    """
+    for batch in _batches(rows):
+        yield ''.join(json.dumps(dict(zip(COLUMNS, row))) + '\n' for row in batch).encode()
+
+def arrow_chunks(rows):
+    """
+    Encode rows as an Arrow IPC stream, one record batch per chunk.
+    Requires pyarrow.
+    """
+    if pa is None:
+        raise ImportError('Arrow export requires pyarrow')
+    
+    schema = pa.schema([
+        ('symbol', pa.string()),
+        ('date', pa.date32()),
+        ('open', pa.float64()),
+        ('high', pa.float64()),
+        ('low', pa.float64()),
+        ('close', pa.float64()),
+        ('adjusted_close', pa.float64()),
+        ('volume', pa.int64()),
+    ])
+    # The stream writer keeps one sink for the whole stream; whatever it has
+    # written is handed out after every batch
+    sink = _ChunkSink()
+    writer = pa.ipc.new_stream(sink, schema)
+    for batch in _batches(rows):
+        columns = list(zip(*batch))
+        columns[1] = np.array(columns[1], dtype='datetime64[D]')
+        writer.write_batch(pa.RecordBatch.from_arrays(
+            [pa.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema
+        ))
+        yield sink.take()
+    writer.close()
+    yield sink.take()
+
+class _ChunkSink(io.RawIOBase):
+    def __init__(self):
+        self._chunks = []
+    
+    def writable(self):
+        return True
+    
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+    
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+ENCODERS = {
+    'csv': csv_chunks,
+    'ndjson': ndjson_chunks,
+    'arrow': arrow_chunks,
+}
+
+def export_chunks(output, symbols=None, start=None, end=None):
+    """
+    Stream the export in the given output format as bytes chunks.
+    """
+    return ENCODERS[output](export_rows(symbols, start, end))
\ No newline at end of file
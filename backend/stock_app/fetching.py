@@ -0,0 +1,152 @@
+# backend/stock_app/fetching.py
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timedelta
+import threading
+import time
+
+from django.conf import settings
+
+from .providers import get_provider
+
+# Days of daily bars fetched for each symbol, same window as fetch_data
+HISTORY_DAYS = 30
+
+FetchResult = namedtuple('FetchResult', ['symbol', 'info', 'history', 'error'])
+
+# Worker pools shared by every fetch_many() call of the process, per size
+_executors = {}
+_executors_lock = threading.Lock()
+
+# Rate limiters shared by every fetch_many() call of the process, per
+# provider class and rate, so concurrent batches together stay under the rate
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def _executor(max_workers):
+    """
+    The process-wide pool of `max_workers` threads. A symbol that times out
+    keeps its worker until the provider call returns, so stragglers (and
+    their sockets and database connections) never outnumber the workers;
+    the providers' own request timeouts bound how long that is.
+    """
+    with _executors_lock:
+        if max_workers not in _executors:
+            _executors[max_workers] = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='fetch')
+        return _executors[max_workers]
+
+class RateLimiter:
+    """
+    Spaces out calls so that at most `rate` happen per second across all threads.
+    A rate of 0 or None disables limiting.
+    """
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self._lock = threading.Lock()
+        self._next_slot = time.monotonic()
+    
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+def _limiter(provider, rate):
+    """
+    The process-wide RateLimiter for the upstream behind `provider`.
+    """
+    # Look through the SharedProvider and TimedProvider wrappers
+    while 'provider' in vars(provider):
+        provider = provider.provider
+    key = (type(provider), rate)
+    with _limiters_lock:
+        if key not in _limiters:
+            _limiters[key] = RateLimiter(rate)
+        return _limiters[key]
+
+def history_window(days=HISTORY_DAYS):
+    """
+    Start/end keyword arguments for a provider history call covering the last `days`.
+    """
+    end_date = datetime.now()
+    start_date = end_date - timedelta(days=days)
+    return {'start': start_date.strftime('%Y-%m-%d'), 'end': end_date.strftime('%Y-%m-%d')}
+
+def fetch_symbol(provider, symbol, limiter, history_kwargs, deadline=None):
+    """
+    Fetch metadata and recent history for one symbol.
+    Raises LookupError if the provider doesn't know the symbol, and
+    TimeoutError instead of starting a provider call after `deadline`
+    (a time.monotonic() value).
+    """
+    def check_deadline():
+        if deadline is not None and time.monotonic() >= deadline:
+            raise TimeoutError(f"Deadline passed before fetching {symbol}")
+    
+    check_deadline()
+    limiter.acquire()
+    check_deadline()
+    info = provider.get_info(symbol)
+    if not info or 'symbol' not in info:
+        raise LookupError(f"Stock with symbol {symbol} not found")
+    
+    check_deadline()
+    limiter.acquire()
+    check_deadline()
+    hist = provider.get_history(symbol, **history_kwargs)
+    return info, hist
+
+def fetch_many(symbols, provider=None, max_workers=None, timeout=None, rate=None, history_kwargs=None):
+    """
+    Fetch metadata and history for many symbols through a bounded thread pool.
+    
+    The whole batch gets `timeout` seconds from submission, queueing for a
+    worker included; symbols not done by then are reported as timed out.
+    Their queued work is dropped, and a provider call already running
+    finishes in the background, holding its worker until its own request
+    timeout at most. Upstream calls of all batches are spaced out to `rate`
+    per second per provider.
+    Returns a list of FetchResult in the order of `symbols`, without duplicates.
+    """
+    symbols = list(dict.fromkeys(symbols))
+    provider = provider or get_provider()
+    max_workers = max_workers or getattr(settings, 'MARKET_DATA_MAX_WORKERS', 8)
+    timeout = timeout or getattr(settings, 'MARKET_DATA_TIMEOUT', 20)
+    rate = rate if rate is not None else getattr(settings, 'MARKET_DATA_RATE_LIMIT', 5)
+    history_kwargs = history_kwargs or history_window()
+    limiter = _limiter(provider, rate)
+    deadline = time.monotonic() + timeout
+    
+    results = {}
+    executor = _executor(max_workers)
+    pending = {executor.submit(fetch_symbol, provider, symbol, limiter, history_kwargs, deadline): symbol
+               for symbol in symbols}
+    try:
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                for future, symbol in pending.items():
+                    # Dropped from the queue, or left to finish in the background
+                    future.cancel()
+                    results[symbol] = FetchResult(symbol, None, None, f"Timed out after {timeout}s")
+                pending.clear()
+                break
+            
+            done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                symbol = pending.pop(future)
+                try:
+                    info, hist = future.result()
+                    results[symbol] = FetchResult(symbol, info, hist, None)
+                except Exception as e:
+                    results[symbol] = FetchResult(symbol, None, None, str(e))
+    finally:
+        # Symbols still queued if the caller was interrupted
+        for future in pending:
+            future.cancel()
+    
+    return [results[symbol] for symbol in symbols]
\ No newline at end of file
@@ -0,0 +1,38 @@
+# backend/stock_app/formatting.py
+import numpy as np
+import pandas as pd
+
+def history_columns(hist):
+    """
+    Convert a history DataFrame (indexed by date) into a dict of plain Python
+    column lists: {'date': [...], 'open': [...], ..., 'volume': [...]}.
+    
+    Every column is converted in one vectorized step. Bars without prices are
+    dropped, and dates only carry a time of day for intraday data.
+    """
+    hist = hist.dropna(subset=['Open', 'High', 'Low', 'Close'])
+    
+    # Format exchange-local wall time; .values of a tz-aware index would be UTC
+    dates = pd.DatetimeIndex(hist.index)
+    if dates.tz is not None:
+        dates = dates.tz_localize(None)
+    intraday = bool((dates != dates.normalize()).any())
+    date_strings = np.datetime_as_string(dates.values, unit='s' if intraday else 'D')
+    if intraday:
+        date_strings = np.char.replace(date_strings, 'T', ' ')
+    
+    return {
+        'date': date_strings.tolist(),
+        'open': hist['Open'].astype(float).tolist(),
+        'high': hist['High'].astype(float).tolist(),
+        'low': hist['Low'].astype(float).tolist(),
+        'close': hist['Close'].astype(float).tolist(),
+        'volume': hist['Volume'].fillna(0).astype('int64').tolist(),
+    }
+
+def columns_to_rows(columns):
+    """
+    Turn a dict of equal-length column lists into a list of per-row dicts.
+    """
+    keys = list(columns)
+    return [dict(zip(keys, values)) for values in zip(*columns.values())]
\ No newline at end of file
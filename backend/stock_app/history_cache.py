@@ -0,0 +1,228 @@
+# backend/stock_app/history_cache.py
+from datetime import date, datetime, time, timedelta
+
+import pandas as pd
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from .ingestion import ingest_price_history
+from .models import StockPrice
+from .providers import get_provider
+from .upstream import UpstreamUnavailable
+
+KEY_PREFIX = 'history_cache'
+
+# Calendar days covered by each historical_data period ('ytd' and 'max' are special)
+PERIOD_DAYS = {
+    '1d': 1, '5d': 5, '1mo': 31, '3mo': 92, '6mo': 183,
+    '1y': 366, '2y': 731, '5y': 1827, '10y': 3653,
+}
+
+# Intraday bars go stale after one bar; everything else is refreshed once a day
+INTRADAY_TTL = {
+    '1m': 60, '2m': 120, '5m': 300, '15m': 900, '30m': 1800,
+    '60m': 3600, '90m': 5400, '1h': 3600,
+}
+
+STATS = ['hits', 'partial', 'misses']
+
+# A period's first bar may come a few days after its first calendar day
+# (weekends, holidays) without anything missing
+START_SLACK = timedelta(days=4)
+
+def period_start(period, today):
+    """
+    First calendar date covered by a period, or None for 'max'.
+    """
+    if period == 'max':
+        return None
+    if period == 'ytd':
+        return date(today.year, 1, 1)
+    return today - timedelta(days=PERIOD_DAYS[period])
+
+def seconds_until_tomorrow():
+    now = timezone.localtime()
+    tomorrow = datetime.combine(now.date() + timedelta(days=1), time.min, tzinfo=now.tzinfo)
+    return max(int((tomorrow - now).total_seconds()), 1)
+
+def _count(name):
+    key = f'{KEY_PREFIX}:stats:{name}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+def get_stats():
+    """
+    Hit/partial/miss counters of this worker process since its default
+    cache was last cleared. The default cache is local memory, so the counts
+    are per process, not totals across workers. A partial hit served stored
+    bars after fetching only the missing tail.
+    """
+    counts = cache.get_many([f'{KEY_PREFIX}:stats:{name}' for name in STATS])
+    return {name: counts.get(f'{KEY_PREFIX}:stats:{name}', 0) for name in STATS}
+
+def stored_history(stock, start=None):
+    """
+    Daily bars stored in StockPrice from `start` on, shaped like a
+    yfinance history() frame.
+    """
+    prices = StockPrice.objects.filter(stock=stock)
+    if start:
+        prices = prices.filter(date__gte=start)
+    rows = prices.order_by('date').values_list(
+        'date', 'open_price', 'high_price', 'low_price', 'close_price', 'volume'
+    )
+    
+    hist = pd.DataFrame.from_records(
+        list(rows), columns=['Date', 'Open', 'High', 'Low', 'Close', 'Volume']
+    )
+    hist['Date'] = pd.to_datetime(hist['Date'])
+    hist[['Open', 'High', 'Low', 'Close']] = hist[['Open', 'High', 'Low', 'Close']].astype(float)
+    return hist.set_index('Date')
+
+def _coverage_key(stock_id):
+    return f'{KEY_PREFIX}:coverage:{stock_id}'
+
+def _coverage_cache():
+    # Shared by every worker unless configured to LocMem; see settings
+    return caches[getattr(settings, 'MARKET_DATA_COVERAGE_CACHE', 'market_data')]
+
+def _daily_sync(stock_id, period):
+    """
+    Provider get_history() kwargs that bring the stored daily bars of a
+    period up to date, or None if they already are. Coverage comes from the
+    first and last stored bar: the whole period is fetched if they start too
+    late, else only the tail after the last one, once a day.
+    """
+    today = timezone.localdate()
+    start = period_start(period, today)
+    stored = StockPrice.objects.filter(stock_id=stock_id).aggregate(first=Min('date'), last=Max('date'))
+    # Where the provider's history begins and when its tail was last fetched,
+    # which the stored bars can't tell
+    fetched = _coverage_cache().get(_coverage_key(stock_id)) or {}
+    
+    first, earliest = stored['first'], fetched.get('earliest')
+    covered = first is not None and (
+        (earliest is not None and first <= earliest) or (start is not None and first <= start + START_SLACK)
+    )
+    if not covered:
+        return {'period': period, 'interval': '1d'}
+    if stored['last'] >= today or fetched.get('checked') == today:
+        return None
+    # Re-fetch from the last stored day, whose bar may have been partial
+    return {'interval': '1d', 'start': stored['last'].strftime('%Y-%m-%d'),
+            'end': (today + timedelta(days=1)).strftime('%Y-%m-%d')}
+
+def is_synced(stock_id, period, interval):
+    """
+    Whether the daily bars of a period are served from StockPrice without a
+    provider call, so the response only changes when the stock's prices do.
+    """
+    return interval == '1d' and _daily_sync(stock_id, period) is None
+
+def _store_daily(stock, period, sync, hist):
+    """
+    Store the bars fetched for _daily_sync() and serve the period from StockPrice.
+    """
+    start = period_start(period, timezone.localdate())
+    if sync is None:
+        _count('hits')
+    else:
+        partial = 'start' in sync
+        if hist.empty and not partial:
+            _count('misses')
+            return hist
+        if not hist.empty:
+            ingest_price_history(stock, hist)
+        fetched = _coverage_cache().get(_coverage_key(stock.pk)) or {}
+        fetched['checked'] = timezone.localdate()
+        if not partial and (start is None or hist.index[0].date() > start + START_SLACK):
+            # Nothing before this bar upstream; don't fetch the period again for it
+            fetched['earliest'] = hist.index[0].date()
+        _coverage_cache().set(_coverage_key(stock.pk), fetched, None)
+        _count('partial' if partial else 'misses')
+    return stored_history(stock, start)
+
+def _stored_fallback(stock, period, error):
+    """
+    The stored bars of a period when upstream is unavailable; `error` is
+    raised again if there are none.
+    """
+    hist = stored_history(stock, period_start(period, timezone.localdate()))
+    if hist.empty:
+        raise error
+    return hist
+
+def _daily_history(stock, period, provider):
+    """
+    Serve daily bars from StockPrice, fetching from the provider only what
+    the stored bars don't cover yet. While upstream is unavailable the
+    stored bars are served as they are.
+    """
+    sync = _daily_sync(stock.pk, period)
+    try:
+        hist = provider.get_history(stock.symbol, **sync) if sync else None
+    except UpstreamUnavailable as e:
+        return _stored_fallback(stock, period, e)
+    return _store_daily(stock, period, sync, hist)
+
+def _frame_key(stock, period, interval):
+    return f'{KEY_PREFIX}:frame:{stock.symbol}:{period}:{interval}'
+
+def _frame_ttl(interval):
+    return INTRADAY_TTL.get(interval) or seconds_until_tomorrow()
+
+def _frame_history(stock, period, interval, provider):
+    """
+    Serve non-daily intervals from a whole-frame cache entry that expires
+    after one intraday bar, or at midnight for longer bars.
+    """
+    key = _frame_key(stock, period, interval)
+    hist = cache.get(key)
+    if hist is not None:
+        _count('hits')
+        return hist
+    
+    hist = provider.get_history(stock.symbol, period=period, interval=interval)
+    cache.set(key, hist, _frame_ttl(interval))
+    _count('misses')
+    return hist
+
+def get_history(stock, period, interval, provider=None):
+    """
+    Read-through cache in front of the provider's history() for historical_data.
+    Returns a DataFrame indexed by Date with Open/High/Low/Close/Volume columns.
+    """
+    provider = provider or get_provider()
+    if interval == '1d':
+        return _daily_history(stock, period, provider)
+    return _frame_history(stock, period, interval, provider)
+
+async def aget_history(stock, period, interval, provider=None):
+    """
+    get_history() for async views: the provider call is awaited, and the
+    cache and database work runs through sync_to_async().
+    """
+    provider = provider or get_provider()
+    if interval == '1d':
+        sync = await sync_to_async(_daily_sync)(stock.pk, period)
+        try:
+            hist = await provider.aget_history(stock.symbol, **sync) if sync else None
+        except UpstreamUnavailable as e:
+            return await sync_to_async(_stored_fallback)(stock, period, e)
+        return await sync_to_async(_store_daily)(stock, period, sync, hist)
+    
+    key = _frame_key(stock, period, interval)
+    hist = await cache.aget(key)
+    if hist is not None:
+        await sync_to_async(_count)('hits')
+        return hist
+    
+    hist = await provider.aget_history(stock.symbol, period=period, interval=interval)
+    await cache.aset(key, hist, _frame_ttl(interval))
+    await sync_to_async(_count)('misses')
+    return hist
\ No newline at end of file
@@ -0,0 +1,259 @@
+# backend/stock_app/indicators.py
+from collections import namedtuple
+from datetime import date
+
+import numpy as np
+import pandas as pd
+from django.core.cache import cache
+from numpy.lib.stride_tricks import sliding_window_view
+
+from .archive import PRICE_SCALE, stock_archive
+from .models import PriceArchive
+
+KEY_PREFIX = 'indicators'
+
+# Cached series are dropped if unused for a week. They hold whole histories,
+# so they stay in the default cache: each worker process keeps its own
+CACHE_TTL = 7 * 24 * 3600
+
+# Bounds for window/span/period parameters
+MIN_WINDOW, MAX_WINDOW = 2, 500
+
+def _ema(values, span=None, alpha=None, seed=None):
+    # EMA seeded with the first value, or continuing from `seed`
+    alpha = alpha if alpha is not None else 2 / (span + 1)
+    if seed is not None:
+        values = np.concatenate([[seed], values])
+    smoothed = pd.Series(values).ewm(alpha=alpha, adjust=False).mean().to_numpy()
+    return smoothed[1:] if seed is not None else smoothed
+
+def _windows(close, tail, window):
+    # The closes carried over from the previous run, followed by the new ones
+    series = np.concatenate([tail if tail is not None else [], close])
+    new_tail = series[max(len(series) - (window - 1), 0):]
+    return series, len(series) - len(close), new_tail
+
+def _rolling(series, window, reduce):
+    result = np.full(len(series), np.nan)
+    if len(series) >= window:
+        result[window - 1:] = reduce(sliding_window_view(series, window), axis=1)
+    return result
+
+def sma(close, state, window=20):
+    series, skip, tail = _windows(close, state, window)
+    return {'sma': _rolling(series, window, np.mean)[skip:]}, tail
+
+def ema(close, state, span=20):
+    values = _ema(close, span=span, seed=state)
+    return {'ema': values}, values[-1] if len(values) else state
+
+def rsi(close, state, period=14):
+    # Wilder's RSI: the average gain and loss start as the simple means of
+    # the first `period` changes, so the first value is at bar `period`, and
+    # are smoothed with alpha 1/period from there. state is (last close,
+    # gain, loss, changes seen); until `period` changes are seen, gain and
+    # loss are their sums
+    last_close, gain, loss, seen = state if state is not None else (None, 0.0, 0.0, 0)
+    if last_close is None:
+        # The very first bar has no change to measure
+        series, lead = close, [np.nan] * min(len(close), 1)
+    else:
+        series, lead = np.concatenate([[last_close], close]), []
+    
+    deltas = np.diff(series)
+    up, down = np.clip(deltas, 0, None), np.clip(-deltas, 0, None)
+    gains, losses = np.full(len(deltas), np.nan), np.full(len(deltas), np.nan)
+    warm = min(period - seen, len(deltas)) if seen < period else 0
+    if warm:
+        gain, loss, seen = gain + up[:warm].sum(), loss + down[:warm].sum(), seen + warm
+        if seen == period:
+            gain, loss = gain / period, loss / period
+            gains[warm - 1], losses[warm - 1] = gain, loss
+    if seen == period and len(deltas) > warm:
+        gains[warm:] = _ema(up[warm:], alpha=1 / period, seed=gain)
+        losses[warm:] = _ema(down[warm:], alpha=1 / period, seed=loss)
+        gain, loss = gains[-1], losses[-1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        values = np.where(losses == 0, 100.0, 100 - 100 / (1 + gains / losses))
+    
+    if len(close):
+        state = (close[-1], gain, loss, seen)
+    return {'rsi': np.concatenate([lead, values])}, state
+
+def macd(close, state, fast=12, slow=26, signal=9):
+    fast_seed, slow_seed, signal_seed = state if state is not None else (None, None, None)
+    fast_ema = _ema(close, span=fast, seed=fast_seed)
+    slow_ema = _ema(close, span=slow, seed=slow_seed)
+    line = fast_ema - slow_ema
+    signal_line = _ema(line, span=signal, seed=signal_seed)
+    if len(close):
+        state = (fast_ema[-1], slow_ema[-1], signal_line[-1])
+    return {'macd': line, 'signal': signal_line, 'histogram': line - signal_line}, state
+
+def bollinger(close, state, window=20, width=2):
+    series, skip, tail = _windows(close, state, window)
+    middle = _rolling(series, window, np.mean)[skip:]
+    deviation = _rolling(series, window, np.std)[skip:]
+    return {
+        'middle': middle,
+        'upper': middle + width * deviation,
+        'lower': middle - width * deviation,
+    }, tail
+
+Indicator = namedtuple('Indicator', ['function', 'defaults'])
+
+# Every function takes the new closes, the state returned by its previous run
+# (None the first time) and its parameters, and returns (outputs, state)
+INDICATORS = {
+    'sma': Indicator(sma, (20,)),
+    'ema': Indicator(ema, (20,)),
+    'rsi': Indicator(rsi, (14,)),
+    'macd': Indicator(macd, (12, 26, 9)),
+    'bollinger': Indicator(bollinger, (20, 2)),
+}
+
+def parse_spec(text):
+    """
+    Parse 'name' or 'name:param:param' (e.g. 'sma:50', 'macd:12:26:9') into
+    (name, params), filling in defaults. Raises ValueError for bad specs.
+    """
+    name, *params = text.strip().lower().split(':')
+    if name not in INDICATORS:
+        raise ValueError(f"Unknown indicator {name!r}. Must be one of {list(INDICATORS)}")
+    defaults = INDICATORS[name].defaults
+    if len(params) > len(defaults):
+        raise ValueError(f"{name} takes at most {len(defaults)} parameters")
+    
+    params = [int(param) for param in params] + list(defaults[len(params):])
+    if name == 'bollinger':
+        # The second parameter is the band width in standard deviations
+        if not 1 <= params[1] <= 5:
+            raise ValueError("bollinger band width must be between 1 and 5")
+        windows = params[:1]
+    else:
+        windows = params
+    if not all(MIN_WINDOW <= window <= MAX_WINDOW for window in windows):
+        raise ValueError(f"Windows must be between {MIN_WINDOW} and {MAX_WINDOW}")
+    return name, tuple(params)
+
+def spec_label(name, params):
+    return '_'.join([name, *map(str, params)])
+
+def _key(stock_id, name, params):
+    return f'{KEY_PREFIX}:{stock_id}:{spec_label(name, params)}'
+
+def _closes(stock_id, start=None):
+    # Read from the packed archive rather than row by row
+    days, prices, _ = stock_archive(stock_id, start)
+    return days, prices[3] / PRICE_SCALE
+
+def _archived_years(stock_id):
+    # {year: (rows, checksum)} of the stock's PriceArchive, without the data
+    return {year: (rows, checksum) for year, rows, checksum in
+            PriceArchive.objects.filter(stock_id=stock_id).values_list('year', 'rows', 'checksum')}
+
+def _closes_fingerprint(closes):
+    return len(closes), int(np.round(closes * 100).sum())
+
+def _year_start(day):
+    return np.datetime64(date(day.year, 1, 1), 'D')
+
+def _extend(name, params, entry, dates, closes, years):
+    """
+    Run an indicator over new bars, continuing from a cached entry (or from
+    scratch if None). Returns the dates and output series of the whole history
+    and the entry to cache, which is checkpointed at the second to last bar
+    since the latest bar can still be revised by the next ingest.
+    
+    The entry is validated later by the archive checksums of the years before
+    its checkpoint (`years`, read before `closes`) and a fingerprint of the
+    closes of the checkpoint's year, which the archive read covers anyway.
+    """
+    function = INDICATORS[name].function
+    state = entry['state'] if entry else None
+    
+    settled, settled_state = function(closes[:-1], state, *params)
+    latest, _ = function(closes[-1:], settled_state, *params)
+    
+    if entry:
+        settled = {output: np.concatenate([entry['values'][output], values]) for output, values in settled.items()}
+        settled_dates = np.concatenate([entry['dates'], dates[:-1]])
+    else:
+        settled_dates = dates[:-1]
+    
+    series = {output: np.concatenate([values, latest[output]]) for output, values in settled.items()}
+    new_entry = None
+    if len(settled_dates):
+        through = settled_dates[-1].item()
+        in_year = dates[:-1] >= _year_start(through)
+        count, cents = _closes_fingerprint(closes[:-1][in_year])
+        if entry and entry['through'].year == through.year:
+            count, cents = count + entry['fingerprint'][0], cents + entry['fingerprint'][1]
+        new_entry = {'through': through, 'fingerprint': (count, cents),
+                     'years': {year: totals for year, totals in years.items() if year < through.year},
+                     'values': settled, 'dates': settled_dates, 'state': settled_state}
+    return np.concatenate([settled_dates, dates[-1:]]), series, new_entry
+
+def indicator_frame(stock_id, specs):
+    """
+    Compute indicators over a stock's stored closes as a DataFrame indexed by
+    date, with one column per output (e.g. 'sma_20', 'macd_12_26_9_signal').
+    
+    Results are cached per (stock, indicator, params). A cached series whose
+    source closes are unchanged is only extended over the bars ingested since
+    its checkpoint, so a warm request reads a handful of new rows instead of
+    the whole history.
+    """
+    keys = {spec: _key(stock_id, *spec) for spec in specs}
+    cached = cache.get_many(list(keys.values()))
+    
+    # Archived years before a checkpoint must be unchanged, which their
+    # checksums tell without reading the bars
+    years = _archived_years(stock_id)
+    candidates = {
+        spec: cached[key] for spec, key in keys.items()
+        if key in cached and cached[key]['years'] == {
+            year: totals for year, totals in years.items() if year < cached[key]['through'].year
+        }
+    }
+    
+    # One read covers every spec: from the start of the oldest checkpoint's year, or everything
+    start = (min(entry['through'] for entry in candidates.values()).replace(month=1, day=1)
+             if candidates and len(candidates) == len(specs) else None)
+    dates, closes = _closes(stock_id, start)
+    
+    # The rest of a checkpoint's year is in that read
+    valid = {}
+    for spec, entry in candidates.items():
+        checkpoint = np.datetime64(entry['through'], 'D')
+        in_year = (dates >= _year_start(entry['through'])) & (dates <= checkpoint)
+        if _closes_fingerprint(closes[in_year]) == entry['fingerprint']:
+            valid[spec] = entry
+    
+    frame = pd.DataFrame(index=pd.DatetimeIndex([], name='date'))
+    updates = {}
+    for spec in specs:
+        entry = valid.get(spec)
+        spec_dates, spec_closes = dates, closes
+        if entry is not None:
+            new = dates > np.datetime64(entry['through'])
+            spec_dates, spec_closes = dates[new], closes[new]
+            if not len(spec_closes):
+                # The bars after the checkpoint were deleted; start over
+                entry, (spec_dates, spec_closes) = None, _closes(stock_id)
+        elif start is not None:
+            # Its checkpoint is stale; start over
+            spec_dates, spec_closes = _closes(stock_id)
+        if not len(spec_closes):
+            continue
+        
+        full_dates, series, updates[keys[spec]] = _extend(*spec, entry, spec_dates, spec_closes, years)
+        
+        label = spec_label(*spec)
+        columns = {label if output == spec[0] else f'{label}_{output}': values for output, values in series.items()}
+        frame = frame.join(pd.DataFrame(columns, index=pd.DatetimeIndex(full_dates, name='date')), how='outer')
+    
+    updates = {key: entry for key, entry in updates.items() if entry is not None}
+    if updates:
+        cache.set_many(updates, CACHE_TTL)
+    return frame
\ No newline at end of file
@@ -0,0 +1,121 @@
+# backend/stock_app/ingestion.py
+import pandas as pd
+from django.db import transaction
+
+from .conditional import bump_versions
+from .models import Stock, StockPrice
+from .signals import mark_prices_changed
+
+# Columns written on conflict with an existing (stock, date) row
+PRICE_FIELDS = ['open_price', 'high_price', 'low_price', 'close_price', 'adjusted_close', 'volume']
+
+# Columns written on conflict with an existing symbol
+STOCK_FIELDS = ['company_name', 'sector', 'industry', 'market_cap', 'current_price', 'date_updated']
+
+def stock_defaults(symbol, info):
+    """
+    Map a provider info dict onto Stock field values.
+    """
+    return {
+        'company_name': info.get('longName', info.get('shortName', symbol)),
+        'sector': info.get('sector', ''),
+        'industry': info.get('industry', ''),
+        'market_cap': info.get('marketCap', 0),
+        'current_price': info.get('currentPrice', info.get('regularMarketPrice', 0))
+    }
+
+def upsert_stocks(infos):
+    """
+    Create or update one Stock per {symbol: info} entry with a single bulk
+    upsert on symbol, which sends no post_save, so their ETag versions are
+    bumped here. Returns {symbol: Stock}.
+    """
+    if not infos:
+        return {}
+    
+    Stock.objects.bulk_create(
+        [Stock(symbol=symbol, **stock_defaults(symbol, info)) for symbol, info in infos.items()],
+        update_conflicts=True,
+        unique_fields=['symbol'],
+        update_fields=STOCK_FIELDS,
+    )
+    # Upserts don't return primary keys on every backend, so read them back
+    stocks = Stock.objects.in_bulk(list(infos), field_name='symbol')
+    bump_versions([stock.pk for stock in stocks.values()])
+    return stocks
+
+def build_price_rows(stock, hist):
+    """
+    Convert a yfinance history DataFrame (indexed by date) into unsaved
+    StockPrice instances for the given stock.
+    """
+    if hist is None or hist.empty:
+        return []
+    
+    # Bars with missing prices can't be stored (all price columns are NOT NULL)
+    hist = hist.dropna(subset=['Open', 'High', 'Low', 'Close'])
+    
+    dates = pd.DatetimeIndex(hist.index).date
+    prices = hist[['Open', 'High', 'Low', 'Close']].round(2)
+    volumes = hist['Volume'].fillna(0).astype('int64')
+    
+    return [
+        StockPrice(
+            stock=stock,
+            date=date,
+            open_price=open_price,
+            high_price=high_price,
+            low_price=low_price,
+            close_price=close_price,
+            adjusted_close=close_price,
+            volume=volume,
+        )
+        for date, open_price, high_price, low_price, close_price, volume in zip(
+            dates,
+            prices['Open'].tolist(),
+            prices['High'].tolist(),
+            prices['Low'].tolist(),
+            prices['Close'].tolist(),
+            volumes.tolist(),
+        )
+    ]
+
+def ingest_price_histories(histories):
+    """
+    Upsert fetched history DataFrames for several stocks in a single transaction.
+    
+    `histories` is an iterable of (stock, DataFrame) pairs. Rows are written
+    with bulk INSERT ... ON CONFLICT (stock, date) DO UPDATE, which skips the
+    per-row post_save receivers, so the touched stocks are handed to
+    mark_prices_changed() to refresh current prices and alerts once after commit.
+    Returns {stock.pk: number of rows written}.
+    """
+    rows = []
+    written = {}
+    for stock, hist in histories:
+        stock_rows = build_price_rows(stock, hist)
+        if stock_rows:
+            rows.extend(stock_rows)
+            written[stock.pk] = len(stock_rows)
+    
+    if not rows:
+        return {}
+    
+    with transaction.atomic():
+        StockPrice.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['stock', 'date'],
+            update_fields=PRICE_FIELDS,
+        )
+        
+        mark_prices_changed(written)
+    
+    return written
+
+def ingest_price_history(stock, hist):
+    """
+    Upsert a fetched history DataFrame for one stock.
+    Returns the number of rows written.
+    """
+    return ingest_price_histories([(stock, hist)]).get(stock.pk, 0)
\ No newline at end of file
@@ -0,0 +1,184 @@
+# backend/stock_app/management/commands/bench_api.py
+from datetime import timedelta
+import json
+import platform
+import subprocess
+import time
+
+import django
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from stock_app.alert_index import alert_index
+from stock_app.archive import refresh_archive
+from stock_app.benchmarks import SCALES, isolated_database, generate_dataset, summarize, measure
+from stock_app.ingestion import ingest_price_history
+from stock_app.models import Stock, UserPortfolio, Alert
+from stock_app.stats import refresh_stats
+from stock_app.synthetic import synthetic_history
+
+class Command(BaseCommand):
+    help = "Benchmark the main API endpoints on a synthetic dataset and write the results as JSON"
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', default='small', choices=list(SCALES),
+                            help="Dataset size (full: 5k stocks, 10 years, 50k portfolios, 200k alerts)")
+        parser.add_argument('--runs', type=int, default=50,
+                            help="Measured runs per scenario, after one warm-up run (default: 50)")
+        parser.add_argument('--seed', type=int, default=0,
+                            help="Seed of the dataset and of the requests made")
+        parser.add_argument('--output', '-o',
+                            help="JSON file to write the results to")
+        parser.add_argument('--compare',
+                            help="Earlier results file; fail if any p50 grew by more than --threshold")
+        parser.add_argument('--threshold', type=float, default=1.25,
+                            help="Allowed p50 ratio against --compare (default: 1.25)")
+    
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+        
+        scale = SCALES[options['scale']]
+        if baseline is not None and baseline['meta']['dataset'] != scale:
+            raise CommandError(f"{options['compare']} was measured on the {baseline['meta']['scale']} dataset")
+        with isolated_database():
+            started = time.perf_counter()
+            dataset = generate_dataset(**scale, seed=options['seed'])
+            refresh_stats(dataset['stocks'])
+            refresh_archive(dataset['stocks'])
+            alert_index.rebuild()
+            self.stdout.write(f"Generated {options['scale']} dataset in {time.perf_counter() - started:.1f}s")
+            
+            self.rng = np.random.default_rng(options['seed'])
+            self.dataset = dataset
+            results = {}
+            for name, scenario, setup in self.scenarios():
+                results[name] = self.run_scenario(scenario, options['runs'], setup)
+                self.stdout.write(
+                    f"{name:<24}p50 {results[name]['p50_ms']:>9.2f}ms  p90 {results[name]['p90_ms']:>9.2f}ms  "
+                    f"p99 {results[name]['p99_ms']:>9.2f}ms  {results[name]['queries']:>4} queries"
+                )
+        
+        report = {'meta': self.meta(options, scale), 'results': results}
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+        if baseline is not None:
+            self.compare(baseline, report, options['threshold'])
+    
+    def meta(self, options, scale):
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True)
+        return {
+            'commit': commit.stdout.strip() or None,
+            'timestamp': timezone.now().isoformat(),
+            'scale': options['scale'],
+            'dataset': scale,
+            'runs': options['runs'],
+            'seed': options['seed'],
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+        }
+    
+    def run_scenario(self, scenario, runs, setup=None):
+        # One unmeasured run warms caches, the index and the query plans;
+        # `setup` runs unmeasured before every run
+        samples, queries = [], []
+        for run in range(runs + 1):
+            if setup:
+                setup()
+            response, elapsed, count = measure(scenario)
+            if not run:
+                continue
+            if response is not None and response.status_code >= 400:
+                raise CommandError(f"{response.status_code}: {getattr(response, 'data', '')}")
+            samples.append(elapsed)
+            queries.append(count)
+        return summarize(samples, queries)
+    
+    def scenarios(self):
+        # Requests go through the full stack, including middleware and rendering
+        anonymous = APIClient(SERVER_NAME='localhost')
+        stock_ids = self.dataset['stocks']
+        symbols = dict(Stock.objects.values_list('pk', 'symbol'))
+        pages = max(len(stock_ids) // 20, 1)
+        
+        portfolio = UserPortfolio.objects.select_related('user').order_by('pk').first()
+        owner = APIClient(SERVER_NAME='localhost')
+        owner.force_authenticate(portfolio.user)
+        staff = APIClient(SERVER_NAME='localhost')
+        staff_user = portfolio.user
+        staff_user.is_staff = True
+        staff_user.save(update_fields=['is_staff'])
+        staff.force_authenticate(staff_user)
+        
+        def pick():
+            return symbols[stock_ids[self.rng.integers(len(stock_ids))]]
+        
+        def stock_list():
+            return anonymous.get(f'/api/stocks/?page={self.rng.integers(1, pages + 1)}')
+        
+        def stock_search():
+            return anonymous.get(f'/api/stocks/?search={pick()[:4]}')
+        
+        def stock_screen():
+            return anonymous.get('/api/stocks/?stats__return_1m__gte=5&ordering=-stats__return_1m')
+        
+        def prices_first_page():
+            return anonymous.get(f'/api/stock-prices/?symbol={pick()}&page_size=100')
+        
+        cursor = {'next': None}
+        
+        def prices_next_page():
+            # Walks the whole table by keyset cursor, starting over at the end
+            response = anonymous.get(cursor['next'] or '/api/stock-prices/?page_size=100')
+            cursor['next'] = response.data['next']
+            return response
+        
+        def portfolio_performance():
+            return owner.get(f'/api/portfolios/{portfolio.pk}/performance/')
+        
+        def check_alerts():
+            return staff.post('/api/alerts/check_alerts/')
+        
+        def rearm_alerts():
+            # Alerts fire only once; re-arm them so every run checks the same set
+            Alert.objects.filter(triggered=True).update(triggered=False, triggered_at=None)
+            alert_index.rebuild()
+        
+        bars = synthetic_history(1, end=timezone.localdate() + timedelta(days=7))
+        
+        def ingest():
+            # One new bar; its commit refreshes prices, snapshots, stats and alerts
+            stock = Stock(pk=stock_ids[self.rng.integers(len(stock_ids))])
+            ingest_price_history(stock, bars)
+        
+        return [
+            ('stock_list', stock_list, None),
+            ('stock_search', stock_search, None),
+            ('stock_screen', stock_screen, None),
+            ('stock_prices_first_page', prices_first_page, None),
+            ('stock_prices_next_page', prices_next_page, None),
+            ('portfolio_performance', portfolio_performance, None),
+            ('check_alerts', check_alerts, rearm_alerts),
+            ('ingest', ingest, None),
+        ]
+    
+    def compare(self, baseline, report, threshold):
+        regressions = []
+        for name, result in report['results'].items():
+            before = baseline.get('results', {}).get(name)
+            if not before:
+                continue
+            ratio = result['p50_ms'] / before['p50_ms'] if before['p50_ms'] else 1
+            queries = f"{before['queries']} -> {result['queries']} queries"
+            self.stdout.write(f"{name:<24}{before['p50_ms']:>9.2f} -> {result['p50_ms']:>9.2f}ms  x{ratio:.2f}  {queries}")
+            if ratio > threshold or result['queries'] > before['queries']:
+                regressions.append(name)
+        if regressions:
+            raise CommandError(f"Regressed against {baseline['meta'].get('commit')}: {', '.join(regressions)}")
\ No newline at end of file
@@ -0,0 +1,52 @@
+# backend/stock_app/management/commands/bench_ingest.py
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from stock_app.benchmarks import baseline_ingest, deferred_ingest, isolated_database, measure
+from stock_app.synthetic import synthetic_history
+from stock_app.ingestion import ingest_price_history
+from stock_app.models import Stock, Alert
+
+class Command(BaseCommand):
+    help = "Compare rows/second of the per-row (consumers off), deferred per-row and bulk price ingestion paths"
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=2500,
+                            help="Daily bars per symbol (default: 2500, about 10 years)")
+        parser.add_argument('--alerts', type=int, default=20,
+                            help="Active alerts attached to the benchmark symbol")
+    
+    def handle(self, *args, **options):
+        rows = options['rows']
+        hist = synthetic_history(rows)
+        
+        with isolated_database():
+            user = User.objects.create(username='bench')
+            paths = [('per-row', baseline_ingest), ('deferred', deferred_ingest), ('bulk', ingest_price_history)]
+            
+            self.stdout.write(f"{'path':<10}{'run':<8}{'rows/s':>12}{'queries':>10}{'seconds':>10}")
+            for name, ingest in paths:
+                stock = Stock.objects.create(symbol=f'BENCH{len(name)}', company_name=name)
+                self._create_alerts(user, stock, options['alerts'])
+                
+                # First run inserts every bar, the second updates them in place
+                for run in ['insert', 'update']:
+                    _, elapsed, queries = measure(ingest, stock, hist)
+                    self.stdout.write(
+                        f"{name:<10}{run:<8}{rows / elapsed:>12,.0f}{queries:>10}{elapsed:>10.3f}"
+                    )
+    
+    def _create_alerts(self, user, stock, count):
+        # Thresholds that never trigger, so every bar re-checks every alert
+        alert_values = {
+            'price_above': 1_000_000,
+            'price_below': 0,
+            'percent_change': 1_000,
+            'volume_spike': 1_000_000,
+        }
+        types = list(alert_values)
+        Alert.objects.bulk_create([
+            Alert(user=user, stock=stock, alert_type=types[i % len(types)],
+                  value=alert_values[types[i % len(types)]])
+            for i in range(count)
+        ])
\ No newline at end of file
@@ -0,0 +1,29 @@
+# backend/stock_app/management/commands/build_price_matrix.py
+from django.core.management.base import BaseCommand, CommandError
+
+from stock_app.price_matrix import build_price_matrix, matrix_dir, update_price_matrix
+
+class Command(BaseCommand):
+    help = "Write the date x symbol price matrix read by cross-sectional analytics"
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--directory',
+                            help="Directory of the matrix files (default: settings.PRICE_MATRIX_DIR)")
+        parser.add_argument('--update', action='store_true',
+                            help="Rewrite every column in place instead of rebuilding")
+    
+    def handle(self, *args, **options):
+        directory = options['directory'] or matrix_dir()
+        if options['update']:
+            index = update_price_matrix(directory=directory)
+            if index is None:
+                raise CommandError(f"No price matrix in {directory}; build it first")
+        else:
+            index = build_price_matrix(directory)
+        self.stdout.write(self.style.SUCCESS(
+            f"Price matrix in {directory}: {index['rows']} dates x {len(index['symbols'])} symbols"
+        ))
+        if index.get('stale'):
+            self.stdout.write(self.style.WARNING(
+                "Some prices did not fit in place (new stocks or dates); run without --update to rebuild"
+            ))
\ No newline at end of file
@@ -0,0 +1,38 @@
+# backend/stock_app/management/commands/export_prices.py
+import sys
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from stock_app.export import available_formats, export_chunks
+
+class Command(BaseCommand):
+    help = "Stream stored price history to a file or stdout as CSV, NDJSON or Arrow IPC"
+    
+    def add_arguments(self, parser):
+        parser.add_argument('symbols', nargs='*',
+                            help="Symbols to export (default: every stock)")
+        parser.add_argument('--start', type=date.fromisoformat,
+                            help="First date to export, YYYY-MM-DD")
+        parser.add_argument('--end', type=date.fromisoformat,
+                            help="Last date to export, YYYY-MM-DD")
+        parser.add_argument('--output-format', default='csv', choices=['csv', 'ndjson', 'arrow'],
+                            help="Encoding (default: csv; arrow needs pyarrow)")
+        parser.add_argument('--output', '-o',
+                            help="File to write (default: stdout)")
+    
+    def handle(self, *args, **options):
+        output_format = options['output_format']
+        if output_format not in available_formats():
+            raise CommandError(f"{output_format} export is not available; install pyarrow")
+        
+        chunks = export_chunks(output_format, options['symbols'] or None, options['start'], options['end'])
+        if options['output']:
+            with open(options['output'], 'wb') as out:
+                for chunk in chunks:
+                    out.write(chunk)
+        else:
+            out = sys.stdout.buffer
+            for chunk in chunks:
+                out.write(chunk)
+            out.flush()
\ No newline at end of file
@@ -0,0 +1,115 @@
+# backend/stock_app/management/commands/load_test.py
+import asyncio
+import json
+import time
+
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, override_settings
+
+from stock_app.benchmarks import isolated_database
+from stock_app.models import Stock
+from stock_app.providers import get_provider, reset_providers
+
+# URL confs of the two ways historical_data is served under ASGI
+MODES = {
+    'sync': 'backend.urls',
+    'async': 'backend.async_urls',
+}
+
+class Command(BaseCommand):
+    help = ("Load test historical_data through the ASGI handler, as the synchronous DRF action and as the "
+            "async view, against an offline provider with a fixed upstream latency")
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--latency', type=float, default=0.2,
+                            help="Seconds every provider call takes (default: 0.2)")
+        parser.add_argument('--concurrency', default='1,4,16,64',
+                            help="Comma-separated numbers of requests in flight (default: 1,4,16,64)")
+        parser.add_argument('--requests', type=int, default=64,
+                            help="Requests per mode and concurrency level, one symbol each (default: 64)")
+        parser.add_argument('--mode', default='both', choices=['both', *MODES])
+        parser.add_argument('--output', '-o',
+                            help="JSON file to write the results to")
+    
+    def handle(self, *args, **options):
+        try:
+            levels = [int(level) for level in options['concurrency'].split(',')]
+        except ValueError:
+            raise CommandError("--concurrency must be a comma-separated list of integers")
+        if options['requests'] < 1 or min(levels) < 1:
+            raise CommandError("--requests and --concurrency must be at least 1")
+        modes = list(MODES) if options['mode'] == 'both' else [options['mode']]
+        
+        replay = {'path': None, 'latency': options['latency'], 'jitter': 0.0, 'error_rate': 0.0,
+                  'synthetic_rows': 260}
+        with isolated_database(), override_settings(MARKET_DATA_PROVIDER='stock_app.providers.ReplayProvider',
+                                                    MARKET_DATA_REPLAY=replay, SLOW_REQUEST_MS=None,
+                                                    ALLOWED_HOSTS=['testserver']):
+            reset_providers()
+            try:
+                results = self.run(modes, levels, options['requests'], options['latency'])
+            finally:
+                reset_providers()
+        
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({'latency': options['latency'], 'requests': options['requests'], 'results': results},
+                          f, indent=2)
+    
+    def run(self, modes, levels, requests, latency):
+        stocks = Stock.objects.bulk_create(
+            [Stock(symbol=f'LOAD{i:04d}', company_name=f'Load {i}') for i in range(requests)]
+        )
+        # Generate the replayed bars up front, so requests only wait on the latency
+        provider = get_provider()
+        for stock in stocks:
+            provider.history_frame(stock.symbol)
+        
+        self.stdout.write(f"{requests} requests per level, provider latency {latency * 1000:.0f}ms")
+        results = []
+        for mode in modes:
+            with override_settings(ROOT_URLCONF=MODES[mode]):
+                for concurrency in levels:
+                    # Every request misses the history cache and goes upstream
+                    cache.clear()
+                    seconds, samples, statuses = async_to_sync(self.run_level)(
+                        [stock.pk for stock in stocks], concurrency
+                    )
+                    ms = np.array(samples) * 1000
+                    result = {
+                        'mode': mode,
+                        'concurrency': concurrency,
+                        'requests_per_second': round(len(samples) / seconds, 2),
+                        'p50_ms': round(float(np.percentile(ms, 50)), 1),
+                        'p99_ms': round(float(np.percentile(ms, 99)), 1),
+                        'errors': sum(code != 200 for code in statuses),
+                    }
+                    results.append(result)
+                    self.stdout.write(
+                        f"{mode:<6} concurrency {concurrency:>4}  {result['requests_per_second']:>8.1f} req/s  "
+                        f"p50 {result['p50_ms']:>8.1f}ms  p99 {result['p99_ms']:>8.1f}ms"
+                        + (f"  {result['errors']} errors" if result['errors'] else '')
+                    )
+        return results
+    
+    async def run_level(self, stock_ids, concurrency):
+        # AsyncClient runs requests through Django's ASGI handler, where
+        # synchronous views share one thread
+        client = AsyncClient()
+        slots = asyncio.Semaphore(concurrency)
+        samples = []
+        
+        async def request(stock_id):
+            async with slots:
+                started = time.perf_counter()
+                response = await client.get(f'/api/stocks/{stock_id}/historical_data/',
+                                            {'period': '1y', 'interval': '1wk'})
+                samples.append(time.perf_counter() - started)
+                return response.status_code
+        
+        started = time.perf_counter()
+        statuses = await asyncio.gather(*(request(stock_id) for stock_id in stock_ids))
+        return time.perf_counter() - started, samples, statuses
\ No newline at end of file
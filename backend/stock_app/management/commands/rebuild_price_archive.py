@@ -0,0 +1,35 @@
+# backend/stock_app/management/commands/rebuild_price_archive.py
+from django.core.management.base import BaseCommand, CommandError
+
+from stock_app.archive import CHUNK_SIZE, refresh_archive
+from stock_app.models import Stock, PriceArchive
+
+class Command(BaseCommand):
+    help = "Pack stored prices into the PriceArchive, e.g. after a backfill or changes made around the signals"
+    
+    def add_arguments(self, parser):
+        parser.add_argument('symbols', nargs='*',
+                            help="Symbols to archive (default: every stock)")
+        parser.add_argument('--full', action='store_true',
+                            help="Repack every year instead of only the ones that changed")
+    
+    def handle(self, *args, **options):
+        stocks = Stock.objects.order_by('pk')
+        if options['symbols']:
+            symbols = [symbol.upper() for symbol in options['symbols']]
+            stocks = stocks.filter(symbol__in=symbols)
+            unknown = set(symbols) - set(stocks.values_list('symbol', flat=True))
+            if unknown:
+                raise CommandError(f"Unknown symbols: {', '.join(sorted(unknown))}")
+        
+        stock_ids = list(stocks.values_list('pk', flat=True))
+        for i in range(0, len(stock_ids), CHUNK_SIZE):
+            chunk = stock_ids[i:i + CHUNK_SIZE]
+            if options['full']:
+                PriceArchive.objects.filter(stock_id__in=chunk).delete()
+            refresh_archive(chunk)
+            self.stdout.write(f"{min(i + CHUNK_SIZE, len(stock_ids))}/{len(stock_ids)} stocks")
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {PriceArchive.objects.filter(stock_id__in=stock_ids).count()} stock-years "
+            f"of {len(stock_ids)} stocks"
+        ))
\ No newline at end of file
@@ -0,0 +1,14 @@
+# backend/stock_app/management/commands/rebuild_search_index.py
+from django.core.management.base import BaseCommand, CommandError
+
+from stock_app.search import rebuild_search_index, search_backend
+
+class Command(BaseCommand):
+    help = "Index every stock analysis for full-text search, e.g. after loading rows around the signals"
+    
+    def handle(self, *args, **options):
+        backend = search_backend()
+        if backend is None:
+            raise CommandError("The database has no full-text search (SQLite with FTS5 or PostgreSQL is needed)")
+        count = rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} analyses ({backend})"))
\ No newline at end of file
@@ -0,0 +1,27 @@
+# backend/stock_app/management/commands/rebuild_stock_stats.py
+from django.core.management.base import BaseCommand, CommandError
+
+from stock_app.models import Stock
+from stock_app.stats import CHUNK_SIZE, refresh_stats
+
+class Command(BaseCommand):
+    help = "Recompute the StockStats rows from stored prices, e.g. after a backfill or bulk delete"
+    
+    def add_arguments(self, parser):
+        parser.add_argument('symbols', nargs='*',
+                            help="Symbols to rebuild (default: every stock)")
+    
+    def handle(self, *args, **options):
+        stocks = Stock.objects.order_by('pk')
+        if options['symbols']:
+            symbols = [symbol.upper() for symbol in options['symbols']]
+            stocks = stocks.filter(symbol__in=symbols)
+            unknown = set(symbols) - set(stocks.values_list('symbol', flat=True))
+            if unknown:
+                raise CommandError(f"Unknown symbols: {', '.join(sorted(unknown))}")
+        
+        stock_ids = list(stocks.values_list('pk', flat=True))
+        for i in range(0, len(stock_ids), CHUNK_SIZE):
+            refresh_stats(stock_ids[i:i + CHUNK_SIZE])
+            self.stdout.write(f"{min(i + CHUNK_SIZE, len(stock_ids))}/{len(stock_ids)} stocks")
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt stats for {len(stock_ids)} stocks"))
\ No newline at end of file
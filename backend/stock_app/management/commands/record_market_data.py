@@ -0,0 +1,55 @@
+# backend/stock_app/management/commands/record_market_data.py
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from stock_app.history_cache import stored_history
+from stock_app.models import Stock
+from stock_app.providers import HISTORY_COLUMNS, get_provider
+
+class Command(BaseCommand):
+    help = "Record daily bars as CSV or Parquet fixtures for the offline ReplayProvider"
+    
+    def add_arguments(self, parser):
+        parser.add_argument('symbols', nargs='*',
+                            help="Symbols to record (default: every stock)")
+        parser.add_argument('--output-dir', '-o', required=True,
+                            help="Directory for the SYMBOL.csv / SYMBOL.parquet files")
+        parser.add_argument('--source', default='provider', choices=['provider', 'database'],
+                            help="Fetch from the configured provider or copy the stored StockPrice bars")
+        parser.add_argument('--period', default='max',
+                            help="History period fetched from the provider (default: max)")
+        parser.add_argument('--output-format', default='csv', choices=['csv', 'parquet'],
+                            help="Fixture format (default: csv; parquet needs pyarrow or fastparquet)")
+    
+    def handle(self, *args, **options):
+        output_dir = Path(options['output_dir'])
+        output_dir.mkdir(parents=True, exist_ok=True)
+        symbols = [symbol.upper() for symbol in options['symbols']]
+        if not symbols:
+            symbols = list(Stock.objects.values_list('symbol', flat=True))
+        
+        provider = get_provider() if options['source'] == 'provider' else None
+        for symbol in symbols:
+            if provider is not None:
+                hist = provider.get_history(symbol, period=options['period'], interval='1d')
+            else:
+                stock = Stock.objects.filter(symbol=symbol).first()
+                if stock is None:
+                    raise CommandError(f"Unknown symbol: {symbol}")
+                hist = stored_history(stock)
+            if hist.empty:
+                self.stderr.write(f"{symbol}: no bars, skipped")
+                continue
+            
+            # Plain dates, so fixtures don't depend on the exchange's time zone
+            hist = hist[HISTORY_COLUMNS]
+            index = hist.index.tz_localize(None) if hist.index.tz is not None else hist.index
+            hist = hist.set_axis(index.normalize().rename('Date'))
+            
+            path = output_dir / f'{symbol}.{options["output_format"]}'
+            if options['output_format'] == 'csv':
+                hist.to_csv(path)
+            else:
+                hist.to_parquet(path)
+            self.stdout.write(f"{symbol}: {len(hist)} bars to {path}")
\ No newline at end of file
@@ -0,0 +1,47 @@
+# backend/stock_app/management/commands/refresh_market_data.py
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from stock_app.refresher import MarketDataRefresher
+
+class Command(BaseCommand):
+    help = "Keep quotes and daily bars of every tracked stock fresh, refreshing them in cycles"
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float,
+                            help="Seconds between cycle starts (default: MARKET_DATA_REFRESH_INTERVAL)")
+        parser.add_argument('--cycles', type=int,
+                            help="Stop after this many cycles (default: run until interrupted)")
+        parser.add_argument('--untracked-every', type=int,
+                            help="Also refresh stocks outside alerts, portfolios and watchlists "
+                                 "every N cycles (default: MARKET_DATA_UNTRACKED_EVERY)")
+        parser.add_argument('--batch-size', type=int,
+                            help="Most symbols fetched per cycle (default: MARKET_DATA_REFRESH_BATCH)")
+        parser.add_argument('--workers', type=int,
+                            help="Concurrent upstream fetches (default: MARKET_DATA_MAX_WORKERS)")
+        parser.add_argument('--rate', type=float,
+                            help="Upstream calls per second, 0 to disable (default: MARKET_DATA_RATE_LIMIT)")
+    
+    def handle(self, *args, **options):
+        refresher = MarketDataRefresher(
+            interval=options['interval'],
+            untracked_every=options['untracked_every'],
+            batch_size=options['batch_size'],
+            max_workers=options['workers'],
+            rate=options['rate'],
+        )
+        try:
+            # Connections can go stale while the worker sleeps between cycles
+            refresher.run(options['cycles'], on_cycle=self.report, on_error=self.report_error,
+                          before_cycle=close_old_connections)
+        except KeyboardInterrupt:
+            self.stdout.write("Stopped")
+    
+    def report(self, result):
+        self.stdout.write(
+            f"refreshed {result.refreshed}, failed {result.failed}, backing off {result.skipped}, "
+            f"{result.prices} prices, {result.alerts_triggered} alerts triggered in {result.seconds:.1f}s"
+        )
+    
+    def report_error(self, error):
+        self.stderr.write(f"Cycle failed: {error}")
\ No newline at end of file
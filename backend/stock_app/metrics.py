@@ -0,0 +1,335 @@
+# backend/stock_app/metrics.py
+import atexit
+from bisect import bisect_left
+from collections import Counter
+from contextvars import ContextVar
+import json
+import os
+from pathlib import Path
+import re
+import threading
+import time
+import uuid
+
+from django.conf import settings
+
+# Upper bounds of the histogram buckets; +Inf is implied
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# Provider methods timed by TimedProvider
+PROVIDER_METHODS = {'get_info', 'get_history', 'get_quote'}
+ASYNC_PROVIDER_METHODS = {'aget_info', 'aget_history', 'aget_quote'}
+
+class Histogram:
+    """
+    Cumulative-bucket histogram per label set, rendered in the Prometheus
+    text format. Updates take one lock and a bisect, so it can stay on for
+    every request.
+    """
+    def __init__(self, name, help_text, labels, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+    
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # Per-bucket counts (not cumulative), sum, count
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+    
+    def reset(self):
+        with self._lock:
+            self._series = {}
+    
+    def snapshot(self):
+        with self._lock:
+            return [[list(labels), list(counts), total, count] for labels, (counts, total, count) in self._series.items()]
+    
+    def render(self, snapshots=None):
+        """
+        Text lines of the series in `snapshots` (of several processes,
+        summed), or of this process's.
+        """
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        series = {}
+        for snapshot in snapshots if snapshots is not None else [self.snapshot()]:
+            for label_values, counts, total, count in snapshot:
+                merged = series.setdefault(tuple(label_values), [[0] * len(counts), 0.0, 0])
+                merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                merged[1] += total
+                merged[2] += count
+        for label_values, (counts, total, count) in sorted(series.items()):
+            labels = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(self.labels, label_values))
+            cumulative = 0
+            for bound, bucket_count in zip([*self.buckets, '+Inf'], counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{labels}}} {total}')
+            lines.append(f'{self.name}_count{{{labels}}} {count}')
+        return lines
+
+class CounterMetric:
+    """
+    Monotonic counter per label set, rendered in the Prometheus text format.
+    """
+    def __init__(self, name, help_text, labels):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = Counter()
+        self._lock = threading.Lock()
+    
+    def inc(self, amount, *label_values):
+        with self._lock:
+            self._values[label_values] += amount
+    
+    def reset(self):
+        with self._lock:
+            self._values = Counter()
+    
+    def snapshot(self):
+        with self._lock:
+            return [[list(labels), value] for labels, value in self._values.items()]
+    
+    def render(self, snapshots=None):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        values = Counter()
+        for snapshot in snapshots if snapshots is not None else [self.snapshot()]:
+            for label_values, value in snapshot:
+                values[tuple(label_values)] += value
+        for label_values, value in sorted(values.items()):
+            labels = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(self.labels, label_values))
+            lines.append(f'{self.name}{{{labels}}} {value}')
+        return lines
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+REQUESTS = CounterMetric(
+    'stock_app_requests_total', 'Requests by view, method and status code.', ['view', 'method', 'status'])
+REQUEST_DURATION = Histogram(
+    'stock_app_request_duration_seconds', 'Request latency by view.', ['view', 'method'], LATENCY_BUCKETS)
+REQUEST_QUERIES = Histogram(
+    'stock_app_request_queries', 'Database queries per request by view.', ['view', 'method'], QUERY_BUCKETS)
+QUERY_SECONDS = CounterMetric(
+    'stock_app_query_seconds_total', 'Time spent in database queries by view.', ['view', 'method'])
+PROVIDER_SECONDS = CounterMetric(
+    'stock_app_request_provider_seconds_total', 'Time spent waiting on the market data provider by view.',
+    ['view', 'method'])
+PROVIDER_DURATION = Histogram(
+    'stock_app_provider_call_duration_seconds', 'Market data provider call latency by provider method.',
+    ['call', 'outcome'], LATENCY_BUCKETS)
+
+PROVIDER_SHARED = CounterMetric(
+    'stock_app_provider_shared_total',
+    'Provider calls answered without an upstream fetch of their own, by source: '
+    'flight (same process), lease (another worker) or stale (circuit open or shared fetch failed).',
+    ['call', 'source'])
+CONDITIONAL_RESPONSES = CounterMetric(
+    'stock_app_conditional_responses_total',
+    'Responses of ETag-versioned endpoints by how they were produced: '
+    'not_modified (304), cached (replayed from the response cache) or rendered.',
+    ['result'])
+
+REGISTRY = [REQUESTS, REQUEST_DURATION, REQUEST_QUERIES, QUERY_SECONDS, PROVIDER_SECONDS, PROVIDER_DURATION,
+            PROVIDER_SHARED, CONDITIONAL_RESPONSES]
+
+# Shared store for several worker processes, the way prometheus_client's
+# multiprocess mode works: with settings.METRICS_DIR set, every process
+# writes its totals to a file of its own there, at most every
+# METRICS_WRITE_SECONDS and before a scrape, and a scrape sums the files.
+# Files of exited processes are kept, so counters never go backwards; empty
+# the directory when the workers are restarted for a deploy
+_store_lock = threading.Lock()
+_store = {'file': None, 'written': 0.0}
+
+def metrics_dir():
+    directory = getattr(settings, 'METRICS_DIR', None)
+    return Path(directory) if directory else None
+
+def _process_file(directory):
+    # pid plus a random part, so a recycled pid never takes over the totals of an exited process
+    if _store['file'] is None or _store['file'].parent != directory:
+        if _store['file'] is None:
+            # The requests since the last write count too
+            atexit.register(write_metrics, force=True)
+        _store['file'] = directory / f'{os.getpid()}-{uuid.uuid4().hex[:8]}.json'
+    return _store['file']
+
+def write_metrics(force=False):
+    """
+    Write this process's totals to settings.METRICS_DIR, unless they were
+    written less than METRICS_WRITE_SECONDS ago (or there is no directory).
+    """
+    directory = metrics_dir()
+    if directory is None:
+        return
+    with _store_lock:
+        now = time.monotonic()
+        if not force and now - _store['written'] < getattr(settings, 'METRICS_WRITE_SECONDS', 1):
+            return
+        _store['written'] = now
+        directory.mkdir(parents=True, exist_ok=True)
+        path = _process_file(directory)
+        tmp = path.with_suffix('.tmp')
+        with open(tmp, 'w') as f:
+            json.dump({metric.name: metric.snapshot() for metric in REGISTRY}, f)
+        os.replace(tmp, path)
+
+def _stored_snapshots(directory):
+    snapshots = []
+    for path in directory.glob('*.json'):
+        try:
+            with open(path) as f:
+                snapshots.append(json.load(f))
+        except (FileNotFoundError, ValueError):
+            # Replaced or being replaced mid-read; its writer publishes it again
+            continue
+    return snapshots
+
+def render_metrics():
+    """
+    Every metric in the Prometheus text exposition format: the totals of
+    all processes sharing settings.METRICS_DIR, or of this process only.
+    """
+    directory = metrics_dir()
+    if directory is None:
+        return '\n'.join(line for metric in REGISTRY for line in metric.render()) + '\n'
+    write_metrics(force=True)
+    stored = _stored_snapshots(directory)
+    return '\n'.join(
+        line for metric in REGISTRY
+        for line in metric.render([snapshot.get(metric.name, []) for snapshot in stored])
+    ) + '\n'
+
+def reset_metrics():
+    for metric in REGISTRY:
+        metric.reset()
+    with _store_lock:
+        if _store['file'] is not None:
+            _store['file'].unlink(missing_ok=True)
+        _store['file'], _store['written'] = None, 0.0
+
+class RequestCollector:
+    """
+    Database execute wrapper that adds up the queries of one request and
+    their time, keeping the SQL (without parameters) only when asked to.
+    Provider calls made for the request add their time to it too.
+    """
+    def __init__(self, keep_sql=False):
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.provider_seconds = 0.0
+        self.statements = [] if keep_sql else None
+        self._lock = threading.Lock()
+    
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            # Queries can come from fetch_many and sync_to_async worker threads too
+            with self._lock:
+                self.queries += 1
+                self.query_seconds += elapsed
+                if self.statements is not None:
+                    self.statements.append(sql)
+    
+    def add_provider_time(self, seconds):
+        with self._lock:
+            self.provider_seconds += seconds
+
+# A context variable rather than a thread local: under ASGI it follows the
+# request into the threads sync_to_async() runs its queries on
+_collector = ContextVar('stock_app_request_collector', default=None)
+
+def current_collector():
+    return _collector.get()
+
+def set_collector(collector):
+    _collector.set(collector)
+
+def collect_queries(execute, sql, params, many, context):
+    # Execute wrapper on every connection, charging queries to the current request
+    collector = _collector.get()
+    if collector is None:
+        return execute(sql, params, many, context)
+    return collector(execute, sql, params, many, context)
+
+def install_query_collector(sender, connection, **kwargs):
+    """
+    connection_created receiver adding collect_queries() to new connections.
+    """
+    if collect_queries not in connection.execute_wrappers:
+        # First, so the stack of execute_wrapper() blocks open around it is kept
+        connection.execute_wrappers.insert(0, collect_queries)
+
+# Parameter lists of any length share a fingerprint
+IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+NUMBER = re.compile(r'\b\d+\b')
+
+def fingerprint(sql):
+    """
+    SQL with IN lists collapsed and literal numbers replaced, so the same
+    query issued for different rows counts as one statement.
+    """
+    return NUMBER.sub('N', IN_LIST.sub('IN (...)', sql))
+
+def duplicated_queries(statements, limit=5):
+    """
+    [(count, fingerprint)] of statements run more than once, most repeated first.
+    """
+    counts = Counter(fingerprint(sql) for sql in statements)
+    return [(count, sql) for sql, count in counts.most_common(limit) if count > 1]
+
+class TimedProvider:
+    """
+    Wraps a market data provider to time its calls, both process-wide per
+    method and for the request it was created in.
+    """
+    def __init__(self, provider, collector=None):
+        self.provider = provider
+        self.collector = collector
+    
+    def __getattr__(self, name):
+        attribute = getattr(self.provider, name)
+        if name in ASYNC_PROVIDER_METHODS:
+            async def timed(*args, **kwargs):
+                started = time.perf_counter()
+                outcome = 'error'
+                try:
+                    result = await attribute(*args, **kwargs)
+                    outcome = 'ok'
+                    return result
+                finally:
+                    # Counted under the name of the sync method
+                    self.observe(name[1:], outcome, time.perf_counter() - started)
+            return timed
+        if name not in PROVIDER_METHODS:
+            return attribute
+        
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            outcome = 'error'
+            try:
+                result = attribute(*args, **kwargs)
+                outcome = 'ok'
+                return result
+            finally:
+                self.observe(name, outcome, time.perf_counter() - started)
+        return timed
+    
+    def observe(self, name, outcome, elapsed):
+        PROVIDER_DURATION.observe(elapsed, name, outcome)
+        if self.collector is not None:
+            self.collector.add_provider_time(elapsed)
\ No newline at end of file
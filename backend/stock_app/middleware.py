@@ -0,0 +1,83 @@
+# backend/stock_app/middleware.py
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .metrics import (
+    RequestCollector, set_collector, duplicated_queries, write_metrics,
+    REQUESTS, REQUEST_DURATION, REQUEST_QUERIES, QUERY_SECONDS, PROVIDER_SECONDS,
+)
+
+slow_logger = logging.getLogger('stock_app.slow_requests')
+
+class MetricsMiddleware:
+    """
+    Records latency, database query count and time, and market data provider
+    time of every request, labelled by the URL pattern's view name, for
+    /api/metrics/ (shared with the other workers through settings.METRICS_DIR). Requests slower than settings.SLOW_REQUEST_MS (None to
+    disable) are logged with their repeated SQL statements.
+    
+    Works on both handlers, so under ASGI it doesn't force async views onto
+    a thread.
+    """
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.slow_seconds = getattr(settings, 'SLOW_REQUEST_MS', None)
+        if self.slow_seconds is not None:
+            self.slow_seconds /= 1000
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        # SQL text is only kept when it may have to be logged
+        collector = RequestCollector(keep_sql=self.slow_seconds is not None)
+        set_collector(collector)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            set_collector(None)
+        self.record(request, response, collector, time.perf_counter() - started)
+        return response
+    
+    async def __acall__(self, request):
+        collector = RequestCollector(keep_sql=self.slow_seconds is not None)
+        set_collector(collector)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            set_collector(None)
+        self.record(request, response, collector, time.perf_counter() - started)
+        return response
+    
+    def record(self, request, response, collector, elapsed):
+        match = request.resolver_match
+        # Unmatched paths share one label to keep the series bounded
+        view = match.view_name if match else 'unmatched'
+        REQUESTS.inc(1, view, request.method, response.status_code)
+        REQUEST_DURATION.observe(elapsed, view, request.method)
+        REQUEST_QUERIES.observe(collector.queries, view, request.method)
+        QUERY_SECONDS.inc(collector.query_seconds, view, request.method)
+        if collector.provider_seconds:
+            PROVIDER_SECONDS.inc(collector.provider_seconds, view, request.method)
+        write_metrics()
+        
+        if self.slow_seconds is not None and elapsed >= self.slow_seconds:
+            self.log_slow(request, response, elapsed, collector)
+    
+    def log_slow(self, request, response, elapsed, collector):
+        duplicates = ''.join(f'\n  {count}x {sql}' for count, sql in duplicated_queries(collector.statements))
+        slow_logger.warning(
+            "Slow request %s %s -> %s in %.0fms: %d queries in %.0fms, provider %.0fms%s",
+            request.method, request.get_full_path(), response.status_code, elapsed * 1000,
+            collector.queries, collector.query_seconds * 1000, collector.provider_seconds * 1000,
+            duplicates,
+        )
\ No newline at end of file
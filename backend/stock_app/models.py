@@ -34,6 +34,74 @@ class StockPrice(models.Model):
     class Meta:
         ordering = ['-date']
         unique_together = ['stock', 'date']
+        indexes = [
+            # Keyset pages in the default newest-first order (the unique
+            # index already serves oldest-first and per-stock date ranges)
+            models.Index(fields=['stock', '-date'], name='stockprice_stock_date_desc'),
+            # Date filters without a stock
+            models.Index(fields=['date', 'stock'], name='stockprice_date_stock'),
+        ]
+
+class StockStats(models.Model):
+    """
+    Rolling metrics of a stock's stored prices, kept up to date after every
+    price ingest (see stats.refresh_stats) so readers never aggregate StockPrice.
+    """
+    stock = models.OneToOneField(Stock, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    latest_date = models.DateField(blank=True, null=True)
+    latest_close = models.DecimalField(max_digits=12, decimal_places=2, blank=True, null=True)
+    latest_volume = models.BigIntegerField(blank=True, null=True)
+    previous_close = models.DecimalField(max_digits=12, decimal_places=2, blank=True, null=True)
+    # Average volume of the 10 bars before the latest one
+    average_volume = models.FloatField(blank=True, null=True)
+    high_52w = models.DecimalField(max_digits=12, decimal_places=2, blank=True, null=True)
+    low_52w = models.DecimalField(max_digits=12, decimal_places=2, blank=True, null=True)
+    # Percent changes of the latest close over 1 and 21 bars
+    return_1d = models.FloatField(blank=True, null=True)
+    return_1m = models.FloatField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.stock.symbol} stats as of {self.latest_date}"
+    
+    class Meta:
+        verbose_name_plural = "Stock Stats"
+
+class PriceArchive(models.Model):
+    """
+    One stock's daily bars of one calendar year packed into contiguous typed
+    arrays (see archive.py), kept in step with StockPrice after every price
+    ingest so analytics read a few blobs instead of thousands of rows.
+    """
+    stock = models.ForeignKey(Stock, on_delete=models.CASCADE, related_name='archives')
+    year = models.PositiveSmallIntegerField()
+    rows = models.PositiveIntegerField()
+    # Sum of the packed values, so stale years can be found without unpacking
+    checksum = models.BigIntegerField()
+    data = models.BinaryField()
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.stock.symbol} {self.year} ({self.rows} bars)"
+    
+    class Meta:
+        ordering = ['stock_id', 'year']
+        unique_together = ['stock', 'year']
+
+class ResourceVersion(models.Model):
+    """
+    Version of a cacheable API resource: 'stocks' for the stock collection,
+    'stock:<id>' for one stock and its prices. Replaced whenever their rows
+    change; the ETags of read endpoints are derived from it (see conditional.py).
+    'alerts' and 'alerts:<stock id>' tell processes which stocks of their threshold index
+    to reload (see alert_index.py).
+    """
+    key = models.CharField(max_length=50, primary_key=True)
+    version = models.CharField(max_length=32)
+    updated_at = models.DateTimeField()
+    
+    def __str__(self):
+        return f"{self.key} @ {self.version}"
 
 class UserPortfolio(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='portfolios')
@@ -94,6 +162,41 @@ class StockAnalysis(models.Model):
         ordering = ['-created_at']
         verbose_name_plural = "Stock Analyses"
 
+class AlertQuerySet(models.QuerySet):
+    """
+    Bulk writes skip the Alert signals, so they invalidate the threshold
+    index of the stocks they touch themselves (see alert_index.py).
+    """
+    def _invalidate_index(self, stock_ids):
+        from .alert_index import alert_index
+        alert_index.invalidate(stock_ids)
+    
+    def update(self, **kwargs):
+        # The stocks before the update, which may move alerts out of the filter
+        stock_ids = set(self.values_list('stock_id', flat=True).distinct())
+        rows = super().update(**kwargs)
+        if rows:
+            for field in ('stock', 'stock_id'):
+                if field in kwargs:
+                    stock_ids.add(getattr(kwargs[field], 'pk', kwargs[field]))
+            self._invalidate_index(stock_ids)
+        return rows
+    
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        if objs:
+            self._invalidate_index({obj.stock_id for obj in objs})
+        return objs
+    
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        stock_ids = {obj.stock_id for obj in objs}
+        if 'stock' in fields or 'stock_id' in fields:
+            stock_ids.update(self.model.objects.filter(pk__in=[obj.pk for obj in objs]).values_list('stock_id', flat=True))
+        rows = super().bulk_update(objs, fields, *args, **kwargs)
+        if rows:
+            self._invalidate_index(stock_ids)
+        return rows
+
 class Alert(models.Model):
     ALERT_TYPES = (
         ('price_above', 'Price Above'),
@@ -112,6 +215,8 @@ class Alert(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = AlertQuerySet.as_manager()
+    
     def __str__(self):
         return f"{self.stock.symbol} - {self.get_alert_type_display()} - {self.value}"
     
@@ -0,0 +1,111 @@
+# backend/stock_app/pagination.py
+import base64
+from collections import OrderedDict, namedtuple
+from datetime import date
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+Cursor = namedtuple('Cursor', ['stock_id', 'date', 'reverse'])
+
+class StockPriceCursorPagination(BasePagination):
+    """
+    Keyset pagination for StockPrice over (stock_id, date).
+    
+    Rows are ordered by stock_id, then by date (newest first unless
+    ?ordering=date). A page is the next page_size rows after the (stock_id,
+    date) key in an opaque cursor, so with the matching composite index every
+    page costs the same however deep it is. There is no total count.
+    """
+    page_size = api_settings.PAGE_SIZE or 20
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    ordering_param = 'ordering'
+    invalid_cursor_message = 'Invalid cursor'
+    
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+    
+    def encode_cursor(self, cursor):
+        raw = f'{cursor.stock_id}|{cursor.date.isoformat()}|{int(cursor.reverse)}'
+        token = base64.urlsafe_b64encode(raw.encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+    
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            stock_id, day, reverse = base64.urlsafe_b64decode(token.encode()).decode().split('|')
+            return Cursor(int(stock_id), date.fromisoformat(day), reverse == '1')
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+    
+    def paginate_queryset(self, queryset, request, view=None):
+        self.base_url = remove_query_param(request.build_absolute_uri(), self.cursor_query_param)
+        descending = request.query_params.get(self.ordering_param) != 'date'
+        page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        reverse = cursor is not None and cursor.reverse
+        
+        # Paging backwards walks the same order reversed and flips the page afterwards
+        newest_first = descending != reverse
+        queryset = queryset.order_by('-stock_id' if reverse else 'stock_id', '-date' if newest_first else 'date')
+        
+        # One extra row tells whether there is anything beyond this page
+        if cursor is None:
+            rows = list(queryset[:page_size + 1])
+        else:
+            # Two index seeks: the rest of the cursor's stock, then the stocks
+            # after it. Planners can't seek on the OR of both, and would scan
+            # the cursor's stock from its first row instead.
+            rows = list(queryset.filter(
+                stock_id=cursor.stock_id, **{'date__lt' if newest_first else 'date__gt': cursor.date}
+            )[:page_size + 1])
+            if len(rows) <= page_size:
+                rows += queryset.filter(
+                    **{'stock_id__lt' if reverse else 'stock_id__gt': cursor.stock_id}
+                )[:page_size + 1 - len(rows)]
+        
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+        
+        self.next_cursor = self.previous_cursor = None
+        if rows and (has_more if not reverse else cursor is not None):
+            self.next_cursor = Cursor(rows[-1].stock_id, rows[-1].date, False)
+        if rows and (has_more if reverse else cursor is not None):
+            self.previous_cursor = Cursor(rows[0].stock_id, rows[0].date, True)
+        return rows
+    
+    def get_next_link(self):
+        return self.encode_cursor(self.next_cursor) if self.next_cursor else None
+    
+    def get_previous_link(self):
+        return self.encode_cursor(self.previous_cursor) if self.previous_cursor else None
+    
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+    
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
\ No newline at end of file
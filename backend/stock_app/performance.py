@@ -0,0 +1,112 @@
+# backend/stock_app/performance.py
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+from django.db.models import F, FloatField, Sum, Value, Window
+from django.db.models.functions import Cast, Coalesce
+
+from .archive import PRICE_SCALE, archive_arrays
+
+# Calendar days read before the range start, so the first day has a close to carry forward
+LOOKBACK_DAYS = 14
+
+def _float(field):
+    # Do the arithmetic in floating point on every backend
+    return Cast(field, FloatField())
+
+def portfolio_total_value():
+    """
+    Aggregate for UserPortfolio querysets: the market value of all holdings at
+    current prices. Holdings of stocks without a price count as 0.
+    """
+    return Coalesce(Sum(_float('stocks__shares') * _float('stocks__stock__current_price')), Value(0.0))
+
+def portfolio_performance(portfolio):
+    """
+    Investment, current value and gain/loss of every holding of a portfolio,
+    plus portfolio totals, from a single query joined with Stock. The totals
+    are window sums over the whole result, so no second query is needed.
+    Returns None for an empty portfolio.
+    """
+    investment = _float('shares') * _float('purchase_price')
+    current_value = _float('shares') * Coalesce(_float('stock__current_price'), Value(0.0))
+    holdings = list(portfolio.stocks.annotate(
+        investment=investment,
+        current_value=current_value,
+        gain_loss=F('current_value') - F('investment'),
+        total_investment=Window(Sum(investment)),
+        total_value=Window(Sum(current_value)),
+    ).values(
+        'stock__symbol', 'stock__company_name', 'shares', 'purchase_price', 'stock__current_price',
+        'investment', 'current_value', 'gain_loss', 'total_investment', 'total_value',
+    ))
+    if not holdings:
+        return None
+    
+    stocks_data = [{
+        'symbol': holding['stock__symbol'],
+        'company_name': holding['stock__company_name'],
+        'shares': float(holding['shares']),
+        'purchase_price': float(holding['purchase_price']),
+        'current_price': float(holding['stock__current_price'] or 0),
+        'investment': holding['investment'],
+        'current_value': holding['current_value'],
+        'gain_loss': holding['gain_loss'],
+        'gain_loss_percent': (holding['gain_loss'] / holding['investment']) * 100 if holding['investment'] > 0 else 0,
+    } for holding in holdings]
+    
+    total_investment = holdings[0]['total_investment']
+    current_value = holdings[0]['total_value']
+    total_gain_loss = current_value - total_investment
+    
+    return {
+        'portfolio_name': portfolio.name,
+        'total_investment': total_investment,
+        'current_value': current_value,
+        'total_gain_loss': total_gain_loss,
+        'total_gain_loss_percent': (total_gain_loss / total_investment) * 100 if total_investment > 0 else 0,
+        'stocks': stocks_data,
+    }
+
+def _empty_history():
+    return pd.DataFrame({'value': [], 'investment': []}, index=pd.DatetimeIndex([], name='date'))
+
+def portfolio_value_history(portfolio, start, end):
+    """
+    Daily market value of a portfolio from `start` to `end` (inclusive) as a
+    DataFrame indexed by trading day, with 'value' and 'investment' columns.
+    
+    Holdings count from their purchase_date on and are valued at the stock's
+    latest close on or before each day. Closes are loaded in one query,
+    pivoted into a day x holding matrix and multiplied by the shares held,
+    so there is no per-day or per-holding loop.
+    """
+    holdings = list(portfolio.stocks.values_list('stock_id', 'shares', 'purchase_price', 'purchase_date'))
+    if not holdings:
+        return _empty_history()
+    stock_ids, shares, purchase_prices, purchase_dates = zip(*holdings)
+    
+    # Closes come from the packed archive: a few blobs per stock instead of
+    # a row per stock and day
+    archived = archive_arrays(set(stock_ids), start - timedelta(days=LOOKBACK_DAYS), end)
+    if not archived:
+        return _empty_history()
+    
+    # One column per holding (a stock may be held more than once), carried
+    # forward over days a stock didn't trade
+    matrix = pd.DataFrame({
+        stock_id: pd.Series(prices[3] / PRICE_SCALE, index=days.astype('datetime64[ns]'))
+        for stock_id, (days, prices, _) in archived.items()
+    }).sort_index().ffill()
+    matrix = matrix.reindex(columns=list(stock_ids))
+    matrix = matrix[matrix.index >= pd.Timestamp(start)]
+    matrix.index.name = 'date'
+    
+    held = matrix.index.values[:, None] >= np.array(purchase_dates, dtype='datetime64[D]')[None, :]
+    positions = held * np.array(shares, dtype=float)
+    
+    return pd.DataFrame({
+        'value': np.nansum(matrix.to_numpy() * positions, axis=1),
+        'investment': positions @ np.array(purchase_prices, dtype=float),
+    }, index=matrix.index)
\ No newline at end of file
@@ -0,0 +1,257 @@
+# backend/stock_app/price_matrix.py
+from contextlib import contextmanager
+import json
+import os
+from pathlib import Path
+import threading
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from .archive import PRICE_SCALE, archive_arrays
+from .models import Stock, StockPrice
+
+try:
+    import fcntl
+except ImportError:  # Not on Windows; writers are then not serialised across processes
+    fcntl = None
+
+INDEX_FILE = 'index.json'
+LOCK_FILE = '.lock'
+
+# Arrays of a build, saved as <name>.<generation>.npy. A rebuild writes a new
+# generation, so a reader never pairs an index with files of another build
+ARRAYS = ['dates', 'closes', 'volumes']
+
+# Spare date rows allocated on every build, so about a year of appended bars
+# is written in place before the files have to be rebuilt
+SPARE_ROWS = 260
+
+# Stocks read from the archive per batch while building
+CHUNK_SIZE = 200
+
+def matrix_dir():
+    return Path(getattr(settings, 'PRICE_MATRIX_DIR', Path(settings.BASE_DIR) / 'price_matrix'))
+
+@contextmanager
+def _writer_lock(directory):
+    directory.mkdir(parents=True, exist_ok=True)
+    with open(directory / LOCK_FILE, 'w') as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+def _read_index(directory):
+    try:
+        with open(directory / INDEX_FILE) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def _write_index(directory, index):
+    # Readers only look at rows the index covers, so it is replaced last and atomically
+    tmp = directory / f'{INDEX_FILE}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp, directory / INDEX_FILE)
+
+def _path(directory, index, name):
+    return directory / f"{name}.{index['generation']}.npy"
+
+def _column(dates, days, prices, stock_volumes):
+    """
+    The close and volume columns of one stock over `dates`, NaN and 0 where
+    it has no bar. Bars on dates without a row are left out.
+    """
+    rows = np.searchsorted(dates, days)
+    on_row = rows < len(dates)
+    on_row[on_row] = dates[rows[on_row]] == days[on_row]
+    closes = np.full(len(dates), np.nan)
+    volumes = np.zeros(len(dates), dtype='int64')
+    closes[rows[on_row]] = prices[4][on_row] / PRICE_SCALE
+    volumes[rows[on_row]] = stock_volumes[on_row]
+    return closes, volumes
+
+def _fill(closes, volumes, dates, columns, arrays):
+    # Each column is built aside and then copied in with one assignment, so
+    # a reader of the mapped file sees old or new bars but never a wiped column
+    for stock_id, (days, prices, stock_volumes) in arrays.items():
+        close_column, volume_column = _column(dates, days, prices, stock_volumes)
+        closes[:len(dates), columns[stock_id]] = close_column
+        volumes[:len(dates), columns[stock_id]] = volume_column
+
+def build_price_matrix(directory=None):
+    """
+    Write the date x symbol matrices of adjusted closes (float64, NaN where a
+    stock has no bar) and volumes (int64, 0 where missing) of every stock as
+    .npy files, with the symbols and row count in index.json. A rebuild
+    writes new files and then swaps the index, so readers never see a
+    half-built matrix. Returns the index.
+    """
+    directory = Path(directory or matrix_dir())
+    with _writer_lock(directory):
+        return _build(directory)
+
+def _build(directory):
+    previous = _read_index(directory)
+    stocks = list(Stock.objects.order_by('symbol').values_list('pk', 'symbol'))
+    dates = np.array(
+        list(StockPrice.objects.order_by('date').values_list('date', flat=True).distinct()), dtype='datetime64[D]'
+    )
+    columns = {stock_id: column for column, (stock_id, _) in enumerate(stocks)}
+    index = {
+        'generation': previous['generation'] + 1 if previous else 1,
+        'rows': len(dates),
+        'capacity': len(dates) + SPARE_ROWS,
+        'symbols': [symbol for _, symbol in stocks],
+        'stock_ids': [stock_id for stock_id, _ in stocks],
+    }
+    
+    shape = (index['capacity'], len(stocks))
+    stored_dates = np.lib.format.open_memmap(_path(directory, index, 'dates'), mode='w+',
+                                             dtype='datetime64[D]', shape=shape[:1])
+    closes = np.lib.format.open_memmap(_path(directory, index, 'closes'), mode='w+', dtype='float64', shape=shape)
+    volumes = np.lib.format.open_memmap(_path(directory, index, 'volumes'), mode='w+', dtype='int64', shape=shape)
+    stored_dates[:len(dates)] = dates
+    closes[:] = np.nan
+    volumes[:] = 0
+    
+    stock_ids = list(columns)
+    for i in range(0, len(stock_ids), CHUNK_SIZE):
+        _fill(closes, volumes, dates, columns, archive_arrays(stock_ids[i:i + CHUNK_SIZE]))
+    for array in [stored_dates, closes, volumes]:
+        array.flush()
+    del stored_dates, closes, volumes
+    
+    _write_index(directory, index)
+    if previous:
+        # Processes still mapping the old files keep them until they reopen
+        for name in ARRAYS:
+            _path(directory, previous, name).unlink(missing_ok=True)
+    return index
+
+def update_price_matrix(stock_ids=None, directory=None):
+    """
+    Rewrite the columns of the given stocks (all if None) in place from their
+    archived bars, so revisions of older bars are picked up, appending date
+    rows after the last stored date as needed. Never rebuilds: new stocks,
+    bars on older dates without a row, or more new dates than spare rows
+    mark the matrix stale until build_price_matrix runs (the management
+    command). Does nothing if the matrix has never been built. Returns the
+    index, or None.
+    """
+    directory = Path(directory or matrix_dir())
+    if _read_index(directory) is None:
+        return None
+    
+    with _writer_lock(directory):
+        index = _read_index(directory)
+        columns = {stock_id: column for column, stock_id in enumerate(index['stock_ids'])}
+        stock_ids = list(stock_ids) if stock_ids is not None else list(columns)
+        missing = [stock_id for stock_id in stock_ids if stock_id not in columns]
+        if missing and Stock.objects.filter(pk__in=missing).exists():
+            index['stale'] = True
+        stock_ids = [stock_id for stock_id in stock_ids if stock_id in columns]
+        if not stock_ids:
+            _write_index(directory, index)
+            return index
+        arrays = archive_arrays(stock_ids)
+        
+        stored_dates = np.load(_path(directory, index, 'dates'), mmap_mode='r+')
+        rows = index['rows']
+        new_dates = np.setdiff1d(
+            np.concatenate([days for days, _, _ in arrays.values()] or [np.array([], dtype='datetime64[D]')]),
+            stored_dates[:rows],
+        )
+        if rows:
+            # Rows can only be added after the last one
+            if new_dates.size and new_dates[0] < stored_dates[rows - 1]:
+                index['stale'] = True
+            new_dates = new_dates[new_dates > stored_dates[rows - 1]]
+        if rows + len(new_dates) > index['capacity']:
+            index['stale'] = True
+            new_dates = new_dates[:0]
+        
+        stored_dates[rows:rows + len(new_dates)] = new_dates
+        dates = stored_dates[:rows + len(new_dates)]
+        closes = np.load(_path(directory, index, 'closes'), mmap_mode='r+')
+        volumes = np.load(_path(directory, index, 'volumes'), mmap_mode='r+')
+        # Whole columns, so revised and deleted bars before the last stored date are replaced too
+        _fill(closes, volumes, dates, columns, arrays)
+        for array in [stored_dates, closes, volumes]:
+            array.flush()
+        
+        index['rows'] = len(dates)
+        _write_index(directory, index)
+        return index
+
+class PriceMatrix:
+    """
+    Read-only view of the stored matrices. The .npy files are memory-mapped,
+    so every process reading them shares the same pages of the OS cache.
+    `stale` is set once update_price_matrix() has seen prices it could not
+    write in place; build_price_matrix() clears it.
+    """
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        index = _read_index(self.directory)
+        if index is None:
+            raise FileNotFoundError(f"No price matrix in {self.directory}; run build_price_matrix")
+        self.rows = index['rows']
+        self.stale = index.get('stale', False)
+        self.symbols = index['symbols']
+        self.columns = {symbol: column for column, symbol in enumerate(self.symbols)}
+        self.dates = np.load(_path(self.directory, index, 'dates'), mmap_mode='r')[:self.rows]
+        self._closes = np.load(_path(self.directory, index, 'closes'), mmap_mode='r')
+        self._volumes = np.load(_path(self.directory, index, 'volumes'), mmap_mode='r')
+    
+    def _select(self, matrix, symbols=None, start=None, end=None):
+        first = np.searchsorted(self.dates, np.datetime64(start, 'D')) if start is not None else 0
+        last = np.searchsorted(self.dates, np.datetime64(end, 'D'), side='right') if end is not None else self.rows
+        if symbols is None:
+            return self.dates[first:last], list(self.symbols), matrix[first:last]
+        unknown = [symbol for symbol in symbols if symbol not in self.columns]
+        if unknown:
+            raise KeyError(f"Not in the price matrix: {', '.join(unknown)}")
+        return self.dates[first:last], list(symbols), matrix[first:last, [self.columns[s] for s in symbols]]
+    
+    def closes(self, symbols=None, start=None, end=None):
+        """
+        (dates, symbols, dates x symbols adjusted closes) between `start` and
+        `end` inclusive. Without symbols the result is a view of the mapped file.
+        """
+        return self._select(self._closes, symbols, start, end)
+    
+    def volumes(self, symbols=None, start=None, end=None):
+        return self._select(self._volumes, symbols, start, end)
+    
+    def frame(self, field='close', symbols=None, start=None, end=None):
+        dates, symbols, values = (self.closes if field == 'close' else self.volumes)(symbols, start, end)
+        return pd.DataFrame(values, index=pd.DatetimeIndex(dates.astype('datetime64[ns]'), name='date'),
+                            columns=symbols)
+
+_open_matrices = {}
+_open_lock = threading.Lock()
+
+def get_price_matrix(directory=None):
+    """
+    The PriceMatrix of `directory`, opened once per process and reopened when
+    a writer has replaced its index. Raises FileNotFoundError if there is none.
+    """
+    directory = Path(directory or matrix_dir())
+    with _open_lock:
+        for attempt in range(3):
+            version = os.stat(directory / INDEX_FILE).st_mtime_ns
+            opened = _open_matrices.get(directory)
+            if opened is not None and opened[0] == version:
+                return opened[1]
+            try:
+                matrix = PriceMatrix(directory)
+            except FileNotFoundError:
+                # A rebuild removed the files between reading the index and mapping them
+                if attempt == 2:
+                    raise
+                continue
+            _open_matrices[directory] = (version, matrix)
+            return matrix
\ No newline at end of file
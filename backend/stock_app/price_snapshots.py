@@ -0,0 +1,71 @@
+# backend/stock_app/price_snapshots.py
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from .conditional import stock_resource
+from .models import ResourceVersion, StockPrice
+
+KEY_PREFIX = 'recent_prices'
+
+# Bars kept per stock; clients can ask for up to this many
+SNAPSHOT_BARS = 100
+
+# Bars embedded in the stock detail when the client doesn't say
+DEFAULT_BARS = 30
+
+PRICE_FIELDS = ['date', 'open_price', 'high_price', 'low_price', 'close_price', 'adjusted_close', 'volume']
+
+def _key(stock_id):
+    return f'{KEY_PREFIX}:{stock_id}'
+
+def _serialize(bar):
+    # Same output as StockPriceListSerializer, so cached and live data look alike
+    return {
+        field: bar[field].isoformat() if field == 'date' else bar[field] if field == 'volume' else str(bar[field])
+        for field in PRICE_FIELDS
+    }
+
+def _versions(stock_ids):
+    keys = {stock_resource(stock_id): stock_id for stock_id in stock_ids}
+    versions = dict(ResourceVersion.objects.filter(pk__in=list(keys)).values_list('key', 'version'))
+    return {stock_id: versions.get(key, '0') for key, stock_id in keys.items()}
+
+def refresh_snapshots(stock_ids):
+    """
+    Rebuild the cached newest-first "last SNAPSHOT_BARS bars" snapshot of the
+    given stocks with one query, tagged with the stock versions it was built
+    from. Stocks without prices get an empty snapshot, so they aren't looked
+    up again. Returns {stock_id: snapshot}.
+    """
+    stock_ids = list(stock_ids)
+    if not stock_ids:
+        return {}
+    
+    versions = _versions(stock_ids)
+    bars = defaultdict(list)
+    recent = StockPrice.objects.filter(stock_id__in=stock_ids).annotate(
+        row_number=Window(RowNumber(), partition_by=[F('stock_id')], order_by=F('date').desc())
+    ).filter(row_number__lte=SNAPSHOT_BARS).order_by('stock_id', 'row_number').values('stock_id', *PRICE_FIELDS)
+    for bar in recent:
+        bars[bar['stock_id']].append(_serialize(bar))
+    
+    # The default cache is per process: the version tells a worker when
+    # another one has written prices since it built its copy
+    cache.set_many({_key(stock_id): (versions[stock_id], bars.get(stock_id, [])) for stock_id in stock_ids}, None)
+    return {stock_id: bars.get(stock_id, []) for stock_id in stock_ids}
+
+def recent_prices(stock_id, count=DEFAULT_BARS):
+    """
+    The stock's newest `count` bars (at most SNAPSHOT_BARS) as serialized
+    dicts, newest first. One version lookup; StockPrice is only read if the
+    snapshot isn't cached or was built from an older version of the stock.
+    """
+    entry = cache.get(_key(stock_id))
+    if entry is not None and entry[0] == _versions([stock_id])[stock_id]:
+        snapshot = entry[1]
+    else:
+        snapshot = refresh_snapshots([stock_id])[stock_id]
+    return snapshot[:count]
\ No newline at end of file
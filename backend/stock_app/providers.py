@@ -0,0 +1,313 @@
+# backend/stock_app/providers.py
+import asyncio
+from pathlib import Path
+import random
+import threading
+import time
+import zlib
+
+import numpy as np
+import pandas as pd
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+import yfinance as yf
+
+from .metrics import TimedProvider, current_collector
+from .resampling import resample_ohlcv
+from .synthetic import synthetic_history
+from .upstream import SharedProvider
+
+DEFAULT_PROVIDER = 'stock_app.providers.YahooFinanceProvider'
+
+HISTORY_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+class MarketDataProvider:
+    """
+    Interface of market data sources. get_info() returns a metadata dict in
+    the shape of yfinance's Ticker.info (empty or without 'symbol' if the
+    symbol is unknown), get_history() a DataFrame indexed by Date with
+    Open/High/Low/Close/Volume columns.
+    
+    aget_info(), aget_history() and aget_quote() are their awaitable
+    versions for async views. By default they run the blocking call on a
+    worker thread; providers with non-blocking I/O override them.
+    """
+    def get_info(self, symbol):
+        raise NotImplementedError
+    
+    def get_history(self, symbol, period=None, interval='1d', start=None, end=None):
+        raise NotImplementedError
+    
+    def get_quote(self, symbol):
+        """
+        Latest price, previous close and volume as a dict, or None if the
+        symbol is unknown. Providers with a cheaper quote call override this.
+        """
+        return self._quote_from_info(self.get_info(symbol))
+    
+    @staticmethod
+    def _quote_from_info(info):
+        if not info or 'symbol' not in info:
+            return None
+        return {
+            'symbol': info['symbol'],
+            'price': info.get('currentPrice', info.get('regularMarketPrice')),
+            'previous_close': info.get('previousClose'),
+            'volume': info.get('volume'),
+        }
+    
+    # thread_sensitive=False: slow upstream calls mustn't queue behind each
+    # other on the one thread that sync code shares under ASGI
+    async def aget_info(self, symbol):
+        return await sync_to_async(self.get_info, thread_sensitive=False)(symbol)
+    
+    async def aget_history(self, symbol, **kwargs):
+        return await sync_to_async(self.get_history, thread_sensitive=False)(symbol, **kwargs)
+    
+    async def aget_quote(self, symbol):
+        return await sync_to_async(self.get_quote, thread_sensitive=False)(symbol)
+
+class TimeoutSession(requests.Session):
+    """
+    requests session whose calls never wait longer than `timeout` seconds
+    for a connection or a read, whatever timeout the caller asks for.
+    """
+    def __init__(self, timeout):
+        super().__init__()
+        self.timeout = timeout
+    
+    def request(self, *args, **kwargs):
+        requested = kwargs.get('timeout')
+        kwargs['timeout'] = min(requested, self.timeout) if requested else self.timeout
+        return super().request(*args, **kwargs)
+
+class YahooFinanceProvider(MarketDataProvider):
+    """
+    Market data from Yahoo Finance through yfinance. Every HTTP request is
+    cut off after settings.MARKET_DATA_TIMEOUT seconds, so a hung call can't
+    hold a fetch worker indefinitely.
+    """
+    def __init__(self, timeout=None):
+        self.timeout = timeout or getattr(settings, 'MARKET_DATA_TIMEOUT', 20)
+        self.session = TimeoutSession(self.timeout)
+    
+    def _ticker(self, symbol):
+        return yf.Ticker(symbol, session=self.session)
+    
+    def get_info(self, symbol):
+        return self._ticker(symbol).info
+    
+    def get_history(self, symbol, **kwargs):
+        # kwargs are passed through to Ticker.history (period, interval, start, end)
+        kwargs.setdefault('timeout', self.timeout)
+        return self._ticker(symbol).history(**kwargs)
+    
+    def get_quote(self, symbol):
+        # fast_info skips the full quoteSummary request behind .info
+        fast_info = self._ticker(symbol).fast_info
+        try:
+            price = fast_info['last_price']
+        except KeyError:
+            return None
+        return {
+            'symbol': symbol,
+            'price': price,
+            'previous_close': fast_info.get('previous_close'),
+            'volume': fast_info.get('last_volume'),
+        }
+
+class ReplayProvider(MarketDataProvider):
+    """
+    Offline, deterministic provider for benchmarks and load tests.
+    
+    Daily bars of SYMBOL come from SYMBOL.parquet or SYMBOL.csv in `path`
+    (a Date index or first column plus Open/High/Low/Close/Volume), or, when
+    there is no fixture and `synthetic` is on, from a random walk seeded by
+    the symbol that ends today. Periods count back from the last bar.
+    
+    Every call sleeps `latency` seconds plus up to `jitter` more, and fails
+    with ConnectionError at `error_rate` or always for `fail_symbols`; the
+    random draws come from `seed`, so a run can be repeated exactly.
+    Keyword arguments default to the keys of settings.MARKET_DATA_REPLAY.
+    """
+    # get_provider() hands out one instance per process, so loaded frames and
+    # the random sequence carry over between requests
+    shared = True
+    
+    defaults = {
+        'path': None,
+        'synthetic': True,
+        'synthetic_rows': 2520,
+        'latency': 0.0,
+        'jitter': 0.0,
+        'error_rate': 0.0,
+        'fail_symbols': (),
+        'seed': 0,
+    }
+    
+    def __init__(self, **options):
+        unknown = set(options) - set(self.defaults)
+        if unknown:
+            raise TypeError(f"Unknown ReplayProvider options: {', '.join(sorted(unknown))}")
+        config = {**self.defaults, **getattr(settings, 'MARKET_DATA_REPLAY', {}), **options}
+        
+        self.path = Path(config['path']) if config['path'] else None
+        self.synthetic = config['synthetic']
+        self.synthetic_rows = config['synthetic_rows']
+        self.latency = config['latency']
+        self.jitter = config['jitter']
+        self.error_rate = config['error_rate']
+        self.fail_symbols = set(config['fail_symbols'])
+        self.seed = config['seed']
+        
+        self._random = random.Random(self.seed)
+        self._lock = threading.Lock()
+        self._frames = {}
+        self.calls = 0
+    
+    def _draw(self):
+        # Simulated network round trip and failure of one call
+        with self._lock:
+            self.calls += 1
+            delay = self.latency + self._random.random() * self.jitter
+            failed = self._random.random() < self.error_rate
+        return delay, failed
+    
+    def _check(self, symbol, failed):
+        if failed or symbol in self.fail_symbols:
+            raise ConnectionError(f"Replay error injected for {symbol}")
+    
+    def _call(self, symbol):
+        delay, failed = self._draw()
+        if delay:
+            time.sleep(delay)
+        self._check(symbol, failed)
+    
+    async def _acall(self, symbol):
+        # Waits without holding a thread, like a non-blocking HTTP client
+        delay, failed = self._draw()
+        if delay:
+            await asyncio.sleep(delay)
+        self._check(symbol, failed)
+    
+    def _load(self, symbol):
+        for suffix, read in [('.parquet', pd.read_parquet), ('.csv', self._read_csv)]:
+            path = self.path / f'{symbol}{suffix}' if self.path else None
+            if path and path.exists():
+                hist = read(path)
+                hist.index = pd.DatetimeIndex(pd.to_datetime(hist.index), name='Date')
+                return hist[HISTORY_COLUMNS].sort_index()
+        if self.synthetic:
+            return synthetic_history(self.synthetic_rows, seed=zlib.crc32(symbol.encode()) ^ self.seed,
+                                     end=timezone.localdate())
+        return None
+    
+    @staticmethod
+    def _read_csv(path):
+        return pd.read_csv(path, index_col=0, parse_dates=[0])
+    
+    def history_frame(self, symbol):
+        """
+        Every daily bar of a symbol, or None if there is nothing to replay.
+        Frames are read once and kept for the provider's lifetime.
+        """
+        with self._lock:
+            if symbol not in self._frames:
+                self._frames[symbol] = self._load(symbol)
+            return self._frames[symbol]
+    
+    def get_info(self, symbol):
+        self._call(symbol)
+        return self._info(symbol)
+    
+    def _info(self, symbol):
+        hist = self.history_frame(symbol)
+        if hist is None or hist.empty:
+            return {}
+        return {
+            'symbol': symbol,
+            'shortName': f'{symbol} (replay)',
+            'sector': 'Replay',
+            'industry': 'Replay',
+            'marketCap': int(hist['Close'].iloc[-1] * 1_000_000),
+            'currentPrice': float(hist['Close'].iloc[-1]),
+            'previousClose': float(hist['Close'].iloc[-2]) if len(hist) > 1 else None,
+            'volume': int(hist['Volume'].iloc[-1]),
+        }
+    
+    def get_history(self, symbol, period=None, interval='1d', start=None, end=None):
+        self._call(symbol)
+        return self._history(symbol, period, interval, start, end)
+    
+    def _history(self, symbol, period, interval, start, end):
+        # Imported here: history_cache imports this module
+        from .history_cache import period_start
+        
+        hist = self.history_frame(symbol)
+        if hist is None or hist.empty:
+            return pd.DataFrame(columns=HISTORY_COLUMNS, index=pd.DatetimeIndex([], name='Date'))
+        
+        dates = hist.index.tz_localize(None) if hist.index.tz is not None else hist.index
+        mask = np.ones(len(hist), dtype=bool)
+        if start is not None:
+            mask &= dates >= pd.Timestamp(start)
+        if end is not None:
+            # Like yfinance, `end` is exclusive
+            mask &= dates < pd.Timestamp(end)
+        if start is None and end is None and period:
+            first = period_start(period, dates[-1].date())
+            if first is not None:
+                mask &= dates >= pd.Timestamp(first)
+        hist = hist[mask]
+        
+        if interval == '1d':
+            return hist.copy()
+        if interval in ('1wk', '1mo', '3mo', '5d'):
+            return resample_ohlcv(hist, interval)
+        # No intraday bars to replay
+        return hist.iloc[:0].copy()
+    
+    async def aget_info(self, symbol):
+        await self._acall(symbol)
+        return self._info(symbol)
+    
+    async def aget_history(self, symbol, period=None, interval='1d', start=None, end=None):
+        await self._acall(symbol)
+        return self._history(symbol, period, interval, start, end)
+    
+    async def aget_quote(self, symbol):
+        return self._quote_from_info(await self.aget_info(symbol))
+
+_shared_providers = {}
+_shared_lock = threading.Lock()
+
+def get_provider():
+    """
+    Return an instance of the provider class named by settings.MARKET_DATA_PROVIDER,
+    wrapped in a SharedProvider and a TimedProvider. Classes with `shared = True` are instantiated
+    once per process.
+    """
+    path = getattr(settings, 'MARKET_DATA_PROVIDER', DEFAULT_PROVIDER)
+    provider_class = import_string(path)
+    if not getattr(provider_class, 'shared', False):
+        provider = provider_class()
+    else:
+        with _shared_lock:
+            if path not in _shared_providers:
+                _shared_providers[path] = provider_class()
+            provider = _shared_providers[path]
+    # Concurrent identical calls share one fetch, and a circuit breaker
+    # holds calls back while upstream fails. Calls are timed for
+    # /api/metrics/ and charged to the current request
+    return TimedProvider(SharedProvider(provider), current_collector())
+
+def reset_providers():
+    """
+    Drop the shared provider instances, so the next get_provider() builds
+    them from the current settings.
+    """
+    with _shared_lock:
+        _shared_providers.clear()
\ No newline at end of file
@@ -0,0 +1,175 @@
+# backend/stock_app/refresher.py
+from collections import namedtuple
+import time
+
+from django.conf import settings
+from django.db.models import Case, Exists, IntegerField, OuterRef, Value, When
+from django.utils import timezone
+
+from .alerts import evaluate_alerts
+from .fetching import fetch_many, history_window
+from .ingestion import upsert_stocks, ingest_price_histories
+from .models import Stock, PortfolioStock, WatchList, Alert
+from .providers import get_provider
+from .signals import process_price_changes
+
+# Priorities of tracked symbols (in an active alert, portfolio or watchlist) and the rest
+TRACKED, UNTRACKED = 0, 1
+
+# Days of daily bars re-fetched per symbol each cycle; enough to cover a
+# long weekend and revisions of the last few bars
+REFRESH_DAYS = 7
+
+CycleResult = namedtuple('CycleResult', ['refreshed', 'failed', 'skipped', 'prices', 'alerts_triggered', 'seconds'])
+
+def prioritized_symbols():
+    """
+    [(symbol, priority)] for every Stock: tracked symbols first, then the
+    rest, each group least recently updated first.
+    """
+    stock = OuterRef('pk')
+    tracked = (
+        Exists(Alert.objects.filter(stock=stock, is_active=True, triggered=False))
+        | Exists(PortfolioStock.objects.filter(stock=stock))
+        | Exists(WatchList.stocks.through.objects.filter(stock=stock))
+    )
+    return list(Stock.objects.annotate(priority=Case(
+        When(tracked, then=Value(TRACKED)), default=Value(UNTRACKED), output_field=IntegerField(),
+    )).order_by('priority', 'date_updated', 'symbol').values_list('symbol', 'priority'))
+
+class Backoff:
+    """
+    Exponential backoff per symbol: after n consecutive failures a symbol is
+    skipped for base * 2 ** (n - 1) seconds, capped at `maximum`. A success
+    clears it.
+    """
+    def __init__(self, base, maximum, clock=time.monotonic):
+        self.base = base
+        self.maximum = maximum
+        self.clock = clock
+        self._failures = {}
+    
+    def ready(self, symbol):
+        failure = self._failures.get(symbol)
+        return failure is None or self.clock() >= failure[1]
+    
+    def failed(self, symbol):
+        count = self._failures.get(symbol, (0, None))[0] + 1
+        delay = min(self.base * 2 ** (count - 1), self.maximum)
+        self._failures[symbol] = (count, self.clock() + delay)
+        return delay
+    
+    def succeeded(self, symbol):
+        self._failures.pop(symbol, None)
+    
+    def failures(self, symbol):
+        return self._failures.get(symbol, (0, None))[0]
+
+class MarketDataRefresher:
+    """
+    Refreshes quotes and recent daily bars of every Stock in cycles.
+    
+    Each cycle fetches tracked symbols, plus untracked ones every
+    `untracked_every` cycles, at most `batch_size` of them in priority order,
+    through fetch_many() (bounded concurrency, rate limit, per-symbol timeout).
+    Symbols that failed are backed off exponentially. Results are written with
+    one bulk stock upsert and one bulk price upsert, whose commit hook refreshes
+    current prices and stats and evaluates the alerts of the refreshed stocks.
+    Every cycle ends by evaluating all alerts against the database.
+    """
+    def __init__(self, provider=None, interval=None, untracked_every=None, batch_size=None,
+                 max_workers=None, rate=None, timeout=None, backoff_base=None, backoff_max=None,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.provider = provider or get_provider()
+        self.interval = interval if interval is not None else getattr(settings, 'MARKET_DATA_REFRESH_INTERVAL', 300)
+        self.untracked_every = untracked_every or getattr(settings, 'MARKET_DATA_UNTRACKED_EVERY', 6)
+        self.batch_size = batch_size or getattr(settings, 'MARKET_DATA_REFRESH_BATCH', 500)
+        self.max_workers = max_workers
+        self.rate = rate
+        self.timeout = timeout
+        self.backoff = Backoff(
+            backoff_base if backoff_base is not None else getattr(settings, 'MARKET_DATA_BACKOFF_BASE', 60),
+            backoff_max if backoff_max is not None else getattr(settings, 'MARKET_DATA_BACKOFF_MAX', 3600),
+            clock,
+        )
+        self.clock = clock
+        self.sleep = sleep
+        self.cycles = 0
+    
+    def due_symbols(self, cycle=0):
+        """
+        Symbols to fetch in the given cycle, in priority order, and the number
+        of symbols skipped because they are backing off.
+        """
+        include_untracked = cycle % self.untracked_every == 0
+        due = []
+        skipped = 0
+        for symbol, priority in prioritized_symbols():
+            if priority == UNTRACKED and not include_untracked:
+                continue
+            if not self.backoff.ready(symbol):
+                skipped += 1
+                continue
+            due.append(symbol)
+        return due[:self.batch_size], skipped
+    
+    def run_cycle(self):
+        """
+        Fetch and store one cycle of market data. Returns a CycleResult.
+        """
+        started, cycle_start = self.clock(), timezone.now()
+        cycle = self.cycles
+        self.cycles += 1
+        symbols, skipped = self.due_symbols(cycle)
+        
+        fetched = fetch_many(symbols, provider=self.provider, max_workers=self.max_workers,
+                             timeout=self.timeout, rate=self.rate,
+                             history_kwargs=history_window(REFRESH_DAYS)) if symbols else []
+        succeeded = [result for result in fetched if result.error is None]
+        for result in fetched:
+            if result.error is None:
+                self.backoff.succeeded(result.symbol)
+            else:
+                self.backoff.failed(result.symbol)
+        
+        stocks = upsert_stocks({result.symbol: result.info for result in succeeded})
+        written = ingest_price_histories((stocks[result.symbol], result.history) for result in succeeded)
+        
+        # The commit hook has already refreshed stats and evaluated alerts for
+        # the new prices, unless the cycle runs inside a transaction
+        process_price_changes()
+        # Then every alert, so ones written since the last cycle fire against
+        # the prices already stored even when their stock was not refreshed
+        evaluate_alerts()
+        alerts_triggered = Alert.objects.filter(triggered_at__gte=cycle_start).count()
+        return CycleResult(
+            refreshed=len(succeeded),
+            failed=len(fetched) - len(succeeded),
+            skipped=skipped,
+            prices=sum(written.values()),
+            alerts_triggered=alerts_triggered,
+            seconds=self.clock() - started,
+        )
+    
+    def run(self, cycles=None, on_cycle=None, on_error=None, before_cycle=None):
+        """
+        Run cycles every `interval` seconds, `cycles` times or forever.
+        A cycle that raises is reported to `on_error` and the loop carries on.
+        """
+        while cycles is None or self.cycles < cycles:
+            started = self.clock()
+            if before_cycle:
+                before_cycle()
+            try:
+                result = self.run_cycle()
+            except Exception as e:
+                if on_error is None:
+                    raise
+                on_error(e)
+            else:
+                if on_cycle:
+                    on_cycle(result)
+            
+            if cycles is not None and self.cycles >= cycles:
+                break
+            self.sleep(max(0, self.interval - (self.clock() - started)))
\ No newline at end of file
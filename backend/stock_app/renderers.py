@@ -0,0 +1,9 @@
+# backend/stock_app/renderers.py
+from rest_framework.renderers import JSONRenderer
+
+class ColumnarJSONRenderer(JSONRenderer):
+    """
+    Plain JSON selected with ?format=columnar. Views check
+    request.accepted_renderer.format to return column lists instead of rows.
+    """
+    format = 'columnar'
\ No newline at end of file
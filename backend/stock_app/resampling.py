@@ -0,0 +1,95 @@
+# backend/stock_app/resampling.py
+import re
+
+import numpy as np
+import pandas as pd
+
+# Bar sizes accepted by resample_ohlcv() besides 'Nd', as pandas offsets
+INTERVAL_RULES = {
+    '1wk': 'W',
+    '1mo': 'MS',
+    '3mo': 'QS',
+}
+
+N_DAYS = re.compile(r'^([1-9][0-9]{0,2})d$')
+
+def interval_rule(interval):
+    """
+    pandas rule for '1wk', '1mo', '3mo' or 'Nd' (N calendar days), or None
+    if the interval isn't supported.
+    """
+    if interval in INTERVAL_RULES:
+        return INTERVAL_RULES[interval]
+    match = N_DAYS.match(interval or '')
+    return f'{match.group(1)}D' if match else None
+
+def resample_ohlcv(hist, interval):
+    """
+    Roll a daily OHLCV frame (indexed by date) into bars of `interval`.
+    
+    Each bar opens at its first day's open, closes at its last day's close,
+    spans the highest high and lowest low and sums the volume. Bars are
+    dated by their first trading day, and periods without trading are left out.
+    """
+    rule = interval_rule(interval)
+    if rule is None:
+        raise ValueError(f"Unsupported interval: {interval}")
+    if hist.empty:
+        return hist
+    
+    # N-day bars count from the first bar rather than from the epoch
+    origin = 'start' if rule.endswith('D') else 'start_day'
+    bars = hist.assign(Start=hist.index).resample(rule, origin=origin).agg({
+        'Start': 'first',
+        'Open': 'first',
+        'High': 'max',
+        'Low': 'min',
+        'Close': 'last',
+        'Volume': 'sum',
+    })
+    bars = bars.dropna(subset=['Start'])
+    return bars.set_index(pd.DatetimeIndex(bars.pop('Start'), name=hist.index.name))
+
+def lttb_indices(y, max_points):
+    """
+    Positions of the points Largest-Triangle-Three-Buckets keeps out of the
+    evenly spaced series `y`: the first and last point plus, from each of
+    max_points - 2 buckets, the point forming the largest triangle with the
+    point kept from the previous bucket and the average of the next bucket.
+    
+    Buckets depend on the point kept before them, so there is one step per
+    bucket; the triangle areas within a bucket are computed in one go.
+    """
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if max_points >= n or max_points < 3:
+        return np.arange(n)
+    
+    x = np.arange(n, dtype=float)
+    # Bucket edges over the points between the first and the last
+    edges = np.linspace(1, n - 1, max_points - 1).astype(int)
+    # Averages of every bucket, with the last point standing in after the last bucket
+    sums = np.add.reduceat(y[:n - 1], edges[:-1])
+    counts = np.diff(edges)
+    averages_y = np.append(sums / counts, y[-1])
+    averages_x = np.append((edges[:-1] + edges[1:] - 1) / 2, n - 1)
+    
+    keep = np.empty(max_points, dtype=int)
+    keep[0], keep[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(max_points - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        next_x, next_y = averages_x[bucket + 1], averages_y[bucket + 1]
+        areas = np.abs(
+            (x[previous] - next_x) * (y[start:stop] - y[previous])
+            - (x[previous] - x[start:stop]) * (next_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        keep[bucket + 1] = previous
+    return keep
+
+def downsample(hist, max_points, column='Close'):
+    """
+    Keep at most `max_points` rows of a frame, chosen by LTTB on `column`.
+    """
+    return hist.iloc[lttb_indices(hist[column].to_numpy(), max_points)]
\ No newline at end of file
@@ -0,0 +1,175 @@
+# backend/stock_app/search.py
+import re
+
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from rest_framework import filters
+
+from .models import StockAnalysis
+
+# Index tables, kept outside the ORM: an FTS5 virtual table on SQLite, a
+# table with a GIN-indexed tsvector on PostgreSQL. Both carry the visibility
+# columns, so search results are filtered without reading StockAnalysis rows
+SQLITE_TABLE = 'stock_app_analysis_fts'
+POSTGRES_TABLE = 'stock_app_analysis_search'
+POSTGRES_CONFIG = 'english'
+
+# Title matches weigh this much more than matches in the content
+TITLE_WEIGHT = 10.0
+
+# Analyses indexed per batch by rebuild_search_index()
+CHUNK_SIZE = 500
+
+WORD = re.compile(r'\w+')
+
+_fts5 = {}
+
+def search_backend(db=None):
+    """
+    'fts5' or 'postgres', or None if the database has no full-text index
+    (SQLite built without FTS5, other vendors).
+    """
+    db = db or connection
+    if db.vendor == 'postgresql':
+        return 'postgres'
+    if db.vendor != 'sqlite':
+        return None
+    if db.alias not in _fts5:
+        with db.cursor() as cursor:
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            _fts5[db.alias] = bool(cursor.fetchone()[0])
+    return 'fts5' if _fts5[db.alias] else None
+
+def ensure_search_index(db=None):
+    """
+    Create the index table if it is missing. Runs after every migrate.
+    """
+    db = db or connection
+    backend = search_backend(db)
+    with db.cursor() as cursor:
+        if backend == 'fts5':
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_TABLE} USING fts5("
+                f"title, content, is_public UNINDEXED, user_id UNINDEXED, tokenize='porter unicode61')"
+            )
+        elif backend == 'postgres':
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {POSTGRES_TABLE} ("
+                f"analysis_id bigint PRIMARY KEY REFERENCES {StockAnalysis._meta.db_table} (id) ON DELETE CASCADE, "
+                f"document tsvector NOT NULL, is_public boolean NOT NULL, user_id bigint NULL)"
+            )
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {POSTGRES_TABLE}_document "
+                           f"ON {POSTGRES_TABLE} USING GIN (document)")
+
+def create_search_index(sender, using=DEFAULT_DB_ALIAS, **kwargs):
+    # post_migrate receiver
+    ensure_search_index(connections[using])
+
+def unindex_analyses(analysis_ids):
+    analysis_ids = list(analysis_ids)
+    backend = search_backend()
+    if backend is None or not analysis_ids:
+        return
+    column = 'rowid' if backend == 'fts5' else 'analysis_id'
+    table = SQLITE_TABLE if backend == 'fts5' else POSTGRES_TABLE
+    placeholders = ', '.join(['%s'] * len(analysis_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table} WHERE {column} IN ({placeholders})", analysis_ids)
+
+def index_analyses(analyses):
+    """
+    Write the title, content and visibility of the given StockAnalysis
+    instances into the index. The signals call this on save; changes made
+    around them (queryset.update(), bulk_create()) need rebuild_search_index.
+    """
+    analyses = list(analyses)
+    backend = search_backend()
+    if backend is None or not analyses:
+        return
+    unindex_analyses([analysis.pk for analysis in analyses])
+    with connection.cursor() as cursor:
+        if backend == 'fts5':
+            cursor.executemany(
+                f"INSERT INTO {SQLITE_TABLE} (rowid, title, content, is_public, user_id) VALUES (%s, %s, %s, %s, %s)",
+                [(a.pk, a.title, a.content, int(a.is_public), a.user_id) for a in analyses],
+            )
+        else:
+            cursor.executemany(
+                f"INSERT INTO {POSTGRES_TABLE} (analysis_id, document, is_public, user_id) VALUES ("
+                f"%s, setweight(to_tsvector(%s::regconfig, %s), 'A') || setweight(to_tsvector(%s::regconfig, %s), 'B'), "
+                f"%s, %s)",
+                [(a.pk, POSTGRES_CONFIG, a.title, POSTGRES_CONFIG, a.content, a.is_public, a.user_id)
+                 for a in analyses],
+            )
+
+def rebuild_search_index():
+    """
+    Index every StockAnalysis in batches and drop entries of deleted ones.
+    Searches keep working meanwhile. Returns the number indexed.
+    """
+    backend = search_backend()
+    if backend is None:
+        return 0
+    ensure_search_index()
+    analyses = StockAnalysis.objects.order_by('pk').only('pk', 'title', 'content', 'is_public', 'user_id')
+    count, last = 0, 0
+    while True:
+        chunk = list(analyses.filter(pk__gt=last)[:CHUNK_SIZE])
+        if not chunk:
+            break
+        index_analyses(chunk)
+        count += len(chunk)
+        last = chunk[-1].pk
+    
+    table, column = (SQLITE_TABLE, 'rowid') if backend == 'fts5' else (POSTGRES_TABLE, 'analysis_id')
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table} WHERE {column} NOT IN (SELECT id FROM {StockAnalysis._meta.db_table})")
+    return count
+
+def search_analyses(queryset, terms, user=None):
+    """
+    `queryset` narrowed to the analyses that match every term as a word
+    prefix and are public or belong to `user`, best match first. Both
+    conditions are answered by the index, which drives the query.
+    """
+    words = [word for term in terms for word in WORD.findall(term)]
+    if not words:
+        return queryset
+    analyses = StockAnalysis._meta.db_table
+    user_id = user.pk if user is not None and user.is_authenticated else None
+    
+    if search_backend() == 'fts5':
+        table, key = SQLITE_TABLE, 'rowid'
+        match, match_params = f'{table} MATCH %s', [' '.join(f'"{word}"*' for word in words)]
+        # bm25() is lower for better matches
+        rank, rank_params = f'-bm25({table}, %s, 1.0)', [TITLE_WEIGHT]
+    else:
+        table, key = POSTGRES_TABLE, 'analysis_id'
+        query = ' & '.join(f'{word}:*' for word in words)
+        match, match_params = f'{table}.document @@ to_tsquery(%s::regconfig, %s)', [POSTGRES_CONFIG, query]
+        rank, rank_params = f'ts_rank({table}.document, to_tsquery(%s::regconfig, %s))', [POSTGRES_CONFIG, query]
+    
+    visible = f'{table}.is_public = %s'
+    visible_params = [True]
+    if user_id is not None:
+        visible = f'({visible} OR {table}.user_id = %s)'
+        visible_params.append(user_id)
+    return queryset.extra(
+        tables=[table],
+        where=[f'{table}.{key} = {analyses}.id', match, visible],
+        params=match_params + visible_params,
+        select={'search_rank': rank},
+        select_params=rank_params,
+        order_by=['-search_rank'],
+    )
+
+class AnalysisSearchFilter(filters.SearchFilter):
+    """
+    ?search= over the full-text index of StockAnalysis, ranked by relevance.
+    Falls back to SearchFilter's LIKE scans of `search_fields` where the
+    database has no full-text index.
+    """
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms or search_backend() is None:
+            return super().filter_queryset(request, queryset, view)
+        return search_analyses(queryset, terms, request.user)
\ No newline at end of file
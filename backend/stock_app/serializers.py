@@ -1,7 +1,8 @@
 # backend/stock_app/serializers.py
 from rest_framework import serializers
-from .models import Stock, StockPrice, UserPortfolio, PortfolioStock, WatchList, StockAnalysis, Alert
+from .models import Stock, StockPrice, StockStats, UserPortfolio, PortfolioStock, WatchList, StockAnalysis, Alert
 from django.contrib.auth.models import User
+from .price_snapshots import recent_prices, DEFAULT_BARS, SNAPSHOT_BARS
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -15,6 +16,15 @@ class StockSerializer(serializers.ModelSerializer):
         fields = '__all__'
         read_only_fields = ['date_updated', 'date_added']
 
+class StockStatsSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = StockStats
+        exclude = ['stock']
+
+class StockListSerializer(StockSerializer):
+    # Precomputed metrics for listings and screens; select_related('stats')
+    stats = StockStatsSerializer(read_only=True)
+
 class StockPriceSerializer(serializers.ModelSerializer):
     class Meta:
         model = StockPrice
@@ -27,16 +37,27 @@ class StockPriceListSerializer(serializers.ModelSerializer):
 
 class StockDetailSerializer(serializers.ModelSerializer):
     historical_prices = serializers.SerializerMethodField()
+    stats = StockStatsSerializer(read_only=True)
     
     class Meta:
         model = Stock
         fields = '__all__'
         read_only_fields = ['date_updated', 'date_added']
     
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # ?prices=N embeds the latest N bars (at most SNAPSHOT_BARS); ?prices=0 leaves them out
+        request = self.context.get('request')
+        try:
+            self.price_count = min(max(int(request.query_params.get('prices', DEFAULT_BARS)), 0), SNAPSHOT_BARS)
+        except (AttributeError, ValueError):
+            self.price_count = DEFAULT_BARS
+        if not self.price_count:
+            self.fields.pop('historical_prices')
+    
     def get_historical_prices(self, obj):
-        # Get the last 30 days of prices by default
-        prices = obj.prices.all()[:30]
-        return StockPriceListSerializer(prices, many=True).data
+        # Served from the cached snapshot that ingestion keeps up to date
+        return recent_prices(obj.pk, self.price_count)
 
 class PortfolioStockSerializer(serializers.ModelSerializer):
     stock_details = StockSerializer(source='stock', read_only=True)
@@ -66,6 +87,10 @@ class UserPortfolioSerializer(serializers.ModelSerializer):
         read_only_fields = ['created_at', 'updated_at', 'user']
     
     def get_total_value(self, obj):
+        # Summed by the database when the viewset annotated it
+        if hasattr(obj, 'total_value'):
+            return obj.total_value
+        
         # Calculate total portfolio value
         total = 0
         for portfolio_stock in obj.stocks.all():
@@ -1,78 +1,150 @@
 # backend/stock_app/signals.py
-from django.db.models.signals import post_save
+from contextlib import contextmanager
+import logging
+import threading
+import weakref
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Subquery
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from .models import StockPrice, Stock, Alert
+from .models import StockPrice, Stock, StockAnalysis, Alert
+from .alert_index import alert_index, index_entry
+from .alerts import evaluate_alerts
+from .archive import refresh_archive
+from .conditional import bump_versions
+from .price_matrix import update_price_matrix
+from .price_snapshots import refresh_snapshots
+from .search import index_analyses, unindex_analyses
+from .stats import refresh_stats
 from django.utils import timezone
 
-@receiver(post_save, sender=StockPrice)
-def update_stock_current_price(sender, instance, created, **kwargs):
+logger = logging.getLogger(__name__)
+
+# Stocks whose prices changed in the current transaction, per thread
+_state = threading.local()
+
+def _pending():
+    if not hasattr(_state, 'stock_ids'):
+        _state.stock_ids = set()
+        _state.deferred = 0
+        _state.scheduled = None
+    return _state.stock_ids
+
+def _flush_scheduled():
+    # Only Django's list of commit hooks holds the callback, so the weak
+    # reference dies once it has run or a rollback has dropped it
+    return _state.scheduled is not None and _state.scheduled() is not None
+
+def mark_prices_changed(stock_ids):
     """
-    When a new stock price is saved, update the stock's current_price
-    if it's the most recent price.
+    Record that prices of the given stocks changed. One coalesced
+    process_price_changes() runs when the outermost transaction commits
+    (immediately in autocommit mode), however many times this is called.
     """
-    # Get the most recent price for this stock
-    latest_price = StockPrice.objects.filter(stock=instance.stock).order_by('-date').first()
-    
-    # If this is the most recent price, update the stock's current_price
-    if latest_price and latest_price.id == instance.id:
-        instance.stock.current_price = latest_price.close_price
-        instance.stock.date_updated = timezone.now()
-        instance.stock.save(update_fields=['current_price', 'date_updated'])
+    pending = _pending()
+    pending.update(stock_ids)
+    if pending and not _state.deferred and not _flush_scheduled():
+        # A fresh callback per transaction, referenced only by Django
+        def flush():
+            process_price_changes()
+        _state.scheduled = weakref.ref(flush)
+        transaction.on_commit(flush)
 
-@receiver(post_save, sender=StockPrice)
-def check_alerts(sender, instance, created, **kwargs):
+@contextmanager
+def defer_price_processing():
     """
-    When a new stock price is saved, check if any alerts should be triggered.
+    Suppress the per-row StockPrice handlers for bulk loaders. Changes saved
+    inside the block are only recorded, and processed once after the block
+    exits and its transaction commits.
     """
-    # Find active alerts for this stock
-    alerts = Alert.objects.filter(
-        stock=instance.stock,
-        is_active=True,
-        triggered=False
-    )
-    
-    # Skip if no alerts
-    if not alerts.exists():
+    _pending()
+    _state.deferred += 1
+    try:
+        yield
+    finally:
+        _state.deferred -= 1
+    if not _state.deferred:
+        mark_prices_changed(())
+
+def process_price_changes():
+    """
+    Refresh current prices, recent-price snapshots, StockStats, the price
+    archive and the price matrix (if built), bump the stocks' ETag versions
+    and evaluate alerts once for every stock recorded by
+    mark_prices_changed() since the last run.
+    """
+    stock_ids = list(_pending())
+    _state.stock_ids = set()
+    _state.scheduled = None
+    if not stock_ids:
         return
     
-    current_price = float(instance.close_price)
-    
-    for alert in alerts:
-        alert_value = float(alert.value)
-        triggered = False
-        
-        if alert.alert_type == 'price_above' and current_price > alert_value:
-            triggered = True
-        elif alert.alert_type == 'price_below' and current_price < alert_value:
-            triggered = True
-        elif alert.alert_type == 'percent_change':
-            # Get previous day's closing price
-            previous_day = StockPrice.objects.filter(
-                stock=instance.stock,
-                date__lt=instance.date
-            ).order_by('-date').first()
-            
-            if previous_day:
-                previous_price = float(previous_day.close_price)
-                percent_change = ((current_price - previous_price) / previous_price) * 100
-                
-                if abs(percent_change) > alert_value:
-                    triggered = True
-        elif alert.alert_type == 'volume_spike':
-            # Get average volume for the past 10 days
-            past_prices = StockPrice.objects.filter(
-                stock=instance.stock,
-                date__lt=instance.date
-            ).order_by('-date')[:10]
-            
-            if past_prices.exists():
-                avg_volume = sum(float(p.volume) for p in past_prices) / past_prices.count()
-                volume_increase = (float(instance.volume) / avg_volume) * 100
-                
-                if volume_increase > alert_value:
-                    triggered = True
-        
-        if triggered:
-            alert.triggered = True
-            alert.triggered_at = timezone.now()
-            alert.save()
\ No newline at end of file
+    # The prices are committed by now: a failing consumer is logged rather
+    # than turning the write into an error, and the others still run
+    for consumer in PRICE_CONSUMERS:
+        try:
+            consumer(stock_ids)
+        except Exception:
+            logger.exception("%s failed for %d stocks after a price change", consumer.__name__, len(stock_ids))
+
+def refresh_current_prices(stock_ids):
+    """
+    Set current_price of the given stocks to their latest stored close with a
+    single UPDATE. Stocks without stored prices are left alone.
+    """
+    prices = StockPrice.objects.filter(stock=OuterRef('pk'))
+    Stock.objects.filter(pk__in=stock_ids).filter(Exists(prices)).update(
+        current_price=Subquery(prices.order_by('-date').values('close_price')[:1]),
+        date_updated=timezone.now(),
+    )
+
+# Run in this order by process_price_changes(). Snapshots are tagged with
+# the stock versions, so they are rebuilt after bump_versions
+PRICE_CONSUMERS = [
+    refresh_current_prices, refresh_stats, refresh_archive, update_price_matrix,
+    bump_versions, refresh_snapshots, evaluate_alerts,
+]
+
+@receiver(post_save, sender=StockPrice)
+@receiver(post_delete, sender=StockPrice)
+def queue_price_change(sender, instance, **kwargs):
+    """
+    When a stock price is saved or deleted, schedule a refresh of the stock's
+    current_price and an alert check for after the transaction commits.
+    In autocommit mode that is after every save, so loops saving rows one by
+    one belong in transaction.atomic() or defer_price_processing().
+    """
+    mark_prices_changed([instance.stock_id])
+
+@receiver(post_save, sender=Stock)
+@receiver(post_delete, sender=Stock)
+def bump_stock_version(sender, instance, **kwargs):
+    """
+    Saved or deleted stocks invalidate their own and the collection's ETags.
+    """
+    bump_versions([instance.pk])
+
+@receiver(post_save, sender=StockAnalysis)
+def index_saved_analysis(sender, instance, **kwargs):
+    """
+    Keep the full-text search index in step with saved analyses, in the
+    same transaction as the save.
+    """
+    index_analyses([instance])
+
+@receiver(post_delete, sender=StockAnalysis)
+def unindex_deleted_analysis(sender, instance, **kwargs):
+    unindex_analyses([instance.pk])
+
+@receiver(post_save, sender=Alert)
+@receiver(post_delete, sender=Alert)
+def invalidate_alert_index(sender, instance, signal, **kwargs):
+    """
+    Record the saved or deleted alert, including toggle_active, in the
+    transaction that writes it. This process updates its threshold index in
+    place once the transaction commits; the others reload the stock before
+    their next evaluation.
+    """
+    entry = None if signal is post_delete else index_entry(instance)
+    alert_index.invalidate([instance.stock_id], [(instance.pk, entry)])
\ No newline at end of file
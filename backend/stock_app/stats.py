@@ -0,0 +1,93 @@
+# backend/stock_app/stats.py
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db.models import F, Max, Min, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from .models import Stock, StockPrice, StockStats
+
+# Bars used for average_volume, not counting the latest bar
+VOLUME_WINDOW = 10
+
+# Bars back for return_1m (about one month of trading days)
+MONTH_BARS = 21
+
+# Calendar days covered by high_52w/low_52w
+YEAR_DAYS = 365
+
+# Stocks refreshed per batch of queries
+CHUNK_SIZE = 500
+
+STATS_FIELDS = [
+    'latest_date', 'latest_close', 'latest_volume', 'previous_close', 'average_volume',
+    'high_52w', 'low_52w', 'return_1d', 'return_1m', 'updated_at',
+]
+
+def _percent_change(new, old):
+    if new is None or not old:
+        return None
+    return (float(new) - float(old)) / float(old) * 100
+
+def compute_stats(stock_ids, today=None):
+    """
+    Build unsaved StockStats for the given stocks with three queries: the
+    stocks that still exist, the latest MONTH_BARS + 1 bars of every stock,
+    and the 52-week high/low. Stocks without prices get stats with every
+    metric empty.
+    """
+    # Stocks may have been deleted since their prices changed
+    stock_ids = list(Stock.objects.filter(pk__in=list(stock_ids)).values_list('pk', flat=True))
+    today = today or timezone.localdate()
+    
+    bars = defaultdict(list)
+    recent = StockPrice.objects.filter(stock_id__in=stock_ids).annotate(
+        row_number=Window(RowNumber(), partition_by=[F('stock_id')], order_by=F('date').desc())
+    ).filter(row_number__lte=MONTH_BARS + 1).values_list('stock_id', 'row_number', 'date', 'close_price', 'volume')
+    for stock_id, row_number, day, close_price, volume in recent:
+        bars[stock_id].append((row_number, day, close_price, volume))
+    
+    ranges = {
+        stock_id: (high, low)
+        for stock_id, high, low in StockPrice.objects.filter(
+            stock_id__in=stock_ids, date__gt=today - timedelta(days=YEAR_DAYS)
+        ).order_by().values('stock_id').annotate(
+            high=Max('high_price'), low=Min('low_price')
+        ).values_list('stock_id', 'high', 'low')
+    }
+    
+    stats = []
+    for stock_id in stock_ids:
+        stock_bars = [bar[1:] for bar in sorted(bars.get(stock_id, []))]
+        latest = stock_bars[0] if stock_bars else (None, None, None)
+        previous = stock_bars[1:VOLUME_WINDOW + 1]
+        month_ago = stock_bars[MONTH_BARS] if len(stock_bars) > MONTH_BARS else None
+        high, low = ranges.get(stock_id, (None, None))
+        stats.append(StockStats(
+            stock_id=stock_id,
+            latest_date=latest[0],
+            latest_close=latest[1],
+            latest_volume=latest[2],
+            previous_close=previous[0][1] if previous else None,
+            average_volume=sum(bar[2] for bar in previous) / len(previous) if previous else None,
+            high_52w=high,
+            low_52w=low,
+            return_1d=_percent_change(latest[1], previous[0][1]) if previous else None,
+            return_1m=_percent_change(latest[1], month_ago[1]) if month_ago else None,
+        ))
+    return stats
+
+def refresh_stats(stock_ids, today=None):
+    """
+    Recompute and upsert the StockStats rows of the given stocks, reading
+    only their recent bars; four queries per CHUNK_SIZE stocks.
+    """
+    stock_ids = list(stock_ids)
+    for i in range(0, len(stock_ids), CHUNK_SIZE):
+        StockStats.objects.bulk_create(
+            compute_stats(stock_ids[i:i + CHUNK_SIZE], today),
+            update_conflicts=True,
+            unique_fields=['stock'],
+            update_fields=STATS_FIELDS,
+        )
\ No newline at end of file
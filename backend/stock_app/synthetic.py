@@ -0,0 +1,28 @@
+# backend/stock_app/synthetic.py
+import numpy as np
+import pandas as pd
+
+def synthetic_history(rows, start='2000-01-03', seed=0, end=None):
+    """
+    Deterministic random-walk OHLCV frame shaped like yfinance's history().
+    Bars run from `start`, or up to `end` when it is given.
+    """
+    rng = np.random.default_rng(seed)
+    if end is not None:
+        index = pd.bdate_range(end=end, periods=rows, tz='America/New_York', name='Date')
+    else:
+        index = pd.bdate_range(start, periods=rows, tz='America/New_York', name='Date')
+    
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, rows)))
+    open_ = close * (1 + rng.normal(0, 0.003, rows))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.005, rows)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.005, rows)))
+    volume = rng.integers(100_000, 10_000_000, rows)
+    
+    return pd.DataFrame({
+        'Open': open_,
+        'High': high,
+        'Low': low,
+        'Close': close,
+        'Volume': volume,
+    }, index=index)
\ No newline at end of file
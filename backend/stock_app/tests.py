@@ -0,0 +1,1649 @@
+# backend/stock_app/tests.py
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+import json
+from pathlib import Path
+import tempfile
+import threading
+import time
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+from django.db.models import QuerySet
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .alert_index import AlertThresholdIndex, alert_index
+from .alerts import evaluate_alerts
+from .archive import archive_history, refresh_archive
+from .benchmarks import legacy_ingest, generate_dataset, price_consumers_disabled, summarize
+from .conditional import bump_versions
+from . import fetching, history_cache
+from .fetching import fetch_many
+from .formatting import columns_to_rows
+from .indicators import INDICATORS, indicator_frame
+from .ingestion import ingest_price_history, upsert_stocks
+from .metrics import fingerprint, reset_metrics
+from .models import (
+    Stock, StockPrice, StockStats, PriceArchive, UserPortfolio, PortfolioStock, WatchList, StockAnalysis, Alert
+)
+from .performance import portfolio_performance
+from .price_matrix import build_price_matrix, get_price_matrix
+from .price_snapshots import recent_prices
+from .providers import get_provider, MarketDataProvider, ReplayProvider, reset_providers
+from .refresher import MarketDataRefresher, prioritized_symbols, TRACKED, UNTRACKED
+from .resampling import lttb_indices, resample_ohlcv
+from .search import search_backend
+from .serializers import StockPriceListSerializer
+from .signals import PRICE_CONSUMERS, defer_price_processing
+from .stats import refresh_stats
+from .synthetic import synthetic_history
+from .upstream import CircuitBreaker, SharedProvider, UpstreamUnavailable
+
+class IngestPriceHistoryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='trader')
+        self.stock = Stock.objects.create(symbol='TEST', company_name='Test Corp')
+    
+    def test_inserts_then_updates_on_stock_and_date(self):
+        hist = synthetic_history(50)
+        self.assertEqual(ingest_price_history(self.stock, hist), 50)
+        
+        hist['Close'] = hist['Close'] + 1
+        ingest_price_history(self.stock, hist)
+        
+        self.assertEqual(StockPrice.objects.filter(stock=self.stock).count(), 50)
+        latest = StockPrice.objects.filter(stock=self.stock).order_by('-date').first()
+        self.assertEqual(latest.close_price, Decimal(str(round(hist['Close'].iloc[-1], 2))))
+    
+    def test_refreshes_current_price_and_alerts_once_per_batch(self):
+        alert = Alert.objects.create(user=self.user, stock=self.stock,
+                                     alert_type='price_above', value=1)
+        alert_index.rebuild()
+        hist = synthetic_history(100)
+        
+        # Savepoint pair and 1 bulk INSERT, then after commit
+        # 1 UPDATE for the current price, 4 queries for StockStats, 4 for the
+        # price archive, 1 version bump, 2 for the snapshot and 6 for alerts
+        with self.assertNumQueries(21), self.captureOnCommitCallbacks(execute=True):
+            ingest_price_history(self.stock, hist)
+        
+        self.stock.refresh_from_db()
+        alert.refresh_from_db()
+        self.assertEqual(self.stock.current_price, Decimal(str(round(hist['Close'].iloc[-1], 2))))
+        self.assertTrue(alert.triggered)
+
+class PriceChangeCaptureTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='trader')
+        self.stocks = [Stock.objects.create(symbol=f'S{i}', company_name=f'Stock {i}') for i in range(3)]
+        for stock in self.stocks:
+            Alert.objects.create(user=self.user, stock=stock, alert_type='price_above', value=1000)
+            Alert.objects.create(user=self.user, stock=stock, alert_type='volume_spike', value=1000)
+        alert_index.rebuild()
+    
+    def save_prices(self, bars_per_stock, first_day):
+        """
+        Save bars one by one in a transaction and return (queries run after
+        commit, number of commit callbacks registered).
+        """
+        with self.captureOnCommitCallbacks() as callbacks:
+            with transaction.atomic():
+                for stock in self.stocks:
+                    for i in range(bars_per_stock):
+                        StockPrice.objects.create(stock=stock, date=date(2024, 1, 1) + timedelta(days=first_day + i),
+                                                  open_price=10, high_price=10, low_price=10,
+                                                  close_price=10 + i, adjusted_close=10 + i, volume=100)
+        
+        with CaptureQueriesContext(connection) as queries:
+            for callback in callbacks:
+                callback()
+        return len(queries), len(callbacks)
+    
+    def test_post_commit_queries_stay_constant_as_batch_grows(self):
+        small = self.save_prices(2, first_day=0)
+        large = self.save_prices(40, first_day=100)
+        
+        self.assertEqual(small, large)
+        self.assertEqual(large[1], 1)
+        self.assertEqual(Stock.objects.get(pk=self.stocks[0].pk).current_price, 49)
+    
+    def test_deferred_bulk_loader_is_processed_once_on_exit(self):
+        hist = synthetic_history(30)
+        stock = self.stocks[0]
+        
+        def load(rows):
+            price_before = Stock.objects.get(pk=stock.pk).current_price
+            with self.captureOnCommitCallbacks() as callbacks:
+                with defer_price_processing():
+                    legacy_ingest(stock, hist[:rows])
+                    # Per-row handlers are suppressed inside the block
+                    self.assertEqual(Stock.objects.get(pk=stock.pk).current_price, price_before)
+            with CaptureQueriesContext(connection) as queries:
+                for callback in callbacks:
+                    callback()
+            return len(queries), len(callbacks)
+        
+        self.assertEqual(load(5), load(30))
+        stock.refresh_from_db()
+        self.assertEqual(stock.current_price, Decimal(str(round(hist['Close'].iloc[-1], 2))))
+    
+    def test_baseline_runs_no_consumers(self):
+        stock = Stock.objects.create(symbol='BASE', company_name='Base Corp')
+        consumers = list(PRICE_CONSUMERS)
+        
+        # The benchmark saves in autocommit, where each hook runs inside the block
+        with price_consumers_disabled(), self.captureOnCommitCallbacks(execute=True):
+            legacy_ingest(stock, synthetic_history(5))
+        
+        stock.refresh_from_db()
+        self.assertIsNone(stock.current_price)
+        self.assertEqual(PRICE_CONSUMERS, consumers)
+    
+    def test_rolled_back_transaction_does_not_block_the_next_hook(self):
+        with self.assertRaises(ValueError), transaction.atomic():
+            self.save_prices(1, first_day=0)
+            raise ValueError
+        
+        queries, callbacks = self.save_prices(1, first_day=10)
+        self.assertEqual(callbacks, 1)
+    
+    def test_failing_consumer_is_logged_and_the_rest_still_run(self):
+        def broken(stock_ids):
+            raise RuntimeError("consumer down")
+        
+        with mock.patch('stock_app.signals.PRICE_CONSUMERS', [broken] + PRICE_CONSUMERS), \
+                self.assertLogs('stock_app.signals', 'ERROR') as logs:
+            self.save_prices(1, first_day=0)
+        
+        self.assertIn('broken failed', logs.output[0])
+        self.assertEqual(Stock.objects.get(pk=self.stocks[0].pk).current_price, 10)
+
+class AlertEngineTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='trader', is_staff=True)
+        self.stock = Stock.objects.create(symbol='TEST', company_name='Test Corp')
+        self.quiet = Stock.objects.create(symbol='QUIET', company_name='Quiet Corp')
+        alert_index.rebuild()
+        
+        # Ten days at 100 on 1,000 shares, then a jump to 110 on 5,000 shares
+        start = date(2024, 1, 1)
+        for stock in [self.stock, self.quiet]:
+            StockPrice.objects.bulk_create([
+                StockPrice(stock=stock, date=start + timedelta(days=i), open_price=100, high_price=100,
+                           low_price=100, close_price=100, adjusted_close=100, volume=1000)
+                for i in range(10)
+            ])
+        StockPrice.objects.bulk_create([
+            StockPrice(stock=self.stock, date=start + timedelta(days=10), open_price=100, high_price=110,
+                       low_price=100, close_price=110, adjusted_close=110, volume=5000)
+        ])
+        refresh_stats([self.stock.pk, self.quiet.pk])
+    
+    def alert(self, stock, alert_type, value):
+        # Run the commit hooks that keep the threshold index in sync
+        with self.captureOnCommitCallbacks(execute=True):
+            return Alert.objects.create(user=self.user, stock=stock, alert_type=alert_type, value=value)
+    
+    def test_evaluates_every_alert_type(self):
+        fired = [
+            self.alert(self.stock, 'price_above', 105),
+            self.alert(self.stock, 'price_below', 120),
+            self.alert(self.stock, 'percent_change', 5),
+            self.alert(self.stock, 'volume_spike', 400),
+        ]
+        quiet = [
+            self.alert(self.stock, 'price_above', 115),
+            self.alert(self.stock, 'percent_change', 15),
+            self.alert(self.stock, 'volume_spike', 600),
+            self.alert(self.quiet, 'percent_change', 1),
+            self.alert(self.quiet, 'volume_spike', 101),
+        ]
+        
+        result = evaluate_alerts()
+        
+        self.assertEqual(result.checked, 9)
+        self.assertEqual(sorted(result.triggered), sorted(alert.pk for alert in fired))
+        self.assertEqual(Alert.objects.filter(triggered=True, triggered_at__isnull=False).count(), 4)
+        self.assertFalse(Alert.objects.filter(pk__in=[alert.pk for alert in quiet], triggered=True).exists())
+    
+    def test_query_count_does_not_grow_with_alerts(self):
+        for i in range(50):
+            self.alert(self.stock if i % 2 else self.quiet, 'price_above', 1000)
+        
+        alert_index.refresh()
+        
+        # Alerts version, alerts, then prices and stats; nothing triggers so no update
+        with self.assertNumQueries(3):
+            evaluate_alerts()
+    
+    def test_alerts_written_without_signals_are_evaluated(self):
+        evaluate_alerts()
+        
+        Alert.objects.bulk_create([Alert(user=self.user, stock=self.stock, alert_type='price_above', value=105)])
+        dormant = self.alert(self.stock, 'price_below', 200)
+        Alert.objects.filter(pk=dormant.pk).update(is_active=False)
+        
+        result = evaluate_alerts()
+        
+        self.assertEqual(len(result.triggered), 1)
+        self.assertEqual(Alert.objects.get(pk=result.triggered[0]).value, 105)
+        self.assertFalse(Alert.objects.get(pk=dormant.pk).triggered)
+    
+    def test_check_alerts_endpoint(self):
+        self.alert(self.stock, 'price_above', 105)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        
+        response = client.post('/api/alerts/check_alerts/')
+        
+        self.assertEqual(response.data['message'], "Checked 1 alerts. Triggered 1.")
+
+class AlertThresholdIndexTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='trader')
+        self.stock = Stock.objects.create(symbol='TEST', company_name='Test Corp')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        alert_index.rebuild()
+    
+    def create_alert(self, alert_type, value):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/alerts/', {'stock': self.stock.pk, 'alert_type': alert_type,
+                                                         'value': value}, format='json')
+        return response.data['id']
+    
+    def test_finds_exactly_the_crossed_thresholds(self):
+        above = {value: self.create_alert('price_above', value) for value in [90, 100, 110]}
+        below = {value: self.create_alert('price_below', value) for value in [90, 100, 110]}
+        alert_index.refresh()
+        
+        self.assertEqual(sorted(alert_index.crossed(self.stock.pk, 100)), sorted([above[90], below[110]]))
+        self.assertEqual(sorted(alert_index.crossed(self.stock.pk, 120)),
+                         sorted([above[90], above[100], above[110]]))
+        self.assertEqual(alert_index.crossed(self.stock.pk + 1, 100), [])
+    
+    def test_stays_consistent_with_toggle_update_and_delete(self):
+        alert_id = self.create_alert('price_above', 50)
+        other_id = self.create_alert('price_above', 60)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/alerts/{alert_id}/toggle_active/')
+        alert_index.refresh()
+        self.assertEqual(alert_index.crossed(self.stock.pk, 100), [other_id])
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/alerts/{alert_id}/toggle_active/')
+            self.client.patch(f'/api/alerts/{other_id}/', {'value': 200}, format='json')
+        alert_index.refresh()
+        self.assertEqual(alert_index.crossed(self.stock.pk, 100), [alert_id])
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/alerts/{alert_id}/')
+        alert_index.refresh()
+        self.assertEqual(alert_index.crossed(self.stock.pk, 100), [])
+    
+    def test_rebuilds_from_database(self):
+        alert_id = self.create_alert('price_below', 10)
+        
+        fresh = AlertThresholdIndex()
+        
+        self.assertEqual(fresh.crossed(self.stock.pk, 5), [alert_id])
+        self.assertEqual(fresh.count(), 1)
+    
+    def test_own_writes_are_applied_in_place(self):
+        first_id = self.create_alert('price_above', 50)
+        alert_index.refresh()
+        
+        second_id = self.create_alert('price_above', 60)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/alerts/{first_id}/', {'value': 200}, format='json')
+        
+        # Version lookup only; nothing is reloaded
+        with self.assertNumQueries(1):
+            alert_index.refresh()
+        self.assertEqual(alert_index.crossed(self.stock.pk, 100), [second_id])
+    
+    def test_other_processes_reload_only_the_written_stocks(self):
+        quiet = Stock.objects.create(symbol='QUIET', company_name='Quiet Corp')
+        quiet_id = Alert.objects.create(user=self.user, stock=quiet, alert_type='price_above', value=50).pk
+        other = AlertThresholdIndex()
+        other.rebuild()
+        
+        # Bypasses the index, so only a reload of QUIET would pick it up
+        QuerySet.update(Alert.objects.filter(stock=quiet), value=500)
+        alert_id = self.create_alert('price_above', 50)
+        other.refresh()
+        
+        self.assertEqual(other.crossed(self.stock.pk, 100), [alert_id])
+        self.assertEqual(other.crossed(quiet.pk, 100), [quiet_id])
+    
+    def test_refreshes_after_writes_from_another_process(self):
+        other = AlertThresholdIndex()
+        other.rebuild()
+        
+        # Bulk writes skip the signals and this instance never sees them
+        Alert.objects.bulk_create([
+            Alert(user=self.user, stock=self.stock, alert_type='price_above', value=50),
+            Alert(user=self.user, stock=self.stock, alert_type='price_below', value=150),
+        ])
+        other.refresh()
+        self.assertEqual(other.count(), 2)
+        
+        Alert.objects.filter(alert_type='price_below').update(is_active=False)
+        other.refresh()
+        self.assertEqual(other.count(), 1)
+        
+        # Unchanged alerts cost one lookup and no rebuild
+        with self.assertNumQueries(1):
+            other.refresh()
+
+class FakeProvider(MarketDataProvider):
+    """
+    Local stand-in for Yahoo Finance. Symbols starting with X don't exist,
+    BROKEN raises and SLOW takes half a second to answer.
+    """
+    def get_info(self, symbol):
+        if symbol == 'BROKEN':
+            raise ConnectionError("upstream unavailable")
+        if symbol == 'SLOW':
+            time.sleep(0.5)
+        if symbol.startswith('X'):
+            return {}
+        return {'symbol': symbol, 'longName': f"{symbol} Inc", 'currentPrice': 10}
+    
+    calls = []
+    
+    def get_history(self, symbol, **kwargs):
+        self.calls.append((symbol, kwargs))
+        hist = synthetic_history(20, seed=len(symbol), end=timezone.localdate())
+        if 'start' in kwargs:
+            hist = hist[hist.index.date >= date.fromisoformat(kwargs['start'])]
+        return hist
+
+# Worker threads can't write to the database lease cache while the test
+# transaction holds SQLite's write lock, so these share LocMem leases
+@override_settings(MARKET_DATA_PROVIDER='stock_app.tests.FakeProvider', MARKET_DATA_RATE_LIMIT=0,
+                   MARKET_DATA_LEASE_CACHE='default')
+class FetchBatchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='trader'))
+    
+    def test_reports_each_symbol(self):
+        Stock.objects.create(symbol='AAA', company_name='Old name')
+        
+        response = self.client.post('/api/stocks/fetch_batch/',
+                                    {'symbols': ['AAA', 'BBB', 'XNONE', 'BROKEN', 'AAA']}, format='json')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['succeeded'], 2)
+        self.assertEqual(response.data['failed'], 2)
+        results = response.data['results']
+        self.assertEqual(list(results), ['AAA', 'BBB', 'XNONE', 'BROKEN'])
+        self.assertEqual(results['AAA']['created'], False)
+        self.assertEqual(results['BBB']['created'], True)
+        self.assertEqual(results['BBB']['prices'], 20)
+        self.assertIn('not found', results['XNONE']['error'])
+        self.assertEqual(results['BROKEN']['error'], "upstream unavailable")
+        self.assertEqual(Stock.objects.get(symbol='AAA').company_name, 'AAA Inc')
+        self.assertEqual(StockPrice.objects.filter(stock__symbol='BBB').count(), 20)
+    
+    def test_rejects_missing_symbols(self):
+        response = self.client.post('/api/stocks/fetch_batch/', {'symbols': []}, format='json')
+        self.assertEqual(response.status_code, 400)
+    
+    def test_slow_symbol_times_out_without_blocking_others(self):
+        results = fetch_many(['SLOW', 'AAA'], provider=FakeProvider(), timeout=0.1)
+        
+        self.assertIn('Timed out', results[0].error)
+        self.assertIsNone(results[1].error)
+        self.assertEqual(len(results[1].history), 20)
+    
+    def test_stragglers_stay_within_the_worker_pool(self):
+        before = threading.active_count()
+        for _ in range(4):
+            started = time.monotonic()
+            results = fetch_many(['SLOW'], provider=FakeProvider(), max_workers=2, timeout=0.05)
+            self.assertIn('Timed out', results[0].error)
+            self.assertLess(time.monotonic() - started, 0.3)
+        
+        # The timed-out calls share two workers instead of a pool each
+        self.assertLessEqual(threading.active_count() - before, 2)
+        
+        # The two stragglers that never got a worker are dropped, so the next
+        # batch only waits for the two running ones
+        started = time.monotonic()
+        results = fetch_many(['AAA', 'BBB'], provider=FakeProvider(), max_workers=2, timeout=0.8)
+        self.assertLess(time.monotonic() - started, 0.8)
+        self.assertEqual([result.error for result in results], [None, None])
+    
+    def test_batches_share_the_rate_limit(self):
+        provider = FakeProvider()
+        self.assertIs(fetching._limiter(provider, 5), fetching._limiter(get_provider(), 5))
+        self.assertIsNot(fetching._limiter(provider, 5), fetching._limiter(provider, 10))
+
+@override_settings(MARKET_DATA_PROVIDER='stock_app.tests.FakeProvider')
+class HistoryCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        FakeProvider.calls = []
+        self.client = APIClient()
+        self.stock = Stock.objects.create(symbol='AAA', company_name='AAA Inc')
+    
+    def test_daily_bars_are_served_from_storage_after_first_fetch(self):
+        url = f'/api/stocks/{self.stock.pk}/historical_data/?period=1mo&interval=1d'
+        first = self.client.get(url)
+        second = self.client.get(url)
+        
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(len(FakeProvider.calls), 1)
+        self.assertEqual(history_cache.get_stats(), {'hits': 1, 'partial': 0, 'misses': 1})
+        
+        # A shorter period is covered by what's already stored
+        self.client.get(f'/api/stocks/{self.stock.pk}/historical_data/?period=5d')
+        self.assertEqual(len(FakeProvider.calls), 1)
+    
+    def test_stale_daily_bars_fetch_only_the_tail(self):
+        self.client.get(f'/api/stocks/{self.stock.pk}/historical_data/?period=1mo')
+        # Coverage comes from the stored bars, not from anything this process remembers
+        cache.clear()
+        StockPrice.objects.filter(stock=self.stock, date__gt=timezone.localdate() - timedelta(days=7)).delete()
+        key = f'{history_cache.KEY_PREFIX}:coverage:{self.stock.pk}'
+        coverage = caches['market_data'].get(key)
+        caches['market_data'].set(key, dict(coverage, checked=timezone.localdate() - timedelta(days=1)), None)
+        last_stored = StockPrice.objects.filter(stock=self.stock).latest('date').date
+        
+        self.client.get(f'/api/stocks/{self.stock.pk}/historical_data/?period=1mo')
+        
+        self.assertEqual(len(FakeProvider.calls), 2)
+        self.assertEqual(FakeProvider.calls[-1][1]['start'], last_stored.strftime('%Y-%m-%d'))
+        self.assertEqual(history_cache.get_stats()['partial'], 1)
+        self.assertEqual(StockPrice.objects.filter(stock=self.stock).latest('date').date,
+                         history_cache.stored_history(self.stock).index[-1].date())
+    
+    @override_settings(MARKET_DATA_COVERAGE_CACHE='default')
+    def test_coverage_cache_alias_comes_from_settings(self):
+        self.client.get(f'/api/stocks/{self.stock.pk}/historical_data/?period=1mo')
+        
+        key = f'{history_cache.KEY_PREFIX}:coverage:{self.stock.pk}'
+        self.assertEqual(cache.get(key)['checked'], timezone.localdate())
+        self.assertIsNone(caches['market_data'].get(key))
+    
+    def test_longer_period_fetches_the_whole_period(self):
+        self.client.get(f'/api/stocks/{self.stock.pk}/historical_data/?period=5d')
+        
+        self.client.get(f'/api/stocks/{self.stock.pk}/historical_data/?period=1y')
+        
+        self.assertEqual(FakeProvider.calls[-1][1], {'period': '1y', 'interval': '1d'})
+    
+    def test_intraday_frames_are_cached_per_request_shape(self):
+        for _ in range(2):
+            history_cache.get_history(self.stock, '1d', '5m')
+        history_cache.get_history(self.stock, '5d', '5m')
+        
+        self.assertEqual(len(FakeProvider.calls), 2)
+        self.assertEqual(history_cache.get_stats(), {'hits': 1, 'partial': 0, 'misses': 2})
+
+@override_settings(MARKET_DATA_PROVIDER='stock_app.tests.FakeProvider')
+class HistoricalDataFormatTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.stock = Stock.objects.create(symbol='AAA', company_name='AAA Inc')
+    
+    def test_columnar_format_matches_rows(self):
+        url = f'/api/stocks/{self.stock.pk}/historical_data/?period=1mo'
+        rows = self.client.get(url).data
+        columns = self.client.get(url + '&format=columnar').json()
+        
+        self.assertEqual(list(columns), ['date', 'open', 'high', 'low', 'close', 'volume'])
+        self.assertEqual(columns_to_rows(columns), rows)
+        self.assertEqual(len(columns['date']), 20)
+
+class PortfolioPerformanceTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='investor')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.portfolio = UserPortfolio.objects.create(user=self.user, name='Main')
+        self.aaa = Stock.objects.create(symbol='AAA', company_name='AAA Inc', current_price=12)
+        self.bbb = Stock.objects.create(symbol='BBB', company_name='BBB Inc', current_price=45)
+        
+        # AAA trades every day from Jan 1 at 10, 11, 12, ...; BBB only every other day at 50
+        start = date(2024, 1, 1)
+        StockPrice.objects.bulk_create([
+            StockPrice(stock=self.aaa, date=start + timedelta(days=i), open_price=10 + i, high_price=10 + i,
+                       low_price=10 + i, close_price=10 + i, adjusted_close=10 + i, volume=100)
+            for i in range(6)
+        ] + [
+            StockPrice(stock=self.bbb, date=start + timedelta(days=i), open_price=50, high_price=50,
+                       low_price=50, close_price=50, adjusted_close=50, volume=100)
+            for i in range(0, 6, 2)
+        ])
+        PortfolioStock.objects.create(portfolio=self.portfolio, stock=self.aaa, shares=10,
+                                      purchase_price=10, purchase_date=start)
+        PortfolioStock.objects.create(portfolio=self.portfolio, stock=self.bbb, shares=2,
+                                      purchase_price=40, purchase_date=start + timedelta(days=3))
+    
+    def test_performance_is_a_single_query(self):
+        with self.assertNumQueries(1):
+            performance = portfolio_performance(self.portfolio)
+        
+        self.assertEqual(performance['total_investment'], 180)
+        self.assertEqual(performance['current_value'], 210)
+        self.assertEqual(performance['total_gain_loss'], 30)
+        self.assertEqual([stock['symbol'] for stock in performance['stocks']], ['AAA', 'BBB'])
+        self.assertEqual(performance['stocks'][1]['gain_loss'], 10)
+        self.assertEqual(performance['stocks'][1]['gain_loss_percent'], 12.5)
+    
+    def test_empty_portfolio_is_rejected(self):
+        empty = UserPortfolio.objects.create(user=self.user, name='Empty')
+        
+        response = self.client.get(f'/api/portfolios/{empty.pk}/performance/')
+        
+        self.assertEqual(response.status_code, 400)
+    
+    def test_history_counts_holdings_from_purchase_and_carries_closes_forward(self):
+        response = self.client.get(f'/api/portfolios/{self.portfolio.pk}/performance_history/'
+                                   '?start=2024-01-02&end=2024-01-05')
+        
+        self.assertEqual(response.data, [
+            {'date': '2024-01-02', 'value': 110.0, 'investment': 100.0},
+            {'date': '2024-01-03', 'value': 120.0, 'investment': 100.0},
+            {'date': '2024-01-04', 'value': 230.0, 'investment': 180.0},
+            {'date': '2024-01-05', 'value': 240.0, 'investment': 180.0},
+        ])
+    
+    def test_history_rejects_bad_dates(self):
+        response = self.client.get(f'/api/portfolios/{self.portfolio.pk}/performance_history/?start=soon')
+        
+        self.assertEqual(response.status_code, 400)
+
+class ListQueryCountTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='investor')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.stocks = [Stock.objects.create(symbol=f'S{i}', company_name=f'Stock {i}', current_price=10 + i)
+                       for i in range(6)]
+        self.add_portfolios(2)
+        self.add_watchlists(2)
+    
+    def add_portfolios(self, count):
+        for _ in range(count):
+            portfolio = UserPortfolio.objects.create(user=self.user, name=f'Portfolio {UserPortfolio.objects.count()}')
+            for stock in self.stocks:
+                PortfolioStock.objects.create(portfolio=portfolio, stock=stock, shares=2,
+                                              purchase_price=5, purchase_date=date(2024, 1, 1))
+    
+    def add_watchlists(self, count):
+        for _ in range(count):
+            watchlist = WatchList.objects.create(user=self.user, name=f'Watchlist {WatchList.objects.count()}')
+            watchlist.stocks.set(self.stocks)
+    
+    def test_portfolio_list(self):
+        # Page count, portfolios with users and totals, then holdings with their stocks
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/portfolios/')
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertEqual(response.data['results'][0]['total_value'], 2 * sum(range(10, 16)))
+        
+        self.add_portfolios(5)
+        with self.assertNumQueries(3):
+            results = self.client.get('/api/portfolios/').data['results']
+        # Newest first, as in UserPortfolio.Meta.ordering
+        self.assertEqual([portfolio['name'] for portfolio in results],
+                         [f'Portfolio {n}' for n in range(6, -1, -1)])
+    
+    def test_portfolio_retrieve(self):
+        portfolio = UserPortfolio.objects.first()
+        
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/portfolios/{portfolio.pk}/')
+        
+        self.assertEqual(len(response.data['stocks']), 6)
+        self.assertEqual(response.data['stocks'][0]['stock_details']['symbol'], 'S0')
+    
+    def test_watchlist_list(self):
+        with self.assertNumQueries(3):
+            self.assertEqual(len(self.client.get('/api/watchlists/').data['results']), 2)
+        
+        self.add_watchlists(5)
+        with self.assertNumQueries(3):
+            self.assertEqual(len(self.client.get('/api/watchlists/').data['results']), 7)
+    
+    def test_watchlist_retrieve(self):
+        watchlist = WatchList.objects.first()
+        
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/watchlists/{watchlist.pk}/')
+        
+        self.assertEqual(len(response.data['stocks']), 6)
+
+class StockDetailPricesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.stock = Stock.objects.create(symbol='TEST', company_name='Test Corp')
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_price_history(self.stock, synthetic_history(150))
+    
+    def test_embeds_snapshot_without_reading_prices(self):
+        url = f'/api/stocks/{self.stock.pk}/'
+        
+        # The ETag version, the Stock lookup and the snapshot's version check
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        
+        live = StockPriceListSerializer(self.stock.prices.all()[:30], many=True).data
+        self.assertEqual(response.data['historical_prices'], live)
+        self.assertEqual(len(self.client.get(url + '?prices=5').data['historical_prices']), 5)
+        self.assertEqual(len(self.client.get(url + '?prices=1000').data['historical_prices']), 100)
+        self.assertNotIn('historical_prices', self.client.get(url + '?prices=0').data)
+    
+    def test_snapshot_follows_ingestion(self):
+        hist = synthetic_history(1, start='2001-01-01')
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_price_history(self.stock, hist)
+        
+        self.assertEqual(recent_prices(self.stock.pk, 1)[0]['date'], '2001-01-01')
+    
+    def test_missing_snapshot_is_rebuilt(self):
+        cache.clear()
+        
+        self.assertEqual(len(recent_prices(self.stock.pk)), 30)
+        with self.assertNumQueries(1):
+            recent_prices(self.stock.pk)
+    
+    def test_snapshot_is_rebuilt_after_writes_elsewhere(self):
+        recent_prices(self.stock.pk)
+        
+        # Another worker writes a bar; only the shared version tells this one
+        StockPrice.objects.create(stock=self.stock, date=date(2001, 1, 1), open_price=1, high_price=1,
+                                  low_price=1, close_price=1, adjusted_close=1, volume=1)
+        bump_versions([self.stock.pk])
+        
+        self.assertEqual(recent_prices(self.stock.pk, 1)[0]['date'], '2001-01-01')
+
+class StockPricePaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.stocks = [Stock.objects.create(symbol=symbol, company_name=symbol) for symbol in ['AAA', 'BBB']]
+        for stock in self.stocks:
+            ingest_price_history(stock, synthetic_history(12))
+    
+    def walk(self, url):
+        keys = []
+        while url:
+            response = self.client.get(url)
+            keys += [(row['stock'], row['date']) for row in response.data['results']]
+            url = response.data['next']
+        return keys, response
+    
+    def test_walks_every_row_once_in_key_order(self):
+        # The ETag version, then the page
+        with self.assertNumQueries(2):
+            first = self.client.get('/api/stock-prices/?page_size=5')
+        self.assertNotIn('count', first.data)
+        self.assertIsNone(first.data['previous'])
+        
+        keys, _ = self.walk('/api/stock-prices/?page_size=5')
+        
+        expected = sorted(StockPrice.objects.values_list('stock_id', 'date'), key=lambda key: (key[0], -key[1].toordinal()))
+        self.assertEqual(keys, [(stock_id, day.isoformat()) for stock_id, day in expected])
+        
+        oldest_first, _ = self.walk('/api/stock-prices/?page_size=5&ordering=date')
+        self.assertEqual(oldest_first, sorted(keys))
+    
+    def test_previous_link_returns_the_page_before(self):
+        first = self.client.get('/api/stock-prices/?page_size=5').data
+        second = self.client.get(first['next']).data
+        
+        self.assertEqual(self.client.get(second['previous']).data['results'], first['results'])
+    
+    def test_symbol_and_days_filters(self):
+        # The symbol is resolved once for both the ETag version and the page
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/stock-prices/?symbol=BBB&page_size=50')
+        self.assertEqual({row['stock'] for row in response.data['results']}, {self.stocks[1].pk})
+        self.assertEqual(len(response.data['results']), 12)
+        
+        self.assertEqual(self.client.get('/api/stock-prices/?symbol=ZZZ').data['results'], [])
+        self.assertEqual(self.client.get('/api/stock-prices/?days=30').data['results'], [])
+    
+    def test_rejects_bad_cursor(self):
+        self.assertEqual(self.client.get('/api/stock-prices/?cursor=nonsense').status_code, 404)
+
+class PriceExportTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        for symbol in ['AAA', 'BBB', 'CCC']:
+            stock = Stock.objects.create(symbol=symbol, company_name=symbol)
+            ingest_price_history(stock, synthetic_history(30))
+    
+    def test_streams_csv_for_symbols_and_range(self):
+        response = self.client.get('/api/stock-prices/export/?symbols=BBB,AAA&start=2000-01-10&end=2000-01-20')
+        
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'symbol,date,open,high,low,close,adjusted_close,volume')
+        rows = [line.split(',') for line in lines[1:]]
+        self.assertEqual({row[0] for row in rows}, {'AAA', 'BBB'})
+        self.assertEqual(min(row[1] for row in rows), '2000-01-10')
+        self.assertEqual(max(row[1] for row in rows), '2000-01-20')
+        
+        stored = StockPrice.objects.get(stock__symbol=rows[0][0], date=rows[0][1])
+        self.assertEqual(Decimal(rows[0][5]), stored.close_price)
+    
+    def test_ndjson_matches_csv(self):
+        csv_rows = b''.join(self.client.get('/api/stock-prices/export/').streaming_content).decode().splitlines()
+        ndjson = b''.join(self.client.get('/api/stock-prices/export/?output=ndjson').streaming_content)
+        
+        records = [json.loads(line) for line in ndjson.decode().splitlines()]
+        self.assertEqual(len(records), 90)
+        self.assertEqual(len(csv_rows), 91)
+        self.assertEqual(list(records[0]), csv_rows[0].split(','))
+    
+    def test_arrow_stream_round_trips(self):
+        import pyarrow as pa
+        
+        response = self.client.get('/api/stock-prices/export/?output=arrow&symbols=AAA')
+        self.assertEqual(response['Content-Type'], 'application/vnd.apache.arrow.stream')
+        table = pa.ipc.open_stream(b''.join(response.streaming_content)).read_all()
+        
+        self.assertEqual(table.column_names, ['symbol', 'date', 'open', 'high', 'low', 'close',
+                                              'adjusted_close', 'volume'])
+        self.assertEqual(table.num_rows, 30)
+        first = table.slice(0, 1).to_pylist()[0]
+        stored = StockPrice.objects.get(stock__symbol='AAA', date=first['date'])
+        self.assertEqual(first['close'], float(stored.close_price))
+        self.assertEqual(first['volume'], stored.volume)
+    
+    def test_rejects_unknown_output(self):
+        self.assertEqual(self.client.get('/api/stock-prices/export/?output=xml').status_code, 400)
+        
+        with mock.patch('stock_app.export.pa', None):
+            response = self.client.get('/api/stock-prices/export/?output=arrow')
+        self.assertEqual(response.status_code, 406)
+        self.assertIn('pyarrow', response.data['error'])
+
+class ResampleTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.stock = Stock.objects.create(symbol='TEST', company_name='Test Corp')
+        # 2000-01-03 is a Monday, so 20 business days are four full weeks
+        ingest_price_history(self.stock, synthetic_history(20))
+    
+    def test_weekly_bars_follow_ohlcv_semantics(self):
+        daily = history_cache.stored_history(self.stock)
+        
+        weekly = resample_ohlcv(daily, '1wk')
+        
+        self.assertEqual(len(weekly), 4)
+        first_week = daily.iloc[:5]
+        self.assertEqual(weekly.index[0], daily.index[0])
+        self.assertEqual(weekly['Open'].iloc[0], first_week['Open'].iloc[0])
+        self.assertEqual(weekly['High'].iloc[0], first_week['High'].max())
+        self.assertEqual(weekly['Low'].iloc[0], first_week['Low'].min())
+        self.assertEqual(weekly['Close'].iloc[0], first_week['Close'].iloc[-1])
+        self.assertEqual(weekly['Volume'].iloc[0], first_week['Volume'].sum())
+    
+    def test_n_day_bars_count_from_the_first_bar(self):
+        bars = resample_ohlcv(history_cache.stored_history(self.stock), '7d')
+        
+        self.assertEqual(list(bars.index.strftime('%Y-%m-%d')), ['2000-01-03', '2000-01-10', '2000-01-17', '2000-01-24'])
+    
+    def test_lttb_keeps_endpoints_and_extremes(self):
+        y = np.zeros(101)
+        y[37], y[71] = 50, -50
+        
+        keep = lttb_indices(y, 10)
+        
+        self.assertEqual(len(keep), 10)
+        self.assertEqual((keep[0], keep[-1]), (0, 100))
+        self.assertIn(37, keep)
+        self.assertIn(71, keep)
+        self.assertTrue((np.diff(keep) > 0).all())
+    
+    def test_endpoint(self):
+        url = f'/api/stocks/{self.stock.pk}/resample/'
+        
+        self.assertEqual(len(self.client.get(url + '?interval=1mo').data), 1)
+        self.assertEqual(len(self.client.get(url + '?max_points=8').data), 8)
+        self.assertEqual(len(self.client.get(url + '?interval=1wk&max_points=3&format=columnar').json()['close']), 3)
+        self.assertEqual(self.client.get(url + '?interval=2h').status_code, 400)
+        self.assertEqual(self.client.get(url + '?max_points=2').status_code, 400)
+
+class IndicatorTests(TestCase):
+    specs = [('sma', (20,)), ('ema', (10,)), ('rsi', (14,)), ('macd', (12, 26, 9)), ('bollinger', (20, 2))]
+    
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.stock = Stock.objects.create(symbol='TEST', company_name='Test Corp')
+        self.hist = synthetic_history(300)
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_price_history(self.stock, self.hist.iloc[:250])
+    
+    def fresh(self):
+        cache.clear()
+        return indicator_frame(self.stock.pk, self.specs)
+    
+    def test_running_in_pieces_matches_one_pass(self):
+        close = self.hist['Close'].to_numpy()
+        for name, indicator in INDICATORS.items():
+            whole, _ = indicator.function(close, None, *indicator.defaults)
+            first, state = indicator.function(close[:1], None, *indicator.defaults)
+            middle, state = indicator.function(close[1:120], state, *indicator.defaults)
+            last, state = indicator.function(close[120:], state, *indicator.defaults)
+            for output, values in whole.items():
+                pieces = np.concatenate([first[output], middle[output], last[output]])
+                np.testing.assert_allclose(pieces, values, err_msg=f'{name} {output}')
+    
+    def test_matches_pandas_reference(self):
+        frame = indicator_frame(self.stock.pk, self.specs)
+        close = history_cache.stored_history(self.stock)['Close']
+        
+        np.testing.assert_allclose(frame['sma_20'], close.rolling(20).mean())
+        np.testing.assert_allclose(frame['ema_10'], close.ewm(span=10, adjust=False).mean())
+        np.testing.assert_allclose(frame['bollinger_20_2_upper'],
+                                   close.rolling(20).mean() + 2 * close.rolling(20).std(ddof=0))
+        self.assertEqual(list(frame.columns[-6:]), [
+            'macd_12_26_9', 'macd_12_26_9_signal', 'macd_12_26_9_histogram',
+            'bollinger_20_2_middle', 'bollinger_20_2_upper', 'bollinger_20_2_lower',
+        ])
+    
+    def test_warm_cache_only_reads_new_bars(self):
+        # Cold: the archive checksums, then every close read once for all indicators
+        with self.assertNumQueries(2):
+            indicator_frame(self.stock.pk, self.specs)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_price_history(self.stock, self.hist.iloc[250:])
+        # Warm: the archive checksums, then the archived years from the checkpoint's on
+        with self.assertNumQueries(2):
+            extended = indicator_frame(self.stock.pk, self.specs)
+        
+        self.assertEqual(len(extended), 300)
+        pd.testing.assert_frame_equal(extended, self.fresh())
+    
+    def test_rewritten_history_is_recomputed(self):
+        indicator_frame(self.stock.pk, self.specs)
+        StockPrice.objects.filter(stock=self.stock, date='2000-02-01').update(close_price=1)
+        # QuerySet.update() bypasses the signals
+        refresh_archive([self.stock.pk])
+        
+        pd.testing.assert_frame_equal(indicator_frame(self.stock.pk, self.specs), self.fresh())
+    
+    def test_revision_before_the_checkpoint_year_is_recomputed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_price_history(self.stock, self.hist.iloc[250:])
+        indicator_frame(self.stock.pk, self.specs)
+        # The checkpoint is in 2001; 2000 is validated by its archive checksum
+        StockPrice.objects.filter(stock=self.stock, date='2000-06-01').update(close_price=1)
+        refresh_archive([self.stock.pk])
+        
+        pd.testing.assert_frame_equal(indicator_frame(self.stock.pk, self.specs), self.fresh())
+    
+    def test_endpoint(self):
+        url = f'/api/stocks/{self.stock.pk}/indicators/'
+        
+        rows = self.client.get(url + '?indicators=sma:5,rsi&limit=3').data
+        
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(list(rows[0]), ['date', 'sma_5', 'rsi_14'])
+        self.assertIsNone(self.client.get(url + '?indicators=sma:5').data[0]['sma_5'])
+        self.assertEqual(self.client.get(url + '?indicators=sma:1').status_code, 400)
+        self.assertEqual(self.client.get(url + '?indicators=vwap').status_code, 400)
+        for limit in ['abc', '-5', '0', '']:
+            self.assertEqual(self.client.get(url + f'?limit={limit}').status_code, 400, limit)
+        with override_settings(INDICATORS_MAX_LIMIT=10):
+            self.assertEqual(len(self.client.get(url + '?limit=100').data), 10)
+    
+    def test_rsi_is_seeded_with_simple_averages(self):
+        close = self.hist['Close'].to_numpy()
+        changes = np.diff(close)
+        gains, losses = np.clip(changes, 0, None), np.clip(-changes, 0, None)
+        # Wilder: simple means of the first 14 changes, then (previous * 13 + change) / 14
+        gain, loss = gains[:14].mean(), losses[:14].mean()
+        expected = [np.nan] * 14 + [100 - 100 / (1 + gain / loss)]
+        for up, down in zip(gains[14:], losses[14:]):
+            gain, loss = (gain * 13 + up) / 14, (loss * 13 + down) / 14
+            expected.append(100 - 100 / (1 + gain / loss))
+        
+        values, _ = INDICATORS['rsi'].function(close, None, 14)
+        np.testing.assert_allclose(values['rsi'], expected)
+
+class StockStatsTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.stock = Stock.objects.create(symbol='TEST', company_name='Test Corp', sector='Tech')
+        self.other = Stock.objects.create(symbol='OTHER', company_name='Other Corp', sector='Tech')
+        self.hist = synthetic_history(400)
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_price_history(self.stock, self.hist)
+    
+    def test_stats_follow_ingested_prices(self):
+        today = self.hist.index[-1].date()
+        refresh_stats([self.stock.pk], today=today)
+        stats = Stock.objects.select_related('stats').get(pk=self.stock.pk).stats
+        hist = history_cache.stored_history(self.stock)
+        year = hist[hist.index > pd.Timestamp(today - timedelta(days=365))]
+        
+        self.assertEqual(stats.latest_date, today)
+        self.assertAlmostEqual(float(stats.latest_close), hist['Close'].iloc[-1], places=2)
+        self.assertAlmostEqual(float(stats.previous_close), hist['Close'].iloc[-2], places=2)
+        self.assertAlmostEqual(stats.average_volume, hist['Volume'].iloc[-11:-1].mean())
+        self.assertAlmostEqual(float(stats.high_52w), year['High'].max(), places=2)
+        self.assertAlmostEqual(float(stats.low_52w), year['Low'].min(), places=2)
+        self.assertAlmostEqual(stats.return_1m, (hist['Close'].iloc[-1] / hist['Close'].iloc[-22] - 1) * 100)
+    
+    def test_rebuild_command(self):
+        StockStats.objects.all().delete()
+        
+        call_command('rebuild_stock_stats', stdout=StringIO())
+        
+        self.assertEqual(StockStats.objects.count(), 2)
+        self.assertIsNone(StockStats.objects.get(stock=self.other).latest_close)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_stock_stats', 'MISSING', stdout=StringIO())
+    
+    def test_screener_filters_on_stats(self):
+        refresh_stats([self.other.pk])
+        return_1m = StockStats.objects.get(stock=self.stock).return_1m
+        
+        above = self.client.get(f'/api/stocks/?stats__return_1m__gte={return_1m - 1}').data['results']
+        below = self.client.get(f'/api/stocks/?stats__return_1m__lte={return_1m - 1}').data['results']
+        
+        self.assertEqual([stock['symbol'] for stock in above], ['TEST'])
+        self.assertEqual(below, [])
+        self.assertAlmostEqual(above[0]['stats']['return_1m'], return_1m)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+    
+    def __call__(self):
+        return self.now
+    
+    def sleep(self, seconds):
+        self.now += seconds
+
+@override_settings(MARKET_DATA_PROVIDER='stock_app.tests.FakeProvider', MARKET_DATA_RATE_LIMIT=0,
+                   MARKET_DATA_LEASE_CACHE='default')
+class MarketDataRefresherTests(TestCase):
+    def setUp(self):
+        user = User.objects.create(username='trader')
+        self.watched = Stock.objects.create(symbol='AAA', company_name='Watched')
+        self.held = Stock.objects.create(symbol='BROKEN', company_name='Held')
+        self.idle = Stock.objects.create(symbol='CCC', company_name='Idle')
+        WatchList.objects.create(user=user, name='Main').stocks.add(self.watched)
+        portfolio = UserPortfolio.objects.create(user=user, name='Main')
+        PortfolioStock.objects.create(portfolio=portfolio, stock=self.held, shares=1,
+                                      purchase_price=1, purchase_date=date(2024, 1, 2))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.alert = Alert.objects.create(user=user, stock=self.watched, alert_type='price_above', value=1)
+        self.clock = FakeClock()
+        self.refresher = MarketDataRefresher(interval=60, untracked_every=2, backoff_base=60, backoff_max=100,
+                                             clock=self.clock, sleep=self.clock.sleep)
+    
+    def cycle(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.refresher.run_cycle()
+    
+    def test_tracked_symbols_come_first(self):
+        self.assertEqual(prioritized_symbols(), [('AAA', TRACKED), ('BROKEN', TRACKED), ('CCC', UNTRACKED)])
+    
+    def test_cycle_stores_prices_and_evaluates_alerts(self):
+        result = self.cycle()
+        
+        self.assertEqual((result.refreshed, result.failed, result.skipped), (2, 1, 0))
+        self.assertEqual(result.prices, StockPrice.objects.count())
+        self.assertEqual(result.alerts_triggered, 1)
+        self.assertTrue(Alert.objects.get(pk=self.alert.pk).triggered)
+        self.assertEqual(Stock.objects.get(pk=self.idle.pk).company_name, 'CCC Inc')
+        self.assertIsNotNone(StockStats.objects.get(stock=self.watched).latest_close)
+    
+    def test_alerts_created_after_start_fire_without_a_refresh_of_their_stock(self):
+        self.cycle()
+        Alert.objects.bulk_create([Alert(user=self.alert.user, stock=self.idle, alert_type='price_above', value=1)])
+        
+        # Untracked CCC is not fetched this cycle, but its stored price crosses the threshold
+        result = self.cycle()
+        
+        self.assertNotIn('CCC', self.refresher.due_symbols(1)[0])
+        self.assertEqual(result.alerts_triggered, 1)
+        self.assertTrue(Alert.objects.get(stock=self.idle).triggered)
+    
+    def test_failing_symbols_back_off_exponentially(self):
+        self.cycle()
+        # Second cycle: untracked stocks wait, BROKEN backs off for 60s
+        self.assertEqual(self.refresher.due_symbols(1), (['AAA'], 1))
+        
+        self.clock.sleep(60)
+        self.cycle()
+        self.assertEqual(self.refresher.backoff.failures('BROKEN'), 2)
+        # 120s, capped at backoff_max
+        self.clock.sleep(99)
+        self.assertFalse(self.refresher.backoff.ready('BROKEN'))
+        self.clock.sleep(1)
+        self.assertTrue(self.refresher.backoff.ready('BROKEN'))
+    
+    def test_run_waits_out_the_interval(self):
+        cycles = []
+        with self.captureOnCommitCallbacks(execute=True):
+            self.refresher.run(cycles=2, on_cycle=cycles.append)
+        
+        self.assertEqual(len(cycles), 2)
+        self.assertEqual(self.clock.now, 60)
+
+class ReplayProviderTests(TestCase):
+    def test_synthetic_history_is_deterministic(self):
+        first, second = ReplayProvider(synthetic_rows=300), ReplayProvider(synthetic_rows=300)
+        
+        hist = first.get_history('AAA', period='1mo')
+        
+        pd.testing.assert_frame_equal(hist, second.get_history('AAA', period='1mo'))
+        # Ends on the latest business day
+        self.assertGreater(hist.index[-1].date(), timezone.localdate() - timedelta(days=3))
+        self.assertEqual((hist.index[-1] - hist.index[0]).days // 7, 4)
+        self.assertEqual(first.get_info('AAA')['currentPrice'], hist['Close'].iloc[-1])
+        self.assertFalse(hist.equals(first.get_history('BBB', period='1mo')))
+    
+    def test_replays_recorded_fixtures(self):
+        stock = Stock.objects.create(symbol='REC', company_name='Recorded')
+        ingest_price_history(stock, synthetic_history(50))
+        with tempfile.TemporaryDirectory() as path:
+            call_command('record_market_data', 'REC', output_dir=path, source='database', stdout=StringIO())
+            provider = ReplayProvider(path=path, synthetic=False)
+            
+            hist = provider.get_history('REC', start='2000-01-10', end='2000-01-17')
+            weekly = provider.get_history('REC', period='max', interval='1wk')
+            
+            self.assertEqual(list(hist.index.date), [date(2000, 1, d) for d in [10, 11, 12, 13, 14]])
+            self.assertEqual(weekly['Volume'].sum(), synthetic_history(50)['Volume'].sum())
+            self.assertEqual(provider.get_info('MISSING'), {})
+            self.assertTrue(provider.get_history('REC', period='5d', interval='5m').empty)
+    
+    def test_injects_latency_and_errors(self):
+        provider = ReplayProvider(latency=0.01, error_rate=0.5, fail_symbols=['DOWN'], seed=7)
+        
+        started = time.monotonic()
+        outcomes = [self.succeeds(provider) for _ in range(20)]
+        
+        self.assertGreaterEqual(time.monotonic() - started, 0.2)
+        self.assertTrue(any(outcomes) and not all(outcomes))
+        # Same seed, same failures
+        replay = ReplayProvider(error_rate=0.5, seed=7)
+        self.assertEqual([self.succeeds(replay) for _ in range(20)], outcomes)
+        with self.assertRaises(ConnectionError):
+            provider.get_history('DOWN', period='1mo')
+    
+    @staticmethod
+    def succeeds(provider):
+        try:
+            provider.get_info('AAA')
+            return True
+        except ConnectionError:
+            return False
+    
+    @override_settings(MARKET_DATA_PROVIDER='stock_app.providers.ReplayProvider')
+    def test_fetch_data_runs_offline(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create(username='trader'))
+        
+        response = client.post('/api/stocks/fetch_data/', {'symbol': 'OFFL'}, format='json')
+        
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['company_name'], 'OFFL (replay)')
+        self.assertGreater(StockPrice.objects.filter(stock__symbol='OFFL').count(), 15)
+
+class BenchmarkDatasetTests(TestCase):
+    def test_generates_requested_sizes(self):
+        dataset = generate_dataset(stocks=4, years=1, portfolios=6, alerts=10)
+        
+        self.assertEqual(len(dataset['stocks']), 4)
+        self.assertEqual(StockPrice.objects.count(), 4 * 252)
+        self.assertEqual(UserPortfolio.objects.count(), 6)
+        self.assertEqual(PortfolioStock.objects.count(), 60)
+        self.assertEqual(Alert.objects.filter(is_active=True).count(), 10)
+        self.assertLessEqual(StockPrice.objects.latest('date').date, timezone.localdate())
+    
+    def test_summarize(self):
+        summary = summarize([0.001 * i for i in range(1, 101)], [2] * 99 + [5])
+        
+        self.assertAlmostEqual(summary['p50_ms'], 50.5)
+        self.assertAlmostEqual(summary['p99_ms'], 99.01)
+        self.assertEqual((summary['queries'], summary['max_queries']), (2, 5))
+
+@override_settings(MARKET_DATA_PROVIDER='stock_app.tests.FakeProvider', MARKET_DATA_RATE_LIMIT=0,
+                   SLOW_REQUEST_MS=None, METRICS_TOKEN='secret', METRICS_DIR=None)
+class MetricsTests(TestCase):
+    def setUp(self):
+        reset_metrics()
+        self.addCleanup(reset_metrics)
+        self.client = APIClient()
+        self.stock = Stock.objects.create(symbol='AAA', company_name='A Corp')
+    
+    def scrape(self):
+        response = self.client.get('/api/metrics/', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        return response.content.decode()
+    
+    def test_records_requests_queries_and_provider_time(self):
+        self.client.force_authenticate(User.objects.create(username='trader'))
+        self.client.get('/api/stocks/')
+        self.client.get('/api/stocks/')
+        self.client.post('/api/stocks/fetch_data/', {'symbol': 'BBB'}, format='json')
+        
+        text = self.scrape()
+        
+        self.assertIn('stock_app_requests_total{view="stock-list",method="GET",status="200"} 2', text)
+        self.assertIn('stock_app_request_duration_seconds_count{view="stock-list",method="GET"} 2', text)
+        self.assertIn('stock_app_request_queries_bucket{view="stock-list",method="GET",le="+Inf"} 2', text)
+        self.assertIn('stock_app_request_provider_seconds_total{view="stock-fetch-data",method="POST"}', text)
+        self.assertIn('stock_app_provider_call_duration_seconds_count{call="get_info",outcome="ok"} 1', text)
+    
+    @override_settings(SLOW_REQUEST_MS=0)
+    def test_slow_log_lists_repeated_statements(self):
+        with self.assertLogs('stock_app.slow_requests', 'WARNING') as logs:
+            self.client.get(f'/api/stocks/{self.stock.pk}/')
+        
+        self.assertIn(f'GET /api/stocks/{self.stock.pk}/ -> 200', logs.output[0])
+        self.assertEqual(fingerprint('SELECT 1 FROM t WHERE id IN (%s, %s, %s) LIMIT 21'),
+                         'SELECT N FROM t WHERE id IN (...) LIMIT N')
+    
+    def test_totals_of_all_workers_are_served(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        # Another worker's totals, as written by write_metrics()
+        (Path(directory.name) / 'other.json').write_text(json.dumps({
+            'stock_app_requests_total': [[['stock-list', 'GET', 200], 3]],
+            'stock_app_request_duration_seconds': [[['stock-list', 'GET'], [1] + [0] * 11, 0.004, 1]],
+        }))
+        
+        with override_settings(METRICS_DIR=directory.name):
+            self.client.get('/api/stocks/')
+            self.client.get('/api/stocks/')
+            text = self.scrape()
+        
+        self.assertIn('stock_app_requests_total{view="stock-list",method="GET",status="200"} 5', text)
+        self.assertIn('stock_app_request_duration_seconds_count{view="stock-list",method="GET"} 3', text)
+        self.assertEqual(len(list(Path(directory.name).glob('*.json'))), 2)
+    
+    def test_access(self):
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 401)
+        self.assertEqual(self.client.get('/api/metrics/', HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+        self.assertEqual(self.client.get('/api/metrics/', HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+        
+        self.client.force_login(User.objects.create(username='trader'))
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 401)
+        self.client.force_login(User.objects.create(username='admin', is_staff=True))
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 200)
+        
+        with override_settings(METRICS_TOKEN=None):
+            self.client.logout()
+            self.assertEqual(self.client.get('/api/metrics/').status_code, 401)
+
+class PriceArchiveTests(TestCase):
+    def setUp(self):
+        self.stock = Stock.objects.create(symbol='TEST', company_name='Test Corp')
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_price_history(self.stock, synthetic_history(600))
+    
+    def test_matches_stored_prices(self):
+        archived = archive_history(self.stock.pk)
+        
+        self.assertEqual(list(PriceArchive.objects.filter(stock=self.stock).values_list('year', flat=True)),
+                         [2000, 2001, 2002])
+        pd.testing.assert_frame_equal(archived, history_cache.stored_history(self.stock), check_dtype=False)
+        ranged = archive_history(self.stock.pk, date(2000, 12, 28), date(2001, 1, 3))
+        self.assertEqual(list(ranged.index.date), [date(2000, 12, 28), date(2000, 12, 29),
+                                                   date(2001, 1, 1), date(2001, 1, 2), date(2001, 1, 3)])
+    
+    def test_only_changed_years_are_repacked(self):
+        before = dict(PriceArchive.objects.values_list('year', 'updated_at'))
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_price_history(self.stock, synthetic_history(3, start='2002-04-01', seed=5))
+            StockPrice.objects.filter(stock=self.stock, date__year=2000).first().delete()
+        
+        after = dict(PriceArchive.objects.values_list('year', 'updated_at'))
+        self.assertNotEqual(after[2000], before[2000])
+        self.assertEqual(after[2001], before[2001])
+        self.assertNotEqual(after[2002], before[2002])
+        pd.testing.assert_frame_equal(archive_history(self.stock.pk), history_cache.stored_history(self.stock),
+                                      check_dtype=False)
+    
+    def test_missing_archive_is_built_on_read(self):
+        PriceArchive.objects.all().delete()
+        
+        self.assertEqual(len(archive_history(self.stock.pk)), 600)
+        self.assertEqual(PriceArchive.objects.count(), 3)
+
+class PriceMatrixTests(TestCase):
+    def setUp(self):
+        self.test = Stock.objects.create(symbol='TEST', company_name='Test Corp')
+        self.other = Stock.objects.create(symbol='OTHER', company_name='Other Corp')
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_price_history(self.test, synthetic_history(300))
+            ingest_price_history(self.other, synthetic_history(100, start='2000-06-01', seed=1))
+        
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        settings = override_settings(PRICE_MATRIX_DIR=self.directory)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.client = APIClient()
+    
+    def stored(self, stock, field='adjusted_close'):
+        return pd.Series(dict(StockPrice.objects.filter(stock=stock).order_by('date').values_list('date', field)), dtype=float)
+    
+    def test_build_matches_stored_prices(self):
+        index = build_price_matrix()
+        closes = get_price_matrix().frame('close')
+        
+        self.assertEqual(index['symbols'], ['OTHER', 'TEST'])
+        self.assertEqual(len(closes), 300)
+        np.testing.assert_allclose(closes['TEST'].to_numpy(), self.stored(self.test).to_numpy(), atol=0.005)
+        other = closes['OTHER'].dropna()
+        self.assertEqual(list(other.index.date), sorted(self.stored(self.other).index))
+        self.assertEqual(closes['OTHER'].isna().sum(), 200)
+        volumes = get_price_matrix().frame('volume', ['OTHER'])
+        self.assertEqual(volumes['OTHER'].sum(), self.stored(self.other, 'volume').sum())
+    
+    def test_appended_bars_are_written_in_place(self):
+        build_price_matrix()
+        before = get_price_matrix()
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_price_history(self.test, synthetic_history(5, start='2001-03-01', seed=2))
+        
+        index = json.loads((Path(self.directory) / 'index.json').read_text())
+        self.assertEqual(index['generation'], 1)
+        self.assertEqual(index['rows'], 305)
+        matrix = get_price_matrix()
+        self.assertIsNot(matrix, before)
+        dates, symbols, closes = matrix.closes(['TEST'], start=date(2001, 3, 1))
+        self.assertEqual(len(dates), 5)
+        np.testing.assert_allclose(closes[:, 0], self.stored(self.test)[-5:].to_numpy(), atol=0.005)
+        self.assertTrue(np.isnan(matrix.closes(['OTHER'], start=date(2001, 3, 1))[2]).all())
+        
+        # A new stock doesn't fit in the existing columns; only a rebuild adds it
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_price_history(Stock.objects.create(symbol='NEW'), synthetic_history(5, start='2001-03-01'))
+        self.assertEqual(get_price_matrix().symbols, ['OTHER', 'TEST'])
+        self.assertTrue(get_price_matrix().stale)
+        
+        build_price_matrix()
+        self.assertEqual(get_price_matrix().symbols, ['NEW', 'OTHER', 'TEST'])
+        self.assertFalse(get_price_matrix().stale)
+        self.assertEqual(sorted(p.name for p in Path(self.directory).glob('*.npy')),
+                         ['closes.2.npy', 'dates.2.npy', 'volumes.2.npy'])
+    
+    def test_back_dated_revisions_are_written(self):
+        build_price_matrix()
+        revised = synthetic_history(1, start='2000-03-01', seed=3)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_price_history(self.test, revised)
+        
+        dates, _, closes = get_price_matrix().closes(['TEST'], start=date(2000, 3, 1), end=date(2000, 3, 1))
+        self.assertEqual(len(dates), 1)
+        self.assertAlmostEqual(closes[0, 0], self.stored(self.test)[date(2000, 3, 1)], places=2)
+        self.assertFalse(get_price_matrix().stale)
+    
+    def test_bars_on_dates_without_a_row_are_left_out(self):
+        build_price_matrix()
+        before = get_price_matrix().frame('close', ['OTHER'])['OTHER'].copy()
+        last = self.stored(self.other).index[-1]
+        weekend = synthetic_history(1, seed=4)
+        weekend.index = pd.DatetimeIndex([last + timedelta(days=5 - last.weekday())], name='Date')
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_price_history(self.other, weekend)
+        
+        # Not written to the following Monday's row, where OTHER has no bar
+        matrix = get_price_matrix()
+        self.assertTrue(matrix.stale)
+        pd.testing.assert_series_equal(matrix.frame('close', ['OTHER'])['OTHER'], before)
+    
+    def test_matrix_endpoint(self):
+        response = self.client.get('/api/stocks/matrix/', {'symbols': 'test,other'})
+        self.assertEqual(response.status_code, 503)
+        
+        call_command('build_price_matrix', stdout=StringIO())
+        response = self.client.get('/api/stocks/matrix/', {'symbols': 'test,other', 'end': '2000-01-05',
+                                                           'format': 'columnar'})
+        self.assertEqual(response.status_code, 200)
+        columns = response.json()
+        self.assertEqual(columns['date'], ['2000-01-03', '2000-01-04', '2000-01-05'])
+        self.assertEqual(columns['OTHER'], [None, None, None])
+        self.assertEqual(len(columns['TEST']), 3)
+        
+        response = self.client.get('/api/stocks/matrix/', {'symbols': 'TEST,NOPE'})
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get('/api/stocks/matrix/', {'symbols': 'TEST', 'field': 'open'})
+        self.assertEqual(response.status_code, 400)
+
+@override_settings(ROOT_URLCONF='backend.async_urls', MARKET_DATA_PROVIDER='stock_app.tests.FakeProvider')
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        self.stock = Stock.objects.create(symbol='ASYNC', company_name='Async Corp')
+        self.url = f'/api/stocks/{self.stock.pk}/historical_data/'
+    
+    async def test_historical_data_matches_sync_action(self):
+        daily = await self.async_client.get(self.url, {'period': '1mo'})
+        weekly = await self.async_client.get(self.url, {'period': '3mo', 'interval': '1wk', 'format': 'columnar'})
+        with override_settings(ROOT_URLCONF='backend.urls'):
+            await sync_to_async(cache.clear)()
+            sync_daily = await self.async_client.get(self.url, {'period': '1mo'})
+            sync_weekly = await self.async_client.get(self.url, {'period': '3mo', 'interval': '1wk',
+                                                                 'format': 'columnar'})
+        
+        self.assertEqual(daily.status_code, 200)
+        self.assertEqual(daily.json(), sync_daily.json())
+        self.assertEqual(weekly.json(), sync_weekly.json())
+        self.assertEqual(await StockPrice.objects.filter(stock=self.stock).acount(), 20)
+        self.assertEqual((await self.async_client.get(self.url, {'period': '7y'})).status_code, 400)
+        self.assertEqual((await self.async_client.get('/api/stocks/0/historical_data/')).status_code, 404)
+    
+    @override_settings(MARKET_DATA_PROVIDER='stock_app.providers.ReplayProvider',
+                       MARKET_DATA_REPLAY={'path': None, 'latency': 0.2, 'synthetic_rows': 100})
+    async def test_upstream_waits_overlap(self):
+        reset_providers()
+        self.addCleanup(reset_providers)
+        stocks = [self.stock] + [await Stock.objects.acreate(symbol=f'ASYNC{i}') for i in range(4)]
+        
+        started = time.monotonic()
+        responses = await asyncio.gather(*(
+            self.async_client.get(f'/api/stocks/{stock.pk}/historical_data/', {'interval': '1wk'})
+            for stock in stocks
+        ))
+        
+        self.assertEqual([response.status_code for response in responses], [200] * 5)
+        # One after another they would take a second
+        self.assertLess(time.monotonic() - started, 0.6)
+    
+    async def test_fetch_data_authenticates_and_stores_prices(self):
+        response = await self.async_client.post('/api/stocks/fetch_data/', {'symbol': 'NEWCO'},
+                                                content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+        
+        user = await User.objects.acreate(username='trader')
+        await sync_to_async(self.async_client.force_login)(user)
+        response = await self.async_client.post('/api/stocks/fetch_data/', {'symbol': 'NEWCO'},
+                                                content_type='application/json')
+        missing = await self.async_client.post('/api/stocks/fetch_data/', {'symbol': 'XNONE'},
+                                               content_type='application/json')
+        
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['company_name'], 'NEWCO Inc')
+        self.assertEqual(await StockPrice.objects.filter(stock__symbol='NEWCO').acount(), 20)
+        self.assertEqual(missing.status_code, 404)
+
+@override_settings(MARKET_DATA_LEASE_CACHE='default')
+class SharedProviderTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker(cache, min_calls=4, error_rate=0.5, cooldown=30, clock=self.clock)
+    
+    def test_concurrent_calls_share_one_fetch(self):
+        replay = ReplayProvider(latency=0.2, synthetic_rows=100)
+        provider = SharedProvider(replay, breaker=self.breaker)
+        
+        with ThreadPoolExecutor(8) as pool:
+            frames = list(pool.map(lambda _: provider.get_history('AAA', period='1mo'), range(8)))
+        
+        self.assertEqual(replay.calls, 1)
+        for frame in frames[1:]:
+            pd.testing.assert_frame_equal(frame, frames[0])
+        provider.get_history('AAA', period='3mo')
+        self.assertEqual(replay.calls, 2)
+    
+    def test_async_calls_share_one_fetch(self):
+        replay = ReplayProvider(latency=0.2, synthetic_rows=100)
+        provider = SharedProvider(replay, breaker=self.breaker)
+        
+        async def fetch():
+            return await asyncio.gather(*(provider.aget_info('AAA') for _ in range(8)))
+        infos = async_to_sync(fetch)()
+        
+        self.assertEqual(replay.calls, 1)
+        self.assertEqual(infos, [infos[0]] * 8)
+    
+    def test_followers_stop_waiting_after_the_timeout(self):
+        replay = ReplayProvider(latency=0.5)
+        provider = SharedProvider(replay, breaker=self.breaker, timeout=0.1)
+        
+        with ThreadPoolExecutor(1) as pool:
+            leader = pool.submit(provider.get_info, 'AAA')
+            time.sleep(0.05)
+            started = time.monotonic()
+            with self.assertRaises(UpstreamUnavailable):
+                provider.get_info('AAA')
+            self.assertLess(time.monotonic() - started, 0.4)
+            leader.result()
+        self.assertEqual(replay.calls, 1)
+    
+    def test_waits_for_the_lease_holder_in_another_worker(self):
+        replay = ReplayProvider()
+        provider = SharedProvider(replay, breaker=self.breaker, poll=0.01)
+        key = provider.key('get_info', 'AAA', (), {})
+        cache.add(f'{key}:lease', 'other-worker', 30)
+        
+        def other_worker_done():
+            time.sleep(0.1)
+            cache.set(key, ('other-worker', {'symbol': 'AAA'}))
+            cache.delete(f'{key}:lease')
+        threading.Thread(target=other_worker_done).start()
+        
+        self.assertEqual(provider.get_info('AAA'), {'symbol': 'AAA'})
+        self.assertEqual(replay.calls, 0)
+    
+    def test_open_breaker_serves_stale_results(self):
+        replay = ReplayProvider(synthetic_rows=100)
+        provider = SharedProvider(replay, breaker=self.breaker)
+        info = provider.get_info('AAA')
+        
+        replay.error_rate = 1.0
+        # 3 failures in 4 calls trip it
+        for _ in range(3):
+            with self.assertRaises(ConnectionError):
+                provider.get_info('AAA')
+        self.assertTrue(self.breaker.is_open())
+        
+        self.assertEqual(provider.get_info('AAA'), info)
+        with self.assertRaises(UpstreamUnavailable):
+            provider.get_info('BBB')
+        self.assertEqual(replay.calls, 4)
+        
+        # After the cooldown one probe goes upstream and closes the breaker
+        self.clock.now += 31
+        replay.error_rate = 0.0
+        provider.get_info('BBB')
+        self.assertFalse(self.breaker.is_open())
+        self.assertEqual(replay.calls, 5)
+    
+    @override_settings(MARKET_DATA_PROVIDER='stock_app.tests.FakeProvider')
+    def test_open_breaker_serves_stored_daily_bars(self):
+        stock = Stock.objects.create(symbol='SHUT', company_name='Shut Corp')
+        start = timezone.localdate() - timedelta(days=35)
+        StockPrice.objects.bulk_create([
+            StockPrice(stock=stock, date=start + timedelta(days=i), open_price=10, high_price=10, low_price=10,
+                       close_price=10, adjusted_close=10, volume=100)
+            for i in range(35)
+        ])
+        CircuitBreaker(cache).trip()
+        
+        response = APIClient().get(f'/api/stocks/{stock.pk}/historical_data/?period=1mo')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 31)
+    
+    def test_results_stay_out_of_the_lease_cache(self):
+        replay = ReplayProvider(synthetic_rows=100)
+        leases = caches['market_data']
+        provider = SharedProvider(replay, cache=leases, breaker=self.breaker)
+        key = provider.key('get_info', 'AAA', (), {})
+        
+        info = provider.get_info('AAA')
+        
+        self.assertIsNone(leases.get(key))
+        self.assertIsNone(leases.get(f'{key}:lease'))
+        self.assertEqual(cache.get(key)[1], info)
+    
+    @override_settings(MARKET_DATA_PROVIDER='stock_app.tests.FakeProvider')
+    def test_historical_data_is_unavailable_without_stale_data(self):
+        stock = Stock.objects.create(symbol='SHUT', company_name='Shut Corp')
+        CircuitBreaker(cache).trip()
+        
+        response = APIClient().get(f'/api/stocks/{stock.pk}/historical_data/')
+        
+        self.assertEqual(response.status_code, 503)
+
+@override_settings(MARKET_DATA_PROVIDER='stock_app.tests.FakeProvider')
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        FakeProvider.calls = []
+        self.client = APIClient()
+        self.stock = Stock.objects.create(symbol='AAA', company_name='AAA Inc')
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_price_history(self.stock, synthetic_history(50))
+    
+    def test_unchanged_stock_is_not_modified_until_prices_are_ingested(self):
+        url = f'/api/stocks/{self.stock.pk}/'
+        first = self.client.get(url)
+        self.assertIn('Last-Modified', first)
+        
+        # Just the version lookup
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], first['ETag'])
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_price_history(self.stock, synthetic_history(1, start='2030-01-01'))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], first['ETag'])
+    
+    def test_stock_writes_change_the_list_etag(self):
+        etag = self.client.get('/api/stocks/')['ETag']
+        self.assertEqual(self.client.get('/api/stocks/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        
+        upsert_stocks({'BBB': {'symbol': 'BBB'}})
+        self.assertEqual(self.client.get('/api/stocks/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        etag = self.client.get('/api/stocks/')['ETag']
+        Stock.objects.filter(symbol='BBB').first().save()
+        self.assertEqual(self.client.get('/api/stocks/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+    
+    def test_historical_data_is_versioned_once_synced(self):
+        url = f'/api/stocks/{self.stock.pk}/historical_data/?period=1mo'
+        # The first request still depends on the provider
+        self.assertNotIn('ETag', self.client.get(url))
+        etag = self.client.get(url)['ETag']
+        
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertNotEqual(self.client.get(url + '&format=columnar')['ETag'], etag)
+        self.assertEqual(len(FakeProvider.calls), 1)
+    
+    @override_settings(RESPONSE_CACHE='default')
+    def test_response_cache_replays_the_rendered_response(self):
+        url = '/api/stock-prices/?symbol=AAA&page_size=10'
+        first = self.client.get(url)
+        
+        # The symbol and the version; no prices are read or serialized
+        with self.assertNumQueries(2):
+            replayed = self.client.get(url)
+        self.assertEqual(replayed.content, first.content)
+        self.assertEqual(replayed['ETag'], first['ETag'])
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_price_history(self.stock, synthetic_history(1, start='2030-01-01'))
+        self.assertEqual(self.client.get(url).json()['results'][0]['date'], '2030-01-01')
+
+class AnalysisSearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.author = User.objects.create(username='author')
+        self.reader = User.objects.create(username='reader')
+        self.stock = Stock.objects.create(symbol='AAA', company_name='AAA Inc')
+        self.analyses = {
+            name: StockAnalysis.objects.create(stock=self.stock, user=user, title=title, content=content,
+                                               is_public=public)
+            for name, user, title, content, public in [
+                ('title', self.author, 'Dividend growth ahead', 'Margins are stable.', True),
+                ('content', self.author, 'Quarterly notes', 'A small dividend increase is likely.', True),
+                ('private', self.author, 'Dividend doubts', 'Not for sharing.', False),
+                ('other', self.reader, 'Chart patterns', 'Breakout above resistance.', True),
+            ]
+        }
+    
+    def search(self, term, user=None):
+        if user is not None:
+            self.client.force_authenticate(user)
+        response = self.client.get('/api/analyses/', {'search': term})
+        return [self.analyses_by_id[row['id']] for row in response.data['results']]
+    
+    @property
+    def analyses_by_id(self):
+        return {analysis.pk: name for name, analysis in self.analyses.items()}
+    
+    def test_ranks_matches_and_applies_visibility(self):
+        self.assertEqual(search_backend(), 'fts5')
+        # Title matches first; word prefixes and stems match too
+        self.assertEqual(self.search('dividends'), ['title', 'content'])
+        self.assertEqual(self.search('divid'), ['title', 'content'])
+        # Own private analyses are found too
+        results = self.search('dividend', self.author)
+        self.assertEqual((sorted(results[:2]), results[2:]), (['private', 'title'], ['content']))
+        self.assertEqual(self.search('dividend sharing', self.reader), [])
+        # Query syntax in the input is taken as plain words
+        self.assertEqual(self.search('"resistance* -('), ['other'])
+    
+    def test_index_follows_saves_and_deletes(self):
+        analysis = self.analyses['other']
+        analysis.title = 'Dividend chart'
+        analysis.save()
+        self.assertEqual(self.search('chart'), ['other'])
+        self.assertEqual(self.search('dividend')[0], 'other')
+        
+        analysis.is_public = False
+        analysis.save()
+        self.assertEqual(self.search('chart'), [])
+        self.analyses['title'].delete()
+        self.assertEqual(self.search('dividend'), ['content'])
+    
+    def test_backfill_indexes_rows_written_around_the_signals(self):
+        StockAnalysis.objects.bulk_create([
+            StockAnalysis(stock=self.stock, title='Backfilled', content='Loaded in bulk.', is_public=True),
+        ])
+        StockAnalysis.objects.filter(pk=self.analyses['content'].pk).update(title='Renamed')
+        self.assertEqual(self.client.get('/api/analyses/', {'search': 'backfilled'}).data['results'], [])
+        
+        call_command('rebuild_search_index', stdout=StringIO())
+        
+        results = self.client.get('/api/analyses/', {'search': 'backfilled'}).data['results']
+        self.assertEqual([row['title'] for row in results], ['Backfilled'])
+        self.assertEqual(self.search('renamed'), ['content'])
\ No newline at end of file
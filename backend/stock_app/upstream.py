@@ -0,0 +1,283 @@
+# backend/stock_app/upstream.py
+import asyncio
+from concurrent.futures import Future
+import hashlib
+import threading
+import time
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+
+from .metrics import PROVIDER_METHODS, ASYNC_PROVIDER_METHODS, PROVIDER_SHARED
+
+KEY_PREFIX = 'market_data'
+
+class UpstreamUnavailable(ConnectionError):
+    """
+    The provider wasn't called because the circuit breaker is open, or a
+    shared fetch failed, and there is no earlier result to serve instead.
+    """
+
+class CircuitBreaker:
+    """
+    Error-rate circuit breaker over the provider calls of every worker
+    sharing `cache`. Once at least `min_calls` calls in a `window`-second
+    window have failed at `error_rate` or more, it opens for `cooldown`
+    seconds. After that one caller at a time may probe upstream: a success
+    closes it again, a failure reopens it.
+    """
+    def __init__(self, cache, window=60, min_calls=20, error_rate=0.5, cooldown=30, clock=time.time):
+        self.cache = cache
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.cooldown = cooldown
+        self.clock = clock
+    
+    def _key(self, name):
+        return f'{KEY_PREFIX}:breaker:{name}'
+    
+    def _count(self, name):
+        # Fixed windows; counters of past ones expire on their own
+        key = self._key(f'{name}:{int(self.clock() // self.window)}')
+        self.cache.add(key, 0, self.window * 2)
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            # Expired between add() and incr()
+            self.cache.set(key, 1, self.window * 2)
+            return 1
+    
+    def is_open(self):
+        return self.cache.get(self._key('open_until')) is not None
+    
+    def allow(self):
+        """
+        Whether a call may go upstream now.
+        """
+        open_until = self.cache.get(self._key('open_until'))
+        if open_until is None:
+            return True
+        if self.clock() < open_until:
+            return False
+        return self.cache.add(self._key('probe'), True, self.cooldown)
+    
+    def succeeded(self):
+        self._count('calls')
+        if self.is_open():
+            self.reset()
+    
+    def failed(self):
+        calls = self._count('calls')
+        failures = self._count('failures')
+        if self.is_open() or (calls >= self.min_calls and failures >= calls * self.error_rate):
+            self.trip()
+    
+    def trip(self):
+        # Kept well past the cooldown so the breaker stays half-open until a probe succeeds
+        self.cache.set(self._key('open_until'), self.clock() + self.cooldown, self.cooldown * 10 + self.window)
+        self.cache.delete(self._key('probe'))
+    
+    def reset(self):
+        window = int(self.clock() // self.window)
+        self.cache.delete_many([self._key('open_until'), self._key('probe'),
+                                self._key(f'calls:{window}'), self._key(f'failures:{window}')])
+
+# In-flight calls of this process: key -> Future of the leading caller
+_flights = {}
+_async_flights = {}
+_flights_lock = threading.Lock()
+
+class SharedProvider:
+    """
+    Wraps a market data provider so that concurrent calls with the same
+    arguments share one upstream fetch, and a circuit breaker stops calls
+    while upstream is failing.
+    
+    Callers in one process wait on the leading call directly, for at most
+    settings.MARKET_DATA_TIMEOUT seconds. Across processes a lease in
+    settings.MARKET_DATA_LEASE_CACHE decides which worker fetches; the others
+    wait for it to finish and read its result from
+    settings.MARKET_DATA_RESULT_CACHE, or fetch themselves when that cache is
+    not shared with the holder. Only lease and breaker tokens go to the lease
+    cache. Results are kept for settings.MARKET_DATA_STALE_SECONDS and served
+    while the breaker is open or when a shared fetch failed.
+    """
+    def __init__(self, provider, cache=None, results=None, breaker=None, lease_seconds=None, stale_seconds=None,
+                 timeout=None, poll=0.05):
+        self.provider = provider
+        self.cache = cache or caches[getattr(settings, 'MARKET_DATA_LEASE_CACHE', 'market_data')]
+        self.results = results or caches[getattr(settings, 'MARKET_DATA_RESULT_CACHE', 'default')]
+        self.breaker = breaker or CircuitBreaker(
+            self.cache,
+            window=getattr(settings, 'MARKET_DATA_BREAKER_WINDOW', 60),
+            min_calls=getattr(settings, 'MARKET_DATA_BREAKER_MIN_CALLS', 20),
+            error_rate=getattr(settings, 'MARKET_DATA_BREAKER_ERROR_RATE', 0.5),
+            cooldown=getattr(settings, 'MARKET_DATA_BREAKER_COOLDOWN', 30),
+        )
+        self.lease_seconds = lease_seconds or getattr(settings, 'MARKET_DATA_LEASE_SECONDS', 30)
+        self.stale_seconds = stale_seconds or getattr(settings, 'MARKET_DATA_STALE_SECONDS', 86400)
+        self.timeout = timeout or getattr(settings, 'MARKET_DATA_TIMEOUT', 20)
+        self.poll = poll
+    
+    def __getattr__(self, name):
+        if name in PROVIDER_METHODS:
+            return lambda symbol, *args, **kwargs: self.call(name, symbol, *args, **kwargs)
+        if name in ASYNC_PROVIDER_METHODS:
+            return lambda symbol, *args, **kwargs: self.acall(name[1:], symbol, *args, **kwargs)
+        return getattr(self.provider, name)
+    
+    def key(self, method, symbol, args, kwargs):
+        shape = hashlib.sha1(repr((args, sorted(kwargs.items()))).encode()).hexdigest()[:16]
+        return f'{KEY_PREFIX}:{type(self.provider).__name__}:{method}:{symbol}:{shape}'
+    
+    def call(self, method, symbol, *args, **kwargs):
+        key = self.key(method, symbol, args, kwargs)
+        with _flights_lock:
+            flight = _flights.get(key)
+            leading = flight is None
+            if leading:
+                flight = _flights[key] = Future()
+        if not leading:
+            PROVIDER_SHARED.inc(1, method, 'flight')
+            try:
+                return flight.result(timeout=self.timeout)
+            except TimeoutError:
+                return self._stale(method, symbol, key)
+        
+        try:
+            value = self._fetch(method, symbol, key, args, kwargs)
+        except BaseException as e:
+            flight.set_exception(e)
+            raise
+        else:
+            flight.set_result(value)
+            return value
+        finally:
+            with _flights_lock:
+                del _flights[key]
+    
+    async def acall(self, method, symbol, *args, **kwargs):
+        key = self.key(method, symbol, args, kwargs)
+        flight = _async_flights.get(key)
+        if flight is not None and flight.get_loop() is asyncio.get_running_loop():
+            PROVIDER_SHARED.inc(1, method, 'flight')
+            try:
+                return await asyncio.wait_for(asyncio.shield(flight), self.timeout)
+            except TimeoutError:
+                return await sync_to_async(self._stale)(method, symbol, key)
+        flight = _async_flights[key] = asyncio.get_running_loop().create_future()
+        
+        try:
+            value = await self._afetch(method, symbol, key, args, kwargs)
+        except asyncio.CancelledError:
+            flight.cancel()
+            raise
+        except BaseException as e:
+            flight.set_exception(e)
+            # Nobody may be waiting on it
+            flight.exception()
+            raise
+        else:
+            flight.set_result(value)
+            return value
+        finally:
+            if _async_flights.get(key) is flight:
+                del _async_flights[key]
+    
+    def _start(self, method, symbol, key):
+        """
+        ('stale', value) while the breaker is open, ('lead', lease token) if
+        this caller is to fetch, else ('wait', lease token of the fetching one).
+        """
+        if not self.breaker.allow():
+            return 'stale', self._stale(method, symbol, key)
+        token = uuid.uuid4().hex
+        while True:
+            if self.cache.add(f'{key}:lease', token, self.lease_seconds):
+                return 'lead', token
+            holder = self.cache.get(f'{key}:lease')
+            # Otherwise released in the meantime; try again
+            if holder is not None:
+                return 'wait', holder
+    
+    def _finish(self, key, token, value=None, failed=False):
+        if failed:
+            self.breaker.failed()
+        else:
+            self.breaker.succeeded()
+            self.results.set(key, (token, value), self.stale_seconds)
+        # An expired lease may have gone to another worker since
+        if self.cache.get(f'{key}:lease') == token:
+            self.cache.delete(f'{key}:lease')
+    
+    def _poll(self, method, symbol, key, holder):
+        """
+        'done' once the lease holder's result is in the result cache, 'wait'
+        while it is still fetching, else 'released': it failed, or stored its
+        result where this process can't see it.
+        """
+        entry = self.results.get(key)
+        if entry is not None and entry[0] == holder:
+            PROVIDER_SHARED.inc(1, method, 'lease')
+            return 'done', entry[1]
+        if self.cache.get(f'{key}:lease') == holder:
+            return 'wait', None
+        return 'released', None
+    
+    def _stale(self, method, symbol, key):
+        entry = self.results.get(key)
+        if entry is None:
+            raise UpstreamUnavailable(f"Market data for {symbol} is unavailable upstream and not cached")
+        PROVIDER_SHARED.inc(1, method, 'stale')
+        return entry[1]
+    
+    def _fetch(self, method, symbol, key, args, kwargs):
+        deadline = time.monotonic() + self.lease_seconds
+        while time.monotonic() < deadline:
+            state, value = self._start(method, symbol, key)
+            if state == 'stale':
+                return value
+            if state == 'lead':
+                try:
+                    result = getattr(self.provider, method)(symbol, *args, **kwargs)
+                except Exception:
+                    self._finish(key, value, failed=True)
+                    raise
+                self._finish(key, value, result)
+                return result
+            
+            state = 'wait'
+            while state == 'wait' and time.monotonic() < deadline:
+                time.sleep(self.poll)
+                state, result = self._poll(method, symbol, key, value)
+            if state == 'done':
+                return result
+        return self._stale(method, symbol, key)
+    
+    async def _afetch(self, method, symbol, key, args, kwargs):
+        # _fetch() awaiting the provider; cache calls go through
+        # sync_to_async() as the lease cache may be database-backed
+        deadline = time.monotonic() + self.lease_seconds
+        while time.monotonic() < deadline:
+            state, value = await sync_to_async(self._start)(method, symbol, key)
+            if state == 'stale':
+                return value
+            if state == 'lead':
+                try:
+                    result = await getattr(self.provider, f'a{method}')(symbol, *args, **kwargs)
+                except Exception:
+                    await sync_to_async(self._finish)(key, value, failed=True)
+                    raise
+                await sync_to_async(self._finish)(key, value, result)
+                return result
+            
+            state = 'wait'
+            while state == 'wait' and time.monotonic() < deadline:
+                await asyncio.sleep(self.poll)
+                state, result = await sync_to_async(self._poll)(method, symbol, key, value)
+            if state == 'done':
+                return result
+        return await sync_to_async(self._stale)(method, symbol, key)
\ No newline at end of file
@@ -11,6 +11,14 @@ router.register(r'watchlists', views.WatchListViewSet, basename='watchlist')
 router.register(r'analyses', views.StockAnalysisViewSet, basename='analysis')
 router.register(r'alerts', views.AlertViewSet, basename='alert')
 
+# Async versions of the StockViewSet actions that wait on the market data
+# provider, mounted ahead of the router by backend.async_urls
+async_urlpatterns = [
+    path('stocks/<int:pk>/historical_data/', views.historical_data_async, name='stock-historical-data-async'),
+    path('stocks/fetch_data/', views.fetch_data_async, name='stock-fetch-data-async'),
+]
+
 urlpatterns = [
+    path('metrics/', views.metrics, name='metrics'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
@@ -2,10 +2,15 @@
 from rest_framework import viewsets, permissions, status, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.views import APIView
 from django_filters.rest_framework import DjangoFilterBackend
 from django.utils import timezone
-import yfinance as yf
-import pandas as pd
+from django.conf import settings
+from django.db.models import Prefetch, Q
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from asgiref.sync import sync_to_async
+import numpy as np
 from datetime import datetime, timedelta
 
 from .models import (
@@ -13,71 +18,247 @@ from .models import (
     WatchList, StockAnalysis, Alert
 )
 from .serializers import (
-    StockSerializer, StockDetailSerializer, StockPriceSerializer,
+    StockSerializer, StockListSerializer, StockDetailSerializer, StockPriceSerializer,
     UserPortfolioSerializer, PortfolioStockSerializer, WatchListSerializer,
     StockAnalysisSerializer, AlertSerializer
 )
+from . import history_cache
+from .alerts import evaluate_alerts
+from .conditional import (
+    STOCKS, ConditionalGetMixin, conditional_response, stock_resource, store_response
+)
+from .archive import archive_history
+from .export import CONTENT_TYPES as EXPORT_CONTENT_TYPES, available_formats, export_chunks
+from .fetching import fetch_many, history_window
+from .formatting import history_columns, columns_to_rows
+from .indicators import indicator_frame, parse_spec
+from .ingestion import ingest_price_history, ingest_price_histories, stock_defaults, upsert_stocks
+from .metrics import render_metrics
+from .pagination import StockPriceCursorPagination
+from .performance import portfolio_performance, portfolio_total_value, portfolio_value_history
+from .price_matrix import get_price_matrix
+from .providers import get_provider
+from .renderers import ColumnarJSONRenderer
+from .resampling import downsample, interval_rule, resample_ohlcv
+from .search import AnalysisSearchFilter
+from .upstream import UpstreamUnavailable
+
+HISTORY_PERIODS = ['1d', '5d', '1mo', '3mo', '6mo', '1y', '2y', '5y', '10y', 'ytd', 'max']
+HISTORY_INTERVALS = ['1m', '2m', '5m', '15m', '30m', '60m', '90m', '1h', '1d', '5d', '1wk', '1mo', '3mo']
 
-class StockViewSet(viewsets.ModelViewSet):
-    queryset = Stock.objects.all()
+class StockViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
+    queryset = Stock.objects.select_related('stats')
     serializer_class = StockSerializer
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['sector', 'industry']
+    # Screens such as ?stats__return_1m__gte=10 run on the precomputed StockStats
+    filterset_fields = {
+        'sector': ['exact'],
+        'industry': ['exact'],
+        'stats__return_1d': ['gte', 'lte'],
+        'stats__return_1m': ['gte', 'lte'],
+        'stats__average_volume': ['gte', 'lte'],
+        'stats__high_52w': ['gte', 'lte'],
+        'stats__low_52w': ['gte', 'lte'],
+    }
     search_fields = ['symbol', 'company_name']
-    ordering_fields = ['symbol', 'company_name', 'market_cap', 'current_price']
+    ordering_fields = ['symbol', 'company_name', 'market_cap', 'current_price',
+                       'stats__return_1d', 'stats__return_1m', 'stats__average_volume']
+    # ETags bumped by ingestion, so polling clients get 304s between price updates
+    conditional_actions = ['list', 'retrieve', 'historical_data']
+    
+    def conditional_resource(self):
+        if self.action == 'list':
+            return STOCKS
+        if self.action == 'historical_data':
+            period = self.request.query_params.get('period', '1mo')
+            interval = self.request.query_params.get('interval', '1d')
+            # Otherwise the response depends on what the provider returns
+            if period not in HISTORY_PERIODS or not history_cache.is_synced(self.kwargs['pk'], period, interval):
+                return None
+        return stock_resource(self.kwargs['pk'])
     
     def get_serializer_class(self):
         if self.action == 'retrieve':
             return StockDetailSerializer
+        if self.action == 'list':
+            return StockListSerializer
         return StockSerializer
     
-    @action(detail=True, methods=['get'])
+    @action(detail=True, methods=['get'],
+            renderer_classes=api_settings.DEFAULT_RENDERER_CLASSES + [ColumnarJSONRenderer])
     def historical_data(self, request, pk=None):
         stock = self.get_object()
         period = request.query_params.get('period', '1mo')  # Default to 1 month
         interval = request.query_params.get('interval', '1d')  # Default to daily
         
         # Validate period and interval
-        valid_periods = ['1d', '5d', '1mo', '3mo', '6mo', '1y', '2y', '5y', '10y', 'ytd', 'max']
-        valid_intervals = ['1m', '2m', '5m', '15m', '30m', '60m', '90m', '1h', '1d', '5d', '1wk', '1mo', '3mo']
-        
-        if period not in valid_periods:
-            return Response({"error": f"Invalid period. Must be one of {valid_periods}"}, 
+        if period not in HISTORY_PERIODS:
+            return Response({"error": f"Invalid period. Must be one of {HISTORY_PERIODS}"}, 
                             status=status.HTTP_400_BAD_REQUEST)
             
-        if interval not in valid_intervals:
-            return Response({"error": f"Invalid interval. Must be one of {valid_intervals}"}, 
+        if interval not in HISTORY_INTERVALS:
+            return Response({"error": f"Invalid interval. Must be one of {HISTORY_INTERVALS}"}, 
                             status=status.HTTP_400_BAD_REQUEST)
         
-        # Fetch data from Yahoo Finance
+        # Fetch data through the read-through history cache
         try:
-            ticker = yf.Ticker(stock.symbol)
-            hist = ticker.history(period=period, interval=interval)
+            hist = history_cache.get_history(stock, period, interval)
             
             if hist.empty:
                 return Response({"error": "No data available for this stock and period"}, 
                                 status=status.HTTP_404_NOT_FOUND)
                 
-            # Process and format the data
-            hist.reset_index(inplace=True)
-            data = []
-            
-            for _, row in hist.iterrows():
-                date_str = row['Date'].strftime('%Y-%m-%d')
-                data.append({
-                    'date': date_str,
-                    'open': float(row['Open']),
-                    'high': float(row['High']),
-                    'low': float(row['Low']),
-                    'close': float(row['Close']),
-                    'volume': int(row['Volume'])
-                })
+            # Convert whole columns at once; rows are only built for the default format
+            columns = history_columns(hist)
+            if request.accepted_renderer.format == ColumnarJSONRenderer.format:
+                return Response(columns)
                 
-            return Response(data)
+            return Response(columns_to_rows(columns))
             
+        except UpstreamUnavailable as e:
+            return Response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
+    @action(detail=True, methods=['get'],
+            renderer_classes=api_settings.DEFAULT_RENDERER_CLASSES + [ColumnarJSONRenderer])
+    def resample(self, request, pk=None):
+        # Stored daily bars rolled into larger bars (?interval=1wk, 1mo, 3mo
+        # or Nd) and/or thinned to ?max_points with LTTB for charts
+        stock = self.get_object()
+        period = request.query_params.get('period', 'max')
+        interval = request.query_params.get('interval')
+        max_points = request.query_params.get('max_points')
+        
+        if period not in HISTORY_PERIODS:
+            return Response({"error": f"Invalid period. Must be one of {HISTORY_PERIODS}"}, 
+                            status=status.HTTP_400_BAD_REQUEST)
+        
+        if interval is not None and interval_rule(interval) is None:
+            return Response({"error": "Invalid interval. Must be 1wk, 1mo, 3mo or a number of days such as 5d"}, 
+                            status=status.HTTP_400_BAD_REQUEST)
+        
+        if max_points is not None:
+            try:
+                max_points = int(max_points)
+                if max_points < 3:
+                    raise ValueError
+            except ValueError:
+                return Response({"error": "max_points must be an integer of at least 3"}, 
+                                status=status.HTTP_400_BAD_REQUEST)
+        
+        hist = archive_history(stock.pk, history_cache.period_start(period, timezone.localdate()))
+        if hist.empty:
+            return Response({"error": "No stored prices for this stock and period"}, 
+                            status=status.HTTP_404_NOT_FOUND)
+        
+        if interval is not None:
+            hist = resample_ohlcv(hist, interval)
+        if max_points is not None:
+            hist = downsample(hist, max_points)
+        
+        columns = history_columns(hist)
+        if request.accepted_renderer.format == ColumnarJSONRenderer.format:
+            return Response(columns)
+        
+        return Response(columns_to_rows(columns))
+    
+    @action(detail=True, methods=['get'],
+            renderer_classes=api_settings.DEFAULT_RENDERER_CLASSES + [ColumnarJSONRenderer])
+    def indicators(self, request, pk=None):
+        # ?indicators=sma:50,rsi,macd:12:26:9 over the stored closes;
+        # ?limit=N returns only the latest N bars (at most INDICATORS_MAX_LIMIT)
+        stock = self.get_object()
+        try:
+            specs = list(dict.fromkeys(
+                parse_spec(text) for text in request.query_params.get('indicators', 'sma').split(',') if text.strip()
+            ))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        limit = request.query_params.get('limit')
+        if limit is not None:
+            try:
+                limit = int(limit)
+                if limit < 1:
+                    raise ValueError
+            except ValueError:
+                return Response({"error": "limit must be a positive integer"}, 
+                                status=status.HTTP_400_BAD_REQUEST)
+            limit = min(limit, getattr(settings, 'INDICATORS_MAX_LIMIT', 2520))
+        
+        if not specs:
+            return Response({"error": "At least one indicator is required"}, 
+                            status=status.HTTP_400_BAD_REQUEST)
+        
+        frame = indicator_frame(stock.pk, specs)
+        if frame.empty:
+            return Response({"error": "No stored prices for this stock"}, 
+                            status=status.HTTP_404_NOT_FOUND)
+        if limit is not None:
+            frame = frame.iloc[-limit:]
+        
+        # Warm-up values are NaN, which JSON can't carry
+        columns = {'date': np.datetime_as_string(frame.index.values, unit='D').tolist()}
+        for name, values in frame.items():
+            values = values.to_numpy()
+            columns[name] = np.where(np.isnan(values), None, values).tolist()
+        if request.accepted_renderer.format == ColumnarJSONRenderer.format:
+            return Response(columns)
+        
+        return Response(columns_to_rows(columns))
+    
+    @action(detail=False, methods=['get'],
+            renderer_classes=api_settings.DEFAULT_RENDERER_CLASSES + [ColumnarJSONRenderer])
+    def matrix(self, request):
+        # Closes (or ?field=volume) of ?symbols=A,B,... side by side from the
+        # memory-mapped price matrix, between ?start and ?end inclusive
+        field = request.query_params.get('field', 'close')
+        symbols = [s.strip().upper() for s in request.query_params.get('symbols', '').split(',') if s.strip()]
+        if field not in ('close', 'volume'):
+            return Response({"error": "Invalid field. Must be close or volume"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if not symbols:
+            return Response({"error": "symbols is required"}, status=status.HTTP_400_BAD_REQUEST)
+        max_symbols = getattr(settings, 'PRICE_MATRIX_MAX_SYMBOLS', 500)
+        if len(symbols) > max_symbols:
+            return Response({"error": f"At most {max_symbols} symbols per request"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            start = request.query_params.get('start')
+            end = request.query_params.get('end')
+            start = datetime.strptime(start, '%Y-%m-%d').date() if start else None
+            end = datetime.strptime(end, '%Y-%m-%d').date() if end else None
+        except ValueError:
+            return Response({"error": "start and end must be dates as YYYY-MM-DD"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            matrix = get_price_matrix()
+        except FileNotFoundError:
+            return Response({"error": "The price matrix has not been built"},
+                            status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        try:
+            dates, symbols, values = (matrix.closes if field == 'close' else matrix.volumes)(symbols, start, end)
+        except KeyError as e:
+            return Response({"error": e.args[0]}, status=status.HTTP_404_NOT_FOUND)
+        
+        # Missing closes are NaN, which JSON can't carry
+        columns = {'date': np.datetime_as_string(dates, unit='D').tolist()}
+        for symbol, values in zip(symbols, values.T):
+            if field == 'close':
+                values = np.where(np.isnan(values), None, values)
+            columns[symbol] = values.tolist()
+        if request.accepted_renderer.format == ColumnarJSONRenderer.format:
+            return Response(columns)
+        
+        return Response(columns_to_rows(columns))
+    
+    @action(detail=False, methods=['get'])
+    def cache_stats(self, request):
+        # Hit/miss counters of the historical_data cache
+        return Response(history_cache.get_stats())
+    
     @action(detail=False, methods=['post'])
     def fetch_data(self, request):
         # This endpoint allows adding new stocks and updating prices
@@ -87,9 +268,9 @@ class StockViewSet(viewsets.ModelViewSet):
             return Response({"error": "Symbol is required"}, status=status.HTTP_400_BAD_REQUEST)
             
         try:
-            # Get stock info from Yahoo Finance
-            ticker = yf.Ticker(symbol)
-            info = ticker.info
+            # Get stock info from the market data provider
+            provider = get_provider()
+            info = provider.get_info(symbol)
             
             if not info or 'symbol' not in info:
                 return Response({"error": f"Stock with symbol {symbol} not found"}, 
@@ -98,49 +279,96 @@ class StockViewSet(viewsets.ModelViewSet):
             # Create or update the stock
             stock, created = Stock.objects.update_or_create(
                 symbol=symbol,
-                defaults={
-                    'company_name': info.get('longName', info.get('shortName', symbol)),
-                    'sector': info.get('sector', ''),
-                    'industry': info.get('industry', ''),
-                    'market_cap': info.get('marketCap', 0),
-                    'current_price': info.get('currentPrice', info.get('regularMarketPrice', 0))
-                }
+                defaults=stock_defaults(symbol, info)
             )
             
             # Get historical data for the past 30 days
-            end_date = datetime.now()
-            start_date = end_date - timedelta(days=30)
-            
-            hist = ticker.history(start=start_date.strftime('%Y-%m-%d'), 
-                                  end=end_date.strftime('%Y-%m-%d'))
+            hist = provider.get_history(symbol, **history_window())
             
-            # Save historical prices
-            for date, row in hist.iterrows():
-                StockPrice.objects.update_or_create(
-                    stock=stock,
-                    date=date.date(),
-                    defaults={
-                        'open_price': round(row['Open'], 2),
-                        'high_price': round(row['High'], 2),
-                        'low_price': round(row['Low'], 2),
-                        'close_price': round(row['Close'], 2),
-                        'adjusted_close': round(row['Close'], 2),
-                        'volume': int(row['Volume'])
-                    }
-                )
+            # Save historical prices in one bulk upsert
+            ingest_price_history(stock, hist)
+            stock.refresh_from_db()
             
-            serializer = StockDetailSerializer(stock)
+            serializer = StockDetailSerializer(stock, context=self.get_serializer_context())
             return Response(serializer.data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
             
+        except UpstreamUnavailable as e:
+            return Response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    @action(detail=False, methods=['post'])
+    def fetch_batch(self, request):
+        # Batch variant of fetch_data: fetches many symbols concurrently
+        # and reports success or failure per symbol
+        symbols = request.data.get('symbols')
+        max_symbols = getattr(settings, 'FETCH_BATCH_MAX_SYMBOLS', 200)
+        
+        if isinstance(symbols, str):
+            symbols = symbols.split(',')
+        if not isinstance(symbols, list) or not symbols:
+            return Response({"error": "symbols must be a non-empty list"}, 
+                            status=status.HTTP_400_BAD_REQUEST)
+        
+        symbols = [str(symbol).strip() for symbol in symbols if str(symbol).strip()]
+        if len(symbols) > max_symbols:
+            return Response({"error": f"At most {max_symbols} symbols can be fetched at once"}, 
+                            status=status.HTTP_400_BAD_REQUEST)
+        
+        fetched = fetch_many(symbols)
+        succeeded = [result for result in fetched if result.error is None]
+        report = {result.symbol: {"status": "error", "error": result.error} 
+                  for result in fetched if result.error is not None}
+        
+        try:
+            existing = set(Stock.objects.filter(symbol__in=[r.symbol for r in succeeded])
+                           .values_list('symbol', flat=True))
+            stocks = upsert_stocks({result.symbol: result.info for result in succeeded})
+            written = ingest_price_histories(
+                (stocks[result.symbol], result.history) for result in succeeded
+            )
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        
+        for result in succeeded:
+            stock = stocks[result.symbol]
+            report[result.symbol] = {
+                "status": "ok",
+                "id": stock.pk,
+                "created": result.symbol not in existing,
+                "prices": written.get(stock.pk, 0),
+            }
+        
+        return Response({
+            "succeeded": len(succeeded),
+            "failed": len(fetched) - len(succeeded),
+            "results": {result.symbol: report[result.symbol] for result in fetched},
+        })
 
-class StockPriceViewSet(viewsets.ReadOnlyModelViewSet):
+class StockPriceViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     queryset = StockPrice.objects.all()
     serializer_class = StockPriceSerializer
-    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    pagination_class = StockPriceCursorPagination
+    filter_backends = [DjangoFilterBackend]
     filterset_fields = ['stock', 'date']
-    ordering_fields = ['date', 'close_price', 'volume']
+    conditional_actions = ['list', 'retrieve']
+    
+    def conditional_resource(self):
+        # Versioned per stock when filtered to one, else by any stock's changes
+        stock_id = self.request.query_params.get('stock')
+        if self.request.query_params.get('symbol'):
+            stock_id = self.symbol_stock_id()
+        if self.action == 'list' and stock_id is not None and str(stock_id).isdigit():
+            return stock_resource(stock_id)
+        return STOCKS
+    
+    def symbol_stock_id(self):
+        # Resolve ?symbol first so prices are filtered on the indexed
+        # stock_id instead of through a join; once per request
+        if not hasattr(self, '_symbol_stock_id'):
+            self._symbol_stock_id = (Stock.objects.filter(symbol=self.request.query_params['symbol'])
+                                     .values_list('pk', flat=True).first())
+        return self._symbol_stock_id
     
     def get_queryset(self):
         queryset = StockPrice.objects.all()
@@ -148,7 +376,10 @@ class StockPriceViewSet(viewsets.ReadOnlyModelViewSet):
         days = self.request.query_params.get('days', None)
         
         if stock_symbol:
-            queryset = queryset.filter(stock__symbol=stock_symbol)
+            stock_id = self.symbol_stock_id()
+            if stock_id is None:
+                return queryset.none()
+            queryset = queryset.filter(stock_id=stock_id)
             
         if days:
             try:
@@ -159,6 +390,33 @@ class StockPriceViewSet(viewsets.ReadOnlyModelViewSet):
                 pass
                 
         return queryset
+    
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        # Streams whole price histories as CSV, NDJSON or Arrow without
+        # building the result in memory. ?output picks the encoding, since
+        # DRF reserves ?format for renderers.
+        output = request.query_params.get('output', 'csv')
+        if output == 'arrow' and output not in available_formats():
+            return Response({"error": "Arrow output requires pyarrow, which is not installed"}, 
+                            status=status.HTTP_406_NOT_ACCEPTABLE)
+        if output not in available_formats():
+            return Response({"error": f"Invalid output. Must be one of {available_formats()}"}, 
+                            status=status.HTTP_400_BAD_REQUEST)
+        
+        symbols = request.query_params.get('symbols')
+        symbols = [symbol.strip() for symbol in symbols.split(',') if symbol.strip()] if symbols else None
+        try:
+            start, end = [datetime.strptime(request.query_params[name], '%Y-%m-%d').date()
+                          if request.query_params.get(name) else None for name in ['start', 'end']]
+        except ValueError:
+            return Response({"error": "start and end must be dates in YYYY-MM-DD format"}, 
+                            status=status.HTTP_400_BAD_REQUEST)
+        
+        response = StreamingHttpResponse(export_chunks(output, symbols, start, end),
+                                         content_type=EXPORT_CONTENT_TYPES[output])
+        response['Content-Disposition'] = f'attachment; filename="prices.{output}"'
+        return response
 
 class UserPortfolioViewSet(viewsets.ModelViewSet):
     serializer_class = UserPortfolioSerializer
@@ -166,7 +424,12 @@ class UserPortfolioViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         user = self.request.user
-        return UserPortfolio.objects.filter(user=user)
+        # Holdings and their stocks are prefetched in one query for the nested
+        # serializers; total_value is summed by the database. The aggregate
+        # annotation drops Meta.ordering, so the order is restated for paging
+        return UserPortfolio.objects.filter(user=user).select_related('user').prefetch_related(
+            Prefetch('stocks', queryset=PortfolioStock.objects.select_related('stock'))
+        ).annotate(total_value=portfolio_total_value()).order_by('-created_at', '-pk')
     
     @action(detail=True, methods=['post'])
     def add_stock(self, request, pk=None):
@@ -235,47 +498,42 @@ class UserPortfolioViewSet(viewsets.ModelViewSet):
     def performance(self, request, pk=None):
         portfolio = self.get_object()
         
-        # Calculate portfolio performance metrics
-        portfolio_stocks = portfolio.stocks.all()
-        if not portfolio_stocks:
+        # Per-holding and total values in one joined, aggregated query
+        performance = portfolio_performance(portfolio)
+        if performance is None:
             return Response({"error": "Portfolio is empty"}, status=status.HTTP_400_BAD_REQUEST)
         
-        total_investment = 0
-        current_value = 0
-        stocks_data = []
+        return Response(performance)
+    
+    @action(detail=True, methods=['get'],
+            renderer_classes=api_settings.DEFAULT_RENDERER_CLASSES + [ColumnarJSONRenderer])
+    def performance_history(self, request, pk=None):
+        portfolio = self.get_object()
         
-        for ps in portfolio_stocks:
-            investment = float(ps.shares) * float(ps.purchase_price)
-            current_stock_value = float(ps.shares) * float(ps.stock.current_price or 0)
-            gain_loss = current_stock_value - investment
-            gain_loss_percent = (gain_loss / investment) * 100 if investment > 0 else 0
-            
-            total_investment += investment
-            current_value += current_stock_value
-            
-            stocks_data.append({
-                'symbol': ps.stock.symbol,
-                'company_name': ps.stock.company_name,
-                'shares': float(ps.shares),
-                'purchase_price': float(ps.purchase_price),
-                'current_price': float(ps.stock.current_price or 0),
-                'investment': investment,
-                'current_value': current_stock_value,
-                'gain_loss': gain_loss,
-                'gain_loss_percent': gain_loss_percent
-            })
-        
-        total_gain_loss = current_value - total_investment
-        total_gain_loss_percent = (total_gain_loss / total_investment) * 100 if total_investment > 0 else 0
+        # Date range, defaulting to the past year
+        try:
+            end = request.query_params.get('end')
+            end = datetime.strptime(end, '%Y-%m-%d').date() if end else timezone.localdate()
+            start = request.query_params.get('start')
+            start = datetime.strptime(start, '%Y-%m-%d').date() if start else end - timedelta(days=365)
+        except ValueError:
+            return Response({"error": "start and end must be dates in YYYY-MM-DD format"}, 
+                            status=status.HTTP_400_BAD_REQUEST)
         
-        return Response({
-            'portfolio_name': portfolio.name,
-            'total_investment': total_investment,
-            'current_value': current_value,
-            'total_gain_loss': total_gain_loss,
-            'total_gain_loss_percent': total_gain_loss_percent,
-            'stocks': stocks_data
-        })
+        if start > end:
+            return Response({"error": "start must not be after end"}, 
+                            status=status.HTTP_400_BAD_REQUEST)
+        
+        history = portfolio_value_history(portfolio, start, end)
+        columns = {
+            'date': np.datetime_as_string(history.index.values, unit='D').tolist(),
+            'value': history['value'].astype(float).tolist(),
+            'investment': history['investment'].astype(float).tolist(),
+        }
+        if request.accepted_renderer.format == ColumnarJSONRenderer.format:
+            return Response(columns)
+        
+        return Response(columns_to_rows(columns))
 
 # backend/stock_app/views.py (continuation)
 class WatchListViewSet(viewsets.ModelViewSet):
@@ -284,7 +542,7 @@ class WatchListViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         user = self.request.user
-        return WatchList.objects.filter(user=user)
+        return WatchList.objects.filter(user=user).prefetch_related('stocks')
     
     @action(detail=True, methods=['post'])
     def add_stock(self, request, pk=None):
@@ -324,7 +582,8 @@ class WatchListViewSet(viewsets.ModelViewSet):
 
 class StockAnalysisViewSet(viewsets.ModelViewSet):
     serializer_class = StockAnalysisSerializer
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
+    # ?search= runs on the full-text index, ranked by relevance
+    filter_backends = [DjangoFilterBackend, AnalysisSearchFilter]
     filterset_fields = ['stock', 'is_public']
     search_fields = ['title', 'content']
     
@@ -338,7 +597,7 @@ class StockAnalysisViewSet(viewsets.ModelViewSet):
         if user.is_authenticated:
             # Return public analyses and user's own analyses
             return StockAnalysis.objects.filter(
-                (models.Q(is_public=True) | models.Q(user=user))
+                (Q(is_public=True) | Q(user=user))
             )
         else:
             # Anonymous users can only see public analyses
@@ -374,54 +633,131 @@ class AlertViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['post'])
     def check_alerts(self, request):
-        # This would typically be called by a background task/scheduler
-        # but we provide an endpoint for testing purposes
+        # The refresh_market_data worker evaluates alerts after every cycle;
+        # this endpoint re-checks all of them on demand
         if not request.user.is_staff:
             return Response({"error": "Only staff users can trigger alert checks manually"}, 
                             status=status.HTTP_403_FORBIDDEN)
         
-        active_alerts = Alert.objects.filter(is_active=True, triggered=False)
-        triggered_count = 0
+        result = evaluate_alerts()
         
-        for alert in active_alerts:
-            stock = alert.stock
-            current_price = stock.current_price
-            
-            if not current_price:
-                continue
-                
-            current_price = float(current_price)
-            alert_value = float(alert.value)
-            
-            triggered = False
-            
-            if alert.alert_type == 'price_above' and current_price > alert_value:
-                triggered = True
-            elif alert.alert_type == 'price_below' and current_price < alert_value:
-                triggered = True
-            elif alert.alert_type == 'percent_change':
-                # We would need historical prices to check percent change properly
-                # This is simplified for demonstration
-                yesterday_price = StockPrice.objects.filter(
-                    stock=stock, 
-                    date__lt=timezone.now().date()
-                ).order_by('-date').first()
-                
-                if yesterday_price:
-                    percent_change = ((current_price - float(yesterday_price.close_price)) / 
-                                    float(yesterday_price.close_price)) * 100
-                                    
-                    if abs(percent_change) > alert_value:
-                        triggered = True
-            elif alert.alert_type == 'volume_spike':
-                # Similar to percent change, would need historical data to check properly
-                pass
-                
-            if triggered:
-                alert.triggered = True
-                alert.triggered_at = timezone.now()
-                alert.save()
-                triggered_count += 1
-                
-        return Response({"message": f"Checked {active_alerts.count()} alerts. Triggered {triggered_count}."},
-                        status=status.HTTP_200_OK)
\ No newline at end of file
+        return Response({"message": f"Checked {result.checked} alerts. Triggered {len(result.triggered)}."},
+                        status=status.HTTP_200_OK)
+
+def metrics(request):
+    """
+    Request, database and provider metrics in the Prometheus text format,
+    summed over the worker processes sharing settings.METRICS_DIR. Only
+    staff users and scrapers sending settings.METRICS_TOKEN as a bearer
+    token may read them.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if not (token and request.headers.get('Authorization') == f'Bearer {token}') and not request.user.is_staff:
+        return HttpResponse(status=status.HTTP_401_UNAUTHORIZED)
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+# Async versions of historical_data and fetch_data, routed in place of the
+# StockViewSet actions when served by ASGI (see backend/asgi.py). They await
+# the market data provider, so a worker keeps serving other requests while
+# upstream calls are in flight; database work goes through sync_to_async().
+
+def _api_request(request):
+    """
+    Authenticate a Django request and check the default permissions the way
+    a DRF view does. Returns (DRF Request, None), or (None, rendered error
+    response) if the request is refused.
+    """
+    view = APIView()
+    view.args, view.kwargs, view.headers = (), {}, {}
+    view.request = drf_request = view.initialize_request(request)
+    try:
+        view.initial(drf_request)
+        # Parse the body here rather than on the event loop
+        drf_request.data
+    except Exception as exc:
+        response = view.finalize_response(drf_request, view.handle_exception(exc))
+        return None, response.render()
+    return drf_request, None
+
+def _method_not_allowed(request):
+    return JsonResponse({"detail": f'Method "{request.method}" not allowed.'},
+                        status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
+async def historical_data_async(request, pk):
+    if request.method != 'GET':
+        return _method_not_allowed(request)
+    period = request.GET.get('period', '1mo')
+    interval = request.GET.get('interval', '1d')
+    if period not in HISTORY_PERIODS:
+        return JsonResponse({"error": f"Invalid period. Must be one of {HISTORY_PERIODS}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+    if interval not in HISTORY_INTERVALS:
+        return JsonResponse({"error": f"Invalid interval. Must be one of {HISTORY_INTERVALS}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+    
+    # As in StockViewSet, validators only once the period is synced; tagged
+    # apart from the DRF-rendered responses, whose bytes differ
+    conditional = None
+    if await sync_to_async(history_cache.is_synced)(pk, period, interval):
+        format = ColumnarJSONRenderer.format if request.GET.get('format') == ColumnarJSONRenderer.format else 'json'
+        conditional, response = await sync_to_async(conditional_response)(
+            request, stock_resource(pk), f'async-{format}'
+        )
+        if response is not None:
+            return response
+    
+    stock = await Stock.objects.filter(pk=pk).afirst()
+    if stock is None:
+        return JsonResponse({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
+    try:
+        hist = await history_cache.aget_history(stock, period, interval)
+    except UpstreamUnavailable as e:
+        return JsonResponse({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    if hist.empty:
+        return JsonResponse({"error": "No data available for this stock and period"},
+                            status=status.HTTP_404_NOT_FOUND)
+    
+    columns = history_columns(hist)
+    if request.GET.get('format') == ColumnarJSONRenderer.format:
+        response = JsonResponse(columns)
+    else:
+        response = JsonResponse(columns_to_rows(columns), safe=False)
+    if conditional is not None:
+        await sync_to_async(store_response)(response, *conditional)
+    return response
+
+def _store_fetched(stock, hist, request):
+    ingest_price_history(stock, hist)
+    stock.refresh_from_db()
+    return StockDetailSerializer(stock, context={'request': request}).data
+
+async def fetch_data_async(request):
+    if request.method != 'POST':
+        return _method_not_allowed(request)
+    drf_request, refused = await sync_to_async(_api_request)(request)
+    if refused is not None:
+        return refused
+    symbol = drf_request.data.get('symbol')
+    if not symbol:
+        return JsonResponse({"error": "Symbol is required"}, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        provider = get_provider()
+        info = await provider.aget_info(symbol)
+        if not info or 'symbol' not in info:
+            return JsonResponse({"error": f"Stock with symbol {symbol} not found"},
+                                status=status.HTTP_404_NOT_FOUND)
+        
+        stock, created = await Stock.objects.aupdate_or_create(symbol=symbol, defaults=stock_defaults(symbol, info))
+        hist = await provider.aget_history(symbol, **history_window())
+        data = await sync_to_async(_store_fetched)(stock, hist, drf_request)
+    except UpstreamUnavailable as e:
+        return JsonResponse({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return JsonResponse(data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+# As for DRF views, SessionAuthentication enforces CSRF for session users
+fetch_data_async.csrf_exempt = True
\ No newline at end of file